@@ -3,6 +3,9 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Needed for the live event streams (/eventos/...), e.g.:
+    EVENTOS_ASGI=True gunicorn config.asgi:application -k uvicorn.workers.UvicornWorker
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -12,5 +15,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Decide, entre otros, el valor por defecto de BD_CONN_MAX_AGE
+os.environ.setdefault('MODO_SERVIDOR', 'asgi')
 
 application = get_asgi_application()
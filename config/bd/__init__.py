@@ -0,0 +1,7 @@
+# config/bd/__init__.py
+"""
+Backends de BD = los de Django + medición de conexiones (+ pool en proceso).
+
+settings reemplaza el ENGINE de cada base por el equivalente de aquí
+(MOTORES_MEDIDOS). Ver config/bd/base.py.
+"""
@@ -0,0 +1,183 @@
+# config/bd/base.py
+"""
+Manejo de conexiones común a los backends de config/bd/.
+
+- Cada conexión que pide Django (get_new_connection) se mide: tiempo de
+  espera hasta tenerla (incluye esperar un cupo del pool) en la métrica
+  nuam_bd_conexion_espera_segundos y en `estadisticas` (para
+  `manage.py benchmark_conexiones`).
+- Pool en proceso: si la base tiene POOL_PROCESO = {"maximo": n,
+  "espera": segundos} (settings lo pone con BD_POOL=True en MySQL/SQLite),
+  "cerrar" la conexión al final de la petición la devuelve al pool en vez
+  de cerrarla. PostgreSQL usa en cambio el pool de psycopg 3
+  (OPTIONS["pool"]), que Django ya maneja.
+
+El pool es por proceso y por alias; después de un fork se descarta (no se
+comparten sockets entre procesos).
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from config import metricas
+
+
+class Estadisticas:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self.lock:
+            self.obtenidas = 0   # conexiones entregadas a Django
+            self.nuevas = 0      # conexiones físicas abiertas (sin contar las del pool de psycopg)
+            self.segundos = 0.0  # tiempo total esperando una conexión
+
+    def sumar(self, segundos, nueva):
+        with self.lock:
+            self.obtenidas += 1
+            self.nuevas += int(nueva)
+            self.segundos += segundos
+
+    def foto(self):
+        with self.lock:
+            return {"obtenidas": self.obtenidas, "nuevas": self.nuevas, "segundos": self.segundos}
+
+
+estadisticas = Estadisticas()
+
+
+def _usable(conexion):
+    try:
+        cursor = conexion.cursor()
+        try:
+            cursor.execute("SELECT 1")
+        finally:
+            cursor.close()
+        return True
+    except Exception:
+        return False
+
+
+class PoolConexiones:
+    """Hasta `maximo` conexiones en uso a la vez; las libres se reusan."""
+
+    def __init__(self, maximo, espera):
+        self.maximo = maximo
+        self.espera = espera
+        self.pid = os.getpid()
+        self.libres = deque()
+        self.cupos = threading.BoundedSemaphore(maximo)
+        self.lock = threading.Lock()
+        self.cerrado = False
+
+    def tomar(self, crear, validar):
+        """Devuelve (conexión, nueva). Lanza TimeoutError si no hay cupo a tiempo."""
+        if not self.cupos.acquire(timeout=self.espera):
+            raise TimeoutError(f"Sin conexiones libres en el pool tras {self.espera} s (máximo {self.maximo}).")
+        try:
+            while True:
+                with self.lock:
+                    conexion = self.libres.pop() if self.libres else None
+                if conexion is None:
+                    return crear(), True
+                if not validar or _usable(conexion):
+                    return conexion, False
+                self._cerrar(conexion)
+        except BaseException:
+            self.cupos.release()
+            raise
+
+    def devolver(self, conexion, reusable):
+        try:
+            with self.lock:
+                if reusable and not self.cerrado:
+                    self.libres.append(conexion)
+                    return
+            self._cerrar(conexion)
+        finally:
+            self.cupos.release()
+
+    def cerrar(self):
+        """Cierra las libres; las que están en uso se cierran al devolverlas."""
+        with self.lock:
+            self.cerrado = True
+            libres, self.libres = list(self.libres), deque()
+        for conexion in libres:
+            self._cerrar(conexion)
+
+    @staticmethod
+    def _cerrar(conexion):
+        try:
+            conexion.close()
+        except Exception:
+            pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool_de(alias, config):
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None or pool.pid != os.getpid():
+            # Tras un fork las conexiones del padre no se tocan: pool nuevo
+            pool = _pools[alias] = PoolConexiones(config.get("maximo", 10), config.get("espera", 10))
+        return pool
+
+
+def cerrar_pools():
+    """Descarta los pools en proceso; la próxima conexión crea uno nuevo."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        if pool.pid == os.getpid():
+            pool.cerrar()
+
+
+class ConexionMedidaMixin:
+    """Mezclar ANTES del DatabaseWrapper de Django."""
+
+    _pool_origen = None
+
+    def get_new_connection(self, conn_params):
+        inicio = time.perf_counter()
+        config = self.settings_dict.get("POOL_PROCESO")
+        pool = self._pool_origen = pool_de(self.alias, config) if config else None
+        if pool is None:
+            conexion, nueva = super().get_new_connection(conn_params), True
+        else:
+            crear = super().get_new_connection
+            try:
+                conexion, nueva = pool.tomar(lambda: crear(conn_params), self.settings_dict["CONN_HEALTH_CHECKS"])
+            except TimeoutError as e:
+                # wrap_database_errors lo convierte en django.db.OperationalError
+                raise self.Database.OperationalError(str(e)) from e
+        segundos = time.perf_counter() - inicio
+
+        if getattr(self, "pool", None) is not None:
+            origen = "pool"  # pool de psycopg: no se sabe si abrió una conexión
+        else:
+            origen = "nueva" if nueva else "pool"
+        estadisticas.sumar(segundos, origen == "nueva")
+        metricas.observar("nuam_bd_conexion_espera_segundos", segundos, bd=self.alias)
+        metricas.incrementar("nuam_bd_conexiones_obtenidas_total", bd=self.alias, origen=origen)
+        return conexion
+
+    def _close(self):
+        # Al pool del que salió, aunque entretanto se haya reemplazado
+        pool, self._pool_origen = self._pool_origen, None
+        if pool is None or self.connection is None:
+            return super()._close()
+        # Una transacción abierta o un error no se le pasan al próximo que la tome
+        reusable = not self.in_atomic_block and not self.errors_occurred
+        if reusable and not self.get_autocommit():
+            try:
+                self.connection.rollback()
+            except Exception:
+                reusable = False
+        with self.wrap_database_errors:
+            pool.devolver(self.connection, reusable)
@@ -0,0 +1,7 @@
+from django.db.backends.postgresql import base
+
+from config.bd.base import ConexionMedidaMixin
+
+
+class DatabaseWrapper(ConexionMedidaMixin, base.DatabaseWrapper):
+    pass
@@ -1,23 +1,22 @@
 # config/context_processors.py
+from cuentas.roles import rol_nombre
+from tributaria.notificaciones import contar_no_leidas
+
+
 def rol_usuario(request):
     """
     Entrega el nombre de rol del usuario logeado como 'rol_nombre'
     para usarlo directamente en los templates.
-    Ajusta los accesos según tu modelo real.
+    Sale de la caché de sesión (cuentas/roles.py), sin consultas extra.
     """
-    rol_nombre = None
+    return {"rol_nombre": rol_nombre(request)}
 
-    if request.user.is_authenticated:
-        # Intenta varias formas de encontrar el rol,
-        # adapta esto a cómo lo tienes en tu proyecto.
-        try:
-            # Ejemplo: User -> perfil -> rol -> nombre
-            rol_nombre = request.user.perfil.rol.nombre
-        except AttributeError:
-            try:
-                # Ejemplo alternativo: User -> rol -> nombre
-                rol_nombre = request.user.rol.nombre
-            except AttributeError:
-                rol_nombre = None
 
-    return {"rol_nombre": rol_nombre}
+def notificaciones_no_leidas(request):
+    """
+    Cantidad de notificaciones no leídas para el badge del menú.
+    Sale de caché (tributaria/notificaciones.py), no hace COUNT por página.
+    """
+    if not request.user.is_authenticated:
+        return {"notificaciones_no_leidas": 0}
+    return {"notificaciones_no_leidas": contar_no_leidas(request.user)}
@@ -0,0 +1,391 @@
+# config/metricas.py
+"""
+Métricas de la aplicación en formato Prometheus (/metrics).
+
+Cada proceso (worker de gunicorn, comando de exportaciones, ...) acumula
+contadores e histogramas en memoria y cada METRICAS_VOLCADO_SEGUNDOS los
+escribe en METRICAS_DIR, un archivo por proceso. /metrics suma todos los
+archivos, así el resultado no depende de qué worker atiende el scrape
+(el de otros procesos puede venir atrasado hasta un intervalo de volcado).
+
+Para que la carpeta no crezca con cada cron o comando, un proceso que
+termina pasa sus totales a metricas-acumulado.json y borra su archivo; los
+de procesos que murieron sin hacerlo (mismo host, pid inexistente) se
+incorporan en el siguiente scrape. Todo esto bajo un flock de la carpeta;
+sin fcntl (Windows) no se compacta y queda un archivo por proceso.
+
+Uso:
+    from config import metricas
+    metricas.incrementar("nuam_archivos_procesados_total", resultado="procesado")
+    metricas.observar("nuam_pdf_extraccion_segundos", 0.8)
+
+Al desplegar conviene vaciar METRICAS_DIR: los contadores vuelven a cero
+como en cualquier reinicio y Prometheus lo interpreta bien. Por defecto es
+una carpeta bajo el directorio temporal del sistema, fuera del código.
+"""
+import atexit
+import hmac
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+FILAS = (10, 100, 1000, 5000, 10000, 50000, 100000, 500000, 1000000)
+BYTES = (10_000, 100_000, 1_000_000, 10_000_000, 50_000_000, 100_000_000)
+
+# nombre -> (tipo, ayuda, buckets)
+METRICAS = {
+    "nuam_http_peticiones_total": ("counter", "Peticiones HTTP por vista, método y código de estado.", None),
+    "nuam_http_duracion_segundos": ("histogram", "Latencia de las peticiones HTTP por vista.", SEGUNDOS),
+    "nuam_archivos_procesados_total": ("counter", "Archivos de carga masiva procesados, por resultado.", None),
+    "nuam_ingesta_duracion_segundos": ("histogram", "Duración del procesamiento de un archivo de carga masiva.", SEGUNDOS),
+    "nuam_filas_ingestadas_total": ("counter", "Filas de carga masiva convertidas en calificaciones.", None),
+    "nuam_filas_rechazadas_total": ("counter", "Filas de carga masiva rechazadas por validación.", None),
+    "nuam_pdf_extraccion_segundos": ("histogram", "Duración de la extracción de datos de un PDF.", SEGUNDOS),
+    "nuam_exportaciones_total": ("counter", "Exportaciones de calificaciones, por modo y resultado.", None),
+    "nuam_exportacion_filas": ("histogram", "Filas por exportación de calificaciones.", FILAS),
+    "nuam_exportacion_bytes": ("histogram", "Tamaño del archivo por exportación de calificaciones.", BYTES),
+    "nuam_cache_consultas_total": ("counter", "Lecturas de caché por uso y resultado (acierto/fallo).", None),
+    "nuam_bd_conexion_espera_segundos": ("histogram", "Espera hasta obtener una conexión a la BD (abrirla o tomarla del pool).", SEGUNDOS),
+    "nuam_bd_conexiones_obtenidas_total": ("counter", "Conexiones a la BD obtenidas, por base y origen (nueva/pool).", None),
+}
+
+
+def escribir_json(ruta, datos):
+    """
+    Escribe `datos` en `ruta` vía un temporal + os.replace, para que quien
+    lee nunca vea un archivo a medias. El temporal lleva pid e hilo: dos
+    volcados simultáneos no escriben el mismo archivo. Quien llama sostiene
+    su lock de volcado (el orden de las fotos se respeta). Si falla, lo
+    registra, borra el temporal y devuelve False.
+    """
+    temporal = f"{ruta}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(datos, f)
+        os.replace(temporal, ruta)
+        return True
+    except (OSError, TypeError, ValueError):
+        logger.exception("No se pudo volcar %s", ruta)
+        try:
+            os.remove(temporal)
+        except OSError:
+            pass
+        return False
+
+
+ARCHIVO_ACUMULADO = "metricas-acumulado.json"
+_HOST = socket.gethostname().replace("-", "_")
+
+
+def _clave(nombre, etiquetas):
+    return json.dumps([nombre, sorted(etiquetas.items())])
+
+
+class Registro:
+    def __init__(self):
+        self.contadores = {}    # clave -> valor
+        self.histogramas = {}   # clave -> [cuentas por bucket..., +Inf, suma]
+        self.lock = threading.Lock()
+        self.lock_volcado = threading.Lock()
+        self.ultimo_volcado = time.monotonic()
+        self.archivo = None
+
+    def incrementar(self, nombre, valor=1, **etiquetas):
+        clave = _clave(nombre, etiquetas)
+        with self.lock:
+            self.contadores[clave] = self.contadores.get(clave, 0) + valor
+        self.volcar_si_corresponde()
+
+    def observar(self, nombre, valor, **etiquetas):
+        buckets = METRICAS[nombre][2]
+        clave = _clave(nombre, etiquetas)
+        with self.lock:
+            h = self.histogramas.get(clave)
+            if h is None:
+                h = self.histogramas[clave] = [0] * (len(buckets) + 2)
+            h[bisect_left(buckets, valor)] += 1  # el índice len(buckets) es +Inf
+            h[-1] += valor
+        self.volcar_si_corresponde()
+
+    def estado(self):
+        with self.lock:
+            return {"contadores": dict(self.contadores), "histogramas": {k: list(v) for k, v in self.histogramas.items()}}
+
+    def descartar(self):
+        """Olvida lo acumulado sin volcarlo (p.ej. al terminar las pruebas)."""
+        with self.lock:
+            self.contadores, self.histogramas = {}, {}
+
+    def volcar_si_corresponde(self):
+        if time.monotonic() - self.ultimo_volcado >= getattr(settings, "METRICAS_VOLCADO_SEGUNDOS", 10):
+            self.volcar()
+
+    def volcar(self):
+        directorio = getattr(settings, "METRICAS_DIR", None)
+        if not directorio:
+            return
+        with self.lock_volcado:
+            self.ultimo_volcado = time.monotonic()
+            contenido = self.estado()
+            if not contenido["contadores"] and not contenido["histogramas"]:
+                return
+            if self.archivo is None:
+                self.archivo = os.path.join(directorio, f"metricas-{_HOST}-{os.getpid()}-{int(time.time())}.json")
+            escribir_json(self.archivo, contenido)
+
+    def cerrar(self):
+        """Al terminar el proceso: sus totales pasan al acumulado y su archivo se borra."""
+        directorio = getattr(settings, "METRICAS_DIR", None)
+        if not directorio or fcntl is None:
+            self.volcar()
+            return
+        with self.lock_volcado:
+            with self.lock:
+                contenido = {"contadores": self.contadores, "histogramas": self.histogramas}
+                self.contadores, self.histogramas = {}, {}
+            if not contenido["contadores"] and not contenido["histogramas"] and self.archivo is None:
+                return
+            if self.archivo is None:
+                self.archivo = os.path.join(directorio, f"metricas-{_HOST}-{os.getpid()}-{int(time.time())}.json")
+            # Lo que se registre después (otro atexit) va a un archivo nuevo
+            # con solo eso: lo previo ya quedó en el acumulado
+            if escribir_json(self.archivo, contenido):
+                compactar(directorio, propios=[os.path.basename(self.archivo)])
+
+
+registro = Registro()
+atexit.register(registro.cerrar)
+
+incrementar = registro.incrementar
+observar = registro.observar
+
+
+def contar_cache(uso, acierto):
+    registro.incrementar("nuam_cache_consultas_total", uso=uso, resultado="acierto" if acierto else "fallo")
+
+
+# ===================================================
+# Exposición
+# ===================================================
+
+@contextmanager
+def _lock_directorio(directorio, compartido=False):
+    """flock de METRICAS_DIR: compactar (exclusivo) no corre a mitad de una lectura (compartido)."""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(directorio, exist_ok=True)
+    with open(os.path.join(directorio, ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_SH if compartido else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _leer_json(ruta):
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _sumar(contadores, histogramas, datos):
+    for clave, valor in datos.get("contadores", {}).items():
+        contadores[clave] = contadores.get(clave, 0) + valor
+    for clave, valores in datos.get("histogramas", {}).items():
+        previo = histogramas.get(clave)
+        histogramas[clave] = list(valores) if previo is None else [a + b for a, b in zip(previo, valores)]
+
+
+def _archivos_de_procesos(directorio):
+    return [
+        n for n in os.listdir(directorio)
+        if n.startswith("metricas-") and n.endswith(".json") and n != ARCHIVO_ACUMULADO
+    ]
+
+
+def _terminado(nombre):
+    """¿El proceso dueño del archivo (metricas-<host>-<pid>-<ts>.json) ya no existe en este host?"""
+    partes = nombre[len("metricas-"):-len(".json")].rsplit("-", 2)
+    if len(partes) == 2:
+        partes.insert(0, _HOST)  # formato anterior, sin host
+    host, pid = partes[0], partes[1]
+    if host != _HOST or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        return False
+    return False
+
+
+def compactar(directorio, propios=()):
+    """
+    Pasa al acumulado los archivos de procesos terminados (y los `propios`)
+    y los borra. Los nombres incorporados quedan anotados en el acumulado
+    hasta borrarse: una caída entre ambos pasos no los cuenta dos veces.
+    Devuelve cuántos incorporó.
+    """
+    if fcntl is None or not directorio or not os.path.isdir(directorio):
+        return 0
+    ruta_acumulado = os.path.join(directorio, ARCHIVO_ACUMULADO)
+    with _lock_directorio(directorio):
+        acumulado = _leer_json(ruta_acumulado) or {"contadores": {}, "histogramas": {}}
+        ya_incorporados = set(acumulado.get("incorporados", []))
+        nuevos = []
+        for nombre in _archivos_de_procesos(directorio):
+            if nombre in ya_incorporados or not (nombre in propios or _terminado(nombre)):
+                continue
+            datos = _leer_json(os.path.join(directorio, nombre))
+            if datos is not None:
+                _sumar(acumulado["contadores"], acumulado["histogramas"], datos)
+            nuevos.append(nombre)
+
+        por_borrar = sorted(ya_incorporados | set(nuevos))
+        if not por_borrar:
+            return 0
+        acumulado["incorporados"] = por_borrar
+        if nuevos and not escribir_json(ruta_acumulado, acumulado):
+            return 0
+        for nombre in por_borrar:
+            try:
+                os.remove(os.path.join(directorio, nombre))
+            except FileNotFoundError:
+                pass
+        acumulado["incorporados"] = []
+        escribir_json(ruta_acumulado, acumulado)
+    return len(nuevos)
+
+
+def leer_todos(directorio):
+    """Suma el acumulado y los archivos de los procesos vivos."""
+    contadores, histogramas = {}, {}
+    if not directorio or not os.path.isdir(directorio):
+        return contadores, histogramas
+    with _lock_directorio(directorio, compartido=True):
+        acumulado = _leer_json(os.path.join(directorio, ARCHIVO_ACUMULADO)) or {}
+        _sumar(contadores, histogramas, acumulado)
+        incorporados = set(acumulado.get("incorporados", []))
+        for nombre in _archivos_de_procesos(directorio):
+            if nombre in incorporados:
+                continue
+            datos = _leer_json(os.path.join(directorio, nombre))
+            if datos is not None:
+                _sumar(contadores, histogramas, datos)
+    return contadores, histogramas
+
+
+def _etiquetas(pares, extra=None):
+    pares = list(pares) + ([extra] if extra else [])
+    if not pares:
+        return ""
+    texto = ",".join(
+        '%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pares
+    )
+    return "{%s}" % texto
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def texto_prometheus(contadores, histogramas, medidores=()):
+    """Formato de exposición de texto 0.0.4. `medidores`: [(nombre, ayuda, valor)]."""
+    series = {}
+    for clave, valor in contadores.items():
+        nombre, pares = json.loads(clave)
+        series.setdefault(nombre, []).append((pares, valor))
+    for clave, valores in histogramas.items():
+        nombre, pares = json.loads(clave)
+        series.setdefault(nombre, []).append((pares, valores))
+
+    lineas = []
+    for nombre, (tipo, ayuda, buckets) in METRICAS.items():
+        if nombre not in series:
+            continue
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+        for pares, valor in sorted(series[nombre], key=lambda s: s[0]):
+            if tipo == "counter":
+                lineas.append(f"{nombre}{_etiquetas(pares)} {_numero(valor)}")
+                continue
+            acumulado = 0
+            for limite, cuenta in zip(list(buckets) + ["+Inf"], valor[:-1]):
+                acumulado += cuenta
+                le = limite if limite == "+Inf" else _numero(float(limite))
+                lineas.append(f"{nombre}_bucket{_etiquetas(pares, ('le', le))} {acumulado}")
+            lineas.append(f"{nombre}_sum{_etiquetas(pares)} {_numero(float(valor[-1]))}")
+            lineas.append(f"{nombre}_count{_etiquetas(pares)} {acumulado}")
+
+    for nombre, ayuda, valor in medidores:
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} gauge")
+        lineas.append(f"{nombre} {valor}")
+    return "\n".join(lineas) + "\n"
+
+
+def _medidores():
+    """Estado actual leído de la BD al momento del scrape (colas)."""
+    from tributaria.models import ArchivoTributario, ExportacionCalificaciones
+
+    return [
+        (
+            "nuam_exportaciones_en_cola",
+            "Exportaciones pendientes o en proceso.",
+            ExportacionCalificaciones.objects.filter(estado__in=["PENDIENTE", "PROCESANDO"]).count(),
+        ),
+        (
+            "nuam_archivos_pendientes",
+            "Archivos de carga masiva aún en estado PENDIENTE.",
+            ArchivoTributario.objects.filter(estado="PENDIENTE").count(),
+        ),
+    ]
+
+
+def _autorizado(request):
+    token = getattr(settings, "METRICAS_TOKEN", "")
+    if token:
+        cabecera = request.headers.get("Authorization", "")
+        return hmac.compare_digest(cabecera, f"Bearer {token}")
+    # Sin token configurado solo la ve el staff logeado
+    return request.user.is_authenticated and request.user.is_staff
+
+
+def vista_metricas(request):
+    if not _autorizado(request):
+        return HttpResponseForbidden("No autorizado.")
+    directorio = getattr(settings, "METRICAS_DIR", None)
+    if directorio:
+        registro.volcar()
+        compactar(directorio)
+        contadores, histogramas = leer_todos(directorio)
+    else:
+        # Sin carpeta compartida: solo lo de este proceso
+        estado = registro.estado()
+        contadores, histogramas = estado["contadores"], estado["histogramas"]
+    return HttpResponse(
+        texto_prometheus(contadores, histogramas, _medidores()),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -0,0 +1,260 @@
+# config/middleware.py
+"""
+Instrumentación por petición: consultas SQL, tiempo en BD, consultas
+repetidas (patrón N+1) y tiempo total.
+
+- Cada petición lenta (INSTRUMENTACION_LENTA_MS) o con demasiadas consultas
+  (INSTRUMENTACION_MAX_CONSULTAS) se registra en el logger "nuam.peticiones".
+- Con DEBUG=True se agrega la cabecera Server-Timing (visible en DevTools).
+- Los totales se acumulan por nombre de URL en memoria y cada
+  INSTRUMENTACION_VOLCADO_SEGUNDOS se escriben en INSTRUMENTACION_DIR, un
+  archivo por proceso (sin locks entre workers). `manage.py metricas_peticiones`
+  los junta.
+- `metricas_peticiones --reiniciar` no puede borrar la memoria de los
+  workers: escribe una época nueva en INSTRUMENTACION_DIR/epoca.json. Cada
+  worker la revisa al volcar y, si cambió, descarta lo acumulado (se pierde
+  a lo más un intervalo de volcado posterior al reinicio); los archivos de
+  una época anterior no se suman.
+
+Desactivada por defecto (INSTRUMENTACION_ACTIVA): se enciende al investigar
+un problema de rendimiento.
+
+Nota: en respuestas streaming solo se mide hasta que la vista devuelve el
+iterador, no el envío completo.
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import metricas
+
+
+logger = logging.getLogger("nuam.peticiones")
+
+_RE_IN = re.compile(r"\bIN \((?:%s, )*%s\)", re.IGNORECASE)
+
+
+def patron_sql(sql):
+    """Los parámetros ya vienen aparte (%s); solo se colapsan los IN (...) de largo variable."""
+    return _RE_IN.sub("IN (...)", sql)
+
+
+class RegistroConsultas:
+    """execute_wrapper de Django: anota cada consulta de la petición."""
+
+    def __init__(self):
+        self.cantidad = 0
+        self.segundos = 0.0
+        self.patrones = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.segundos += time.perf_counter() - inicio
+            self.cantidad += 1
+            self.patrones[patron_sql(sql)] += 1
+
+    def repetidas(self):
+        """Consultas de más: las que repiten un patrón ya ejecutado en la petición."""
+        return sum(n - 1 for n in self.patrones.values() if n > 1)
+
+    def peores(self, cuantos=3):
+        return [(p, n) for p, n in self.patrones.most_common(cuantos) if n > 1]
+
+
+# ===================================================
+# Acumulado por nombre de URL (por proceso)
+# ===================================================
+
+class Acumulado:
+    CAMPOS = ("peticiones", "total_ms", "max_ms", "bd_ms", "consultas", "max_consultas", "repetidas", "lentas")
+
+    def __init__(self):
+        self.datos = {}
+        self.lock = threading.Lock()
+        self.lock_volcado = threading.Lock()
+        self.ultimo_volcado = time.monotonic()
+        self.archivo = None
+        self.epoca = None
+
+    def agregar(self, nombre, total_ms, bd_ms, consultas, repetidas, lenta):
+        with self.lock:
+            d = self.datos.setdefault(nombre, dict.fromkeys(self.CAMPOS, 0))
+            d["peticiones"] += 1
+            d["total_ms"] += total_ms
+            d["max_ms"] = max(d["max_ms"], total_ms)
+            d["bd_ms"] += bd_ms
+            d["consultas"] += consultas
+            d["max_consultas"] = max(d["max_consultas"], consultas)
+            d["repetidas"] += repetidas
+            d["lentas"] += int(lenta)
+
+    def volcar_si_corresponde(self):
+        cada = getattr(settings, "INSTRUMENTACION_VOLCADO_SEGUNDOS", 30)
+        if time.monotonic() - self.ultimo_volcado >= cada:
+            self.volcar()
+
+    def volcar(self):
+        directorio = getattr(settings, "INSTRUMENTACION_DIR", None)
+        if not directorio:
+            return
+        # La foto se toma dentro del lock de volcado: un volcado más viejo
+        # no puede terminar después de uno más nuevo
+        with self.lock_volcado:
+            epoca = leer_epoca(directorio)
+            with self.lock:
+                self.ultimo_volcado = time.monotonic()
+                if self.epoca is not None and epoca != self.epoca:
+                    self.datos = {}  # reiniciado con metricas_peticiones --reiniciar
+                self.epoca = epoca
+                if not self.datos:
+                    return
+                contenido = {
+                    "pid": os.getpid(),
+                    "epoca": epoca,
+                    "urls": {url: dict(d) for url, d in self.datos.items()},
+                }
+                if self.archivo is None:
+                    # pid + hora de inicio: un worker reiniciado no pisa el archivo de otro
+                    self.archivo = os.path.join(directorio, f"peticiones-{os.getpid()}-{int(time.time())}.json")
+            metricas.escribir_json(self.archivo, contenido)
+
+
+acumulado = Acumulado()
+atexit.register(acumulado.volcar)
+
+
+def leer_epoca(directorio):
+    try:
+        with open(os.path.join(directorio, "epoca.json"), encoding="utf-8") as f:
+            return json.load(f)["epoca"]
+    except (OSError, ValueError, KeyError):
+        return ""
+
+
+def reiniciar_acumulados(directorio):
+    """Empieza una época nueva y borra los archivos de la anterior."""
+    os.makedirs(directorio, exist_ok=True)
+    metricas.escribir_json(os.path.join(directorio, "epoca.json"), {"epoca": str(time.time_ns())})
+    for nombre in os.listdir(directorio):
+        if nombre.startswith("peticiones-"):
+            try:
+                os.remove(os.path.join(directorio, nombre))
+            except FileNotFoundError:
+                pass
+
+
+def leer_acumulados(directorio):
+    """Suma los archivos de todos los procesos (época actual). Devuelve {nombre_url: totales}."""
+    total = {}
+    if not directorio or not os.path.isdir(directorio):
+        return total
+    epoca = leer_epoca(directorio)
+    for nombre in sorted(os.listdir(directorio)):
+        if not (nombre.startswith("peticiones-") and nombre.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(directorio, nombre), encoding="utf-8") as f:
+                contenido = json.load(f)
+            urls = contenido["urls"]
+        except (OSError, ValueError, KeyError):
+            continue
+        if contenido.get("epoca", "") != epoca:
+            # Volcado de un worker que aún no veía el reinicio
+            continue
+        for url, d in urls.items():
+            t = total.setdefault(url, dict.fromkeys(Acumulado.CAMPOS, 0))
+            for campo in Acumulado.CAMPOS:
+                if campo.startswith("max_"):
+                    t[campo] = max(t[campo], d.get(campo, 0))
+                else:
+                    t[campo] += d.get(campo, 0)
+    return total
+
+
+# ===================================================
+# Middleware
+# ===================================================
+
+def _nombre_url(request, response):
+    match = getattr(request, "resolver_match", None)
+    if match is not None and match.view_name:
+        return match.view_name
+    return "<404>" if response.status_code == 404 else "<sin_ruta>"
+
+
+class InstrumentacionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, "INSTRUMENTACION_ACTIVA", False):
+            return self.get_response(request)
+
+        registro = RegistroConsultas()
+        inicio = time.perf_counter()
+        with ExitStack() as pila:
+            for alias in connections:
+                pila.enter_context(connections[alias].execute_wrapper(registro))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - inicio) * 1000
+        bd_ms = registro.segundos * 1000
+
+        nombre = _nombre_url(request, response)
+        repetidas = registro.repetidas()
+        lenta = (
+            total_ms >= getattr(settings, "INSTRUMENTACION_LENTA_MS", 1000)
+            or registro.cantidad > getattr(settings, "INSTRUMENTACION_MAX_CONSULTAS", 50)
+        )
+        if lenta:
+            logger.warning(
+                "%s %s [%s] %.0f ms, %s consultas (%.0f ms en BD), %s repetidas. Más repetidas: %s",
+                request.method,
+                request.get_full_path(),
+                nombre,
+                total_ms,
+                registro.cantidad,
+                bd_ms,
+                repetidas,
+                "; ".join(f"{n}x {p[:200]}" for p, n in registro.peores()) or "-",
+            )
+
+        acumulado.agregar(nombre, total_ms, bd_ms, registro.cantidad, repetidas, lenta)
+        acumulado.volcar_si_corresponde()
+
+        if settings.DEBUG:
+            response["Server-Timing"] = (
+                f'bd;dur={bd_ms:.1f};desc="{registro.cantidad} consultas, {repetidas} repetidas", '
+                f"total;dur={total_ms:.1f}"
+            )
+        return response
+
+
+class MetricasMiddleware:
+    """Latencia y cantidad de peticiones por vista para /metrics (config/metricas.py)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        inicio = time.perf_counter()
+        response = self.get_response(request)
+        vista = _nombre_url(request, response)
+        if vista == "metricas":
+            return response
+        metricas.observar("nuam_http_duracion_segundos", time.perf_counter() - inicio, vista=vista)
+        metricas.incrementar(
+            "nuam_http_peticiones_total", vista=vista, metodo=request.method, estado=response.status_code
+        )
+        return response
@@ -0,0 +1,133 @@
+# config/routers.py
+"""
+Lecturas de reportes, exportaciones y listados desde una réplica.
+
+Con DATABASE_REPLICA_URL definido, settings agrega el alias BD_REPLICA y
+este router lo usa SOLO para lecturas de las apps REPLICA_APPS hechas
+dentro de una vista con @leer_de_replica (o un bloque lectura_en("replica")).
+Todo lo demás va a la primaria:
+
+- escrituras y lecturas dentro de una transacción (select_for_update, etc.);
+- sesiones, usuarios y roles (cuentas, auth): un login recién hecho tiene
+  que verse en la petición siguiente;
+- las vistas con @usar_primaria (lectura después de escritura), aunque
+  además tengan @leer_de_replica;
+- el navegador que acaba de hacer un POST, durante REPLICA_RETRASO_SEGUNDOS
+  (cookie de FijarPrimariaMiddleware): así el listado al que redirige
+  "Crear calificación" ya muestra la fila nueva.
+
+Sin réplica configurada todo esto no hace nada.
+
+Probar en local con dos SQLite:
+    DATABASE_URL=sqlite:///db.sqlite3 DATABASE_REPLICA_URL=sqlite:///replica.sqlite3
+    python manage.py migrate && cp db.sqlite3 replica.sqlite3
+(la "replicación" es volver a copiar el archivo).
+
+Ojo: un resultado cacheado por versión (resumen, respuesta_condicional)
+calculado con una réplica atrasada queda en caché hasta el próximo cambio.
+"""
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+COOKIE_PRIMARIA = "nuam_primaria"
+
+# None (sin indicación), "replica" o "primaria"
+_lectura = contextvars.ContextVar("nuam_lectura", default=None)
+
+
+def alias_replica():
+    return getattr(settings, "BD_REPLICA", None)
+
+
+@contextmanager
+def lectura_en(destino):
+    """
+    Dentro del bloque las lecturas van a `destino` ("replica" o "primaria").
+    "primaria" gana: un lectura_en("replica") anidado no la cambia.
+    """
+    if _lectura.get() == "primaria":
+        destino = "primaria"
+    token = _lectura.set(destino)
+    try:
+        yield
+    finally:
+        _lectura.reset(token)
+
+
+def _decorar(vista, destino_para):
+    if iscoroutinefunction(vista):
+        @wraps(vista)
+        async def envoltura_async(request, *args, **kwargs):
+            with lectura_en(destino_para(request)):
+                return await vista(request, *args, **kwargs)
+        return envoltura_async
+
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        with lectura_en(destino_para(request)):
+            return vista(request, *args, **kwargs)
+    return envoltura
+
+
+def _destino_lectura(request):
+    if request.method not in ("GET", "HEAD") or COOKIE_PRIMARIA in request.COOKIES:
+        return "primaria"
+    return "replica"
+
+
+def leer_de_replica(vista):
+    """Vistas de solo lectura (reportes, exportaciones, listados): leen de la réplica."""
+    return _decorar(vista, _destino_lectura)
+
+
+def usar_primaria(vista):
+    """Páginas que muestran lo que se acaba de escribir: siempre la primaria."""
+    return _decorar(vista, lambda request: "primaria")
+
+
+class RouterReplica:
+    def db_for_read(self, model, **hints):
+        replica = alias_replica()
+        if not replica or _lectura.get() != "replica":
+            return None
+        if model._meta.app_label not in getattr(settings, "REPLICA_APPS", ()):
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        instancia = hints.get("instance")
+        if instancia is not None and instancia._state.db:
+            # Relaciones de un objeto ya cargado: del mismo lugar que el objeto
+            return instancia._state.db
+        return replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplica y primaria tienen los mismos datos
+        return True
+
+
+class FijarPrimariaMiddleware:
+    """Tras un POST/PUT/DELETE el mismo navegador lee de la primaria unos segundos."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if alias_replica() and request.method not in ("GET", "HEAD", "OPTIONS"):
+            response.set_cookie(
+                COOKIE_PRIMARIA,
+                "1",
+                max_age=getattr(settings, "REPLICA_RETRASO_SEGUNDOS", 5),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
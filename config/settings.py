@@ -6,6 +6,7 @@ Generated by 'django-admin startproject' using Django 5.2.7.
 
 from pathlib import Path
 import os
+import tempfile
 import dj_database_url
 
 # =========================
@@ -31,6 +32,9 @@ ALLOWED_HOSTS = ["*"]
 # =========================
 AUTH_USER_MODEL = "cuentas.Usuario"
 
+# Carga el usuario con su rol en una sola consulta
+AUTHENTICATION_BACKENDS = ["cuentas.backends.UsuarioRolBackend"]
+
 LOGIN_URL = "/cuentas/login/"
 LOGIN_REDIRECT_URL = "/calificaciones/"
 LOGOUT_REDIRECT_URL = "/cuentas/login/"
@@ -58,6 +62,9 @@ INSTALLED_APPS = [
 # MIDDLEWARE
 # =========================
 MIDDLEWARE = [
+    # Primero: así mide también las consultas de sesión y autenticación
+    "config.middleware.InstrumentacionMiddleware",
+    "config.middleware.MetricasMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
@@ -65,9 +72,32 @@ MIDDLEWARE = [
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
+    "config.routers.FijarPrimariaMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "tributaria.middleware.BitacoraMiddleware",
 ]
 
+# Bitácora: escribir el lote de cada petición en un hilo aparte
+BITACORA_ESCRITURA_ASINCRONA = os.getenv("BITACORA_ESCRITURA_ASINCRONA", "False") == "True"
+# Carpeta de los archivos gzip de `manage.py archivar_bitacora` (fuera de MEDIA: no se publica)
+BITACORA_ARCHIVO_DIR = os.getenv("BITACORA_ARCHIVO_DIR", os.path.join(BASE_DIR, "archivo_bitacora"))
+
+# Instrumentación por petición (config/middleware.py, `manage.py metricas_peticiones`).
+# Apagada por defecto; los volcados van fuera del código fuente (INSTRUMENTACION_DIR).
+INSTRUMENTACION_ACTIVA = os.getenv("INSTRUMENTACION_ACTIVA", "False") == "True"
+INSTRUMENTACION_LENTA_MS = int(os.getenv("INSTRUMENTACION_LENTA_MS", "1000"))
+INSTRUMENTACION_MAX_CONSULTAS = int(os.getenv("INSTRUMENTACION_MAX_CONSULTAS", "50"))
+INSTRUMENTACION_DIR = os.getenv("INSTRUMENTACION_DIR", os.path.join(tempfile.gettempdir(), "nuam", "metricas_peticiones"))
+INSTRUMENTACION_VOLCADO_SEGUNDOS = int(os.getenv("INSTRUMENTACION_VOLCADO_SEGUNDOS", "30"))
+
+# Métricas Prometheus en /metrics (config/metricas.py). Carpeta compartida por
+# todos los workers (fuera del código fuente); vaciarla al desplegar.
+METRICAS_DIR = os.getenv("METRICAS_DIR", os.path.join(tempfile.gettempdir(), "nuam", "metricas_prometheus"))
+METRICAS_VOLCADO_SEGUNDOS = int(os.getenv("METRICAS_VOLCADO_SEGUNDOS", "10"))
+# Si se define, el scraper debe enviar "Authorization: Bearer <token>";
+# si no, /metrics solo lo ve un usuario staff logeado.
+METRICAS_TOKEN = os.getenv("METRICAS_TOKEN", "")
+
 ROOT_URLCONF = "config.urls"
 
 # =========================
@@ -86,6 +116,7 @@ TEMPLATES = [
                 "django.contrib.messages.context_processors.messages",
 
                 "config.context_processors.rol_usuario",
+                "config.context_processors.notificaciones_no_leidas",
             ],
         },
     },
@@ -118,10 +149,180 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL and DATABASE_URL.strip() != "":
     DATABASES["default"] = dj_database_url.config(
         default=DATABASE_URL,
-        conn_max_age=600,
-        ssl_require=True,  # en Render debe ser True
+        ssl_require=not DATABASE_URL.startswith("sqlite"),  # en Render debe ser True
     )
 
+# =========================
+# RÉPLICA DE LECTURA (config/routers.py)
+# =========================
+# Reportes, exportaciones y listados leen de aquí; escrituras, sesiones y
+# usuarios siguen en la primaria.
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+BD_REPLICA = None
+
+if DATABASE_REPLICA_URL and DATABASE_REPLICA_URL.strip() != "":
+    BD_REPLICA = "replica"
+    DATABASES[BD_REPLICA] = dj_database_url.parse(
+        DATABASE_REPLICA_URL,
+        ssl_require=not DATABASE_REPLICA_URL.startswith("sqlite"),
+    )
+    # En los tests la réplica es la misma base
+    DATABASES[BD_REPLICA]["TEST"] = {"MIRROR": "default"}
+
+DATABASE_ROUTERS = ["config.routers.RouterReplica"]
+# Apps cuyos modelos pueden leerse de la réplica
+REPLICA_APPS = ("tributaria",)
+# Tras un POST, el mismo navegador lee de la primaria estos segundos (retraso de replicación)
+REPLICA_RETRASO_SEGUNDOS = int(os.getenv("REPLICA_RETRASO_SEGUNDOS", "5"))
+
+# =========================
+# CONEXIONES A LA BD (config/bd/)
+# =========================
+# Lo fijan config/asgi.py y config/wsgi.py antes de cargar settings ("wsgi" para manage.py)
+MODO_SERVIDOR = os.getenv("MODO_SERVIDOR", "wsgi")
+# Segundos que un worker reusa su conexión entre peticiones (0 = una por petición).
+# Por defecto 600 bajo WSGI y 0 bajo ASGI: ahí el código síncrono de cada
+# petición no corre siempre en el mismo hilo y las conexiones persistentes
+# (una por hilo) quedan abiertas sin reusarse. Con ASGI conviene BD_POOL=True.
+BD_CONN_MAX_AGE = int(os.getenv("BD_CONN_MAX_AGE", "0" if MODO_SERVIDOR == "asgi" else "600"))
+# Verificar una conexión reusada antes de usarla ("MySQL server has gone away")
+BD_CONN_HEALTH_CHECKS = os.getenv("BD_CONN_HEALTH_CHECKS", "True") == "True"
+# Pool de conexiones: en PostgreSQL el de psycopg 3 (requiere psycopg[pool] en vez
+# de psycopg2), en MySQL/SQLite uno dentro del proceso. Reemplaza a BD_CONN_MAX_AGE.
+BD_POOL = os.getenv("BD_POOL", "False") == "True"
+BD_POOL_MIN = int(os.getenv("BD_POOL_MIN", "2"))
+BD_POOL_MAX = int(os.getenv("BD_POOL_MAX", "10"))
+# Segundos que una petición espera una conexión libre antes de fallar
+BD_POOL_ESPERA_SEGUNDOS = float(os.getenv("BD_POOL_ESPERA_SEGUNDOS", "10"))
+
+# Mismos backends de Django + medición de la espera por conexión (/metrics)
+MOTORES_MEDIDOS = {
+    "django.db.backends.mysql": "config.bd.mysql",
+    "django.db.backends.postgresql": "config.bd.postgresql",
+    "django.db.backends.sqlite3": "config.bd.sqlite3",
+}
+
+for _bd in DATABASES.values():
+    _es_postgres = _bd["ENGINE"] == "django.db.backends.postgresql"
+    _bd["ENGINE"] = MOTORES_MEDIDOS.get(_bd["ENGINE"], _bd["ENGINE"])
+    _bd["CONN_HEALTH_CHECKS"] = BD_CONN_HEALTH_CHECKS
+    _bd["CONN_MAX_AGE"] = 0 if BD_POOL else BD_CONN_MAX_AGE
+    if BD_POOL and _es_postgres:
+        _bd.setdefault("OPTIONS", {})["pool"] = {
+            "min_size": BD_POOL_MIN,
+            "max_size": BD_POOL_MAX,
+            "timeout": BD_POOL_ESPERA_SEGUNDOS,
+        }
+    elif BD_POOL:
+        _bd["POOL_PROCESO"] = {"maximo": BD_POOL_MAX, "espera": BD_POOL_ESPERA_SEGUNDOS}
+
+# =========================
+# CACHÉ
+# =========================
+# Versiones de datos, roles y reglas se invalidan en la caché: con varios
+# workers tiene que ser compartida para que las invalidaciones lleguen a
+# todos (tributaria/checks.py no deja arrancar sin ella si DEBUG=False).
+#   CACHE_LOCATION=redis://host:6379/0  -> Redis (requiere el paquete redis)
+#   CACHE_LOCATION=/var/tmp/nuam_cache  -> archivos (workers de una misma máquina)
+# Sin CACHE_LOCATION: caché en memoria del proceso, solo para un único proceso.
+CACHE_LOCATION = os.getenv("CACHE_LOCATION")
+CACHE_LOCAL_PERMITIDA = os.getenv("CACHE_LOCAL_PERMITIDA", str(DEBUG)) == "True"
+
+if CACHE_LOCATION and CACHE_LOCATION.startswith(("redis://", "rediss://")):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_LOCATION,
+        }
+    }
+elif CACHE_LOCATION:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": CACHE_LOCATION,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Segundos que se guarda cada resultado de /reportes/resumen/
+RESUMEN_CACHE_SEGUNDOS = int(os.getenv("RESUMEN_CACHE_SEGUNDOS", "300"))
+# Vigencia del contador de notificaciones no leídas (se recalcula al expirar)
+NOTIFICACIONES_CONTADOR_SEGUNDOS = int(os.getenv("NOTIFICACIONES_CONTADOR_SEGUNDOS", "3600"))
+# Segundos que se guarda la respuesta renderizada de reportes/dashboard/bitácora
+VISTAS_CACHE_SEGUNDOS = int(os.getenv("VISTAS_CACHE_SEGUNDOS", "300"))
+
+# =========================
+# EXPORTACIONES
+# =========================
+# Sobre este número de filas, "Exportar Excel" se encola en vez de generarse
+# en la petición (ver `manage.py procesar_exportaciones`).
+EXPORTACION_MAX_SINCRONA = int(os.getenv("EXPORTACION_MAX_SINCRONA", "20000"))
+# Exportaciones idénticas dentro de esta ventana reutilizan el mismo archivo
+EXPORTACION_REUTILIZAR_MINUTOS = int(os.getenv("EXPORTACION_REUTILIZAR_MINUTOS", "15"))
+# Una exportación en PROCESANDO por más de esto se da por abandonada (worker
+# caído) y se vuelve a encolar; debe superar lo que tarda la más grande.
+EXPORTACION_TIMEOUT_MINUTOS = int(os.getenv("EXPORTACION_TIMEOUT_MINUTOS", "60"))
+# Tomas antes de marcarla ERROR (una exportación que tumba al worker no se reintenta sin fin)
+EXPORTACION_MAX_INTENTOS = int(os.getenv("EXPORTACION_MAX_INTENTOS", "3"))
+
+# =========================
+# CARGA MASIVA
+# =========================
+# Pico de memoria por etapa en ArchivoTributario.metricas (tracemalloc, hace la carga más lenta:
+# encenderlo solo al investigar)
+INGESTA_MEDIR_MEMORIA = os.getenv("INGESTA_MEDIR_MEMORIA", "False") == "True"
+# Guardar un cProfile (.prof) por cada archivo procesado
+INGESTA_PERFIL = os.getenv("INGESTA_PERFIL", "False") == "True"
+INGESTA_PERFIL_DIR = os.getenv("INGESTA_PERFIL_DIR", os.path.join(BASE_DIR, "perfiles"))
+# Filas que se validan antes de escribirlas juntas (bulk_create por lote)
+INGESTA_LOTE = int(os.getenv("INGESTA_LOTE", "1000"))
+
+# =========================
+# CAMBIOS DE ESTADO MASIVOS (tributaria/estados.py)
+# =========================
+# Calificaciones por UPDATE (y por transacción) al validar/publicar/rechazar en bloque
+CAMBIO_ESTADO_LOTE = int(os.getenv("CAMBIO_ESTADO_LOTE", "1000"))
+
+# =========================
+# RECÁLCULO DE MONTO CALIFICADO (`manage.py recalcular_montos_calificados`)
+# =========================
+# Calificaciones por UPDATE (y por transacción)
+RECALCULO_LOTE = int(os.getenv("RECALCULO_LOTE", "10000"))
+
+# =========================
+# RETENCIÓN (`manage.py aplicar_retencion`)
+# =========================
+# Días que se conservan; 0 desactiva la política
+RETENCION_ERRORES_DIAS = int(os.getenv("RETENCION_ERRORES_DIAS", "180"))
+RETENCION_NOTIFICACIONES_LEIDAS_DIAS = int(os.getenv("RETENCION_NOTIFICACIONES_LEIDAS_DIAS", "90"))
+RETENCION_NOTIFICACIONES_DIAS = int(os.getenv("RETENCION_NOTIFICACIONES_DIAS", "365"))
+RETENCION_EXPORTACIONES_DIAS = int(os.getenv("RETENCION_EXPORTACIONES_DIAS", "30"))
+# Un archivo de media/ sin fila que lo referencie se borra pasadas estas horas
+RETENCION_HUERFANOS_HORAS = int(os.getenv("RETENCION_HUERFANOS_HORAS", "24"))
+
+# =========================
+# EVENTOS EN VIVO (SSE)
+# =========================
+# Las rutas /eventos/... necesitan servidor ASGI, p.ej.:
+#   gunicorn config.asgi:application -k uvicorn.workers.UvicornWorker
+# Con EVENTOS_ASGI=True las páginas abren el EventSource. Bajo WSGI (False)
+# no lo abren, y si algo pide /eventos/... recibe 204 en vez de un stream
+# que ocuparía un worker síncrono.
+EVENTOS_ASGI = os.getenv("EVENTOS_ASGI", "False") == "True"
+# Bus pub/sub (reemplazable por uno compartido entre procesos)
+EVENTOS_BUS = os.getenv("EVENTOS_BUS", "tributaria.eventos.BusEnMemoria")
+# Canales cuyo último evento recuerda el bus en memoria (los más recientes)
+EVENTOS_ULTIMOS_MAX = int(os.getenv("EVENTOS_ULTIMOS_MAX", "1000"))
+# Cada cuántas filas se publica progreso durante una carga masiva
+EVENTOS_PROGRESO_CADA = int(os.getenv("EVENTOS_PROGRESO_CADA", "500"))
+# Segundos entre "ping" para mantener viva la conexión
+EVENTOS_KEEPALIVE_SEGUNDOS = int(os.getenv("EVENTOS_KEEPALIVE_SEGUNDOS", "15"))
+
 # =========================
 # VALIDACIÓN DE PASSWORD
 # =========================
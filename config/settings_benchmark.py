@@ -0,0 +1,32 @@
+# config/settings_benchmark.py
+"""
+Settings para `manage.py benchmark_vistas`: base SQLite desechable.
+
+    python manage.py benchmark_vistas --settings=config.settings_benchmark --escala 100000
+
+BENCHMARK_DB elige el archivo (por defecto benchmark.sqlite3 en la raíz);
+se puede reutilizar entre corridas para no volver a sembrar.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, os
+
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": os.getenv("BENCHMARK_DB", os.path.join(BASE_DIR, "benchmark.sqlite3")),
+        "OPTIONS": {"timeout": 30},
+    }
+}
+
+DEBUG = False
+ALLOWED_HOSTS = ["*"]
+# Un solo proceso: la caché en memoria basta
+CACHE_LOCAL_PERMITIDA = True
+
+# Se mide la vista, no el volcado de métricas a disco
+INSTRUMENTACION_ACTIVA = False
+METRICAS_DIR = None
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
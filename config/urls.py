@@ -3,12 +3,15 @@ from django.urls import path, include
 from django.shortcuts import redirect
 from django.contrib.auth import views as auth_views
 
+from config.metricas import vista_metricas
+
 def redirect_to_login(request):
     return redirect("login")
 
 urlpatterns = [
     path("", redirect_to_login, name="home"),
     path("admin/", admin.site.urls),
+    path("metrics", vista_metricas, name="metricas"),
 
     path(
         "cuentas/login/",
@@ -12,5 +12,7 @@ import os
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Decide, entre otros, el valor por defecto de BD_CONN_MAX_AGE
+os.environ.setdefault('MODO_SERVIDOR', 'wsgi')
 
 application = get_wsgi_application()
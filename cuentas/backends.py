@@ -0,0 +1,17 @@
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth import get_user_model
+
+
+class UsuarioRolBackend(ModelBackend):
+    """
+    Igual que ModelBackend, pero carga el Usuario junto con su Rol
+    (select_related) para que request.user.rol no haga otra consulta.
+    """
+
+    def get_user(self, user_id):
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.select_related("rol").get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
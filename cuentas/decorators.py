@@ -2,10 +2,13 @@ from functools import wraps
 from django.contrib.auth.decorators import login_required
 from django.core.exceptions import PermissionDenied
 
+from .roles import rol_nombre
+
 
 def rol_requerido(*roles_permitidos):
     """
-    Decorador por roles (basado en request.user.rol.nombre).
+    Decorador por roles (basado en el nombre del rol del usuario,
+    resuelto una vez y cacheado en sesión; ver cuentas/roles.py).
 
     Uso:
         @rol_requerido("Administrador")
@@ -18,14 +21,13 @@ def rol_requerido(*roles_permitidos):
         @login_required
         @wraps(view_func)
         def _wrapped_view(request, *args, **kwargs):
-            # Si tu Usuario tiene FK 'rol', esto existe:
-            rol = getattr(request.user, "rol", None)
+            nombre = rol_nombre(request)
 
             # Si no tiene rol asignado, no pasa
-            if not rol or not getattr(rol, "nombre", None):
+            if not nombre:
                 raise PermissionDenied("No tienes un rol asignado.")
 
-            if rol.nombre not in roles_permitidos:
+            if nombre not in roles_permitidos:
                 raise PermissionDenied("No tienes permisos para acceder a esta sección.")
 
             return view_func(request, *args, **kwargs)
@@ -0,0 +1,72 @@
+"""
+Resolución del rol del usuario con caché en sesión.
+
+El rol (nombre + permisos) se guarda en la sesión la primera vez y se reusa
+en cada petición. La sesión se invalida sola si cambia el rol del usuario
+(rol_id distinto) o si cambió algún Rol/permiso (versión "roles" en la
+caché compartida, ver signals.py y tributaria/versiones.py): un cambio de
+permisos hecho en un worker vale para las sesiones de todos.
+"""
+from config.metricas import contar_cache
+from tributaria.versiones import invalidar, obtener_version
+
+
+CLAVE_SESION = "_rol_cache"
+
+
+def version_roles():
+    return obtener_version("roles")
+
+
+def invalidar_roles():
+    invalidar("roles")
+
+
+def _resolver(user):
+    rol = getattr(user, "rol", None)
+    return {
+        "user_id": user.pk,
+        "rol_id": getattr(user, "rol_id", None),
+        "nombre": getattr(rol, "nombre", None),
+        "permisos": sorted(user.get_all_permissions()),
+        "version": version_roles(),
+    }
+
+
+def rol_de(request):
+    """
+    Devuelve dict {"nombre": str|None, "permisos": set} del usuario logeado.
+    Memoizado en el request y cacheado en la sesión.
+    """
+    resuelto = getattr(request, "_rol_resuelto", None)
+    if resuelto is not None:
+        return resuelto
+
+    user = request.user
+    if not user.is_authenticated:
+        resuelto = {"nombre": None, "permisos": set()}
+        request._rol_resuelto = resuelto
+        return resuelto
+
+    session = getattr(request, "session", None)
+    datos = session.get(CLAVE_SESION) if session is not None else None
+
+    vigente = (
+        datos is not None
+        and datos.get("user_id") == user.pk
+        and datos.get("rol_id") == getattr(user, "rol_id", None)
+        and datos.get("version") == version_roles()
+    )
+    contar_cache("roles", vigente)
+    if not vigente:
+        datos = _resolver(user)
+        if session is not None:
+            session[CLAVE_SESION] = datos
+
+    resuelto = {"nombre": datos["nombre"], "permisos": set(datos["permisos"])}
+    request._rol_resuelto = resuelto
+    return resuelto
+
+
+def rol_nombre(request):
+    return rol_de(request)["nombre"]
@@ -1,6 +1,8 @@
-from django.db.models.signals import post_migrate
+from django.contrib.auth.models import Group
+from django.db.models.signals import post_migrate, post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from .models import Rol
+from .models import Rol, Usuario
+from .roles import invalidar_roles
 
 
 @receiver(post_migrate)
@@ -24,3 +26,15 @@ def crear_roles_basicos(sender, **kwargs):
         Rol.objects.get_or_create(nombre=nombre, defaults={'descripcion': descripcion})
 
     print(">>> Roles básicos de NUAM verificados/creados.")
+
+
+@receiver([post_save, post_delete], sender=Rol)
+def rol_modificado(sender, **kwargs):
+    invalidar_roles()
+
+
+@receiver(m2m_changed, sender=Usuario.user_permissions.through)
+@receiver(m2m_changed, sender=Usuario.groups.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def permisos_modificados(sender, **kwargs):
+    invalidar_roles()
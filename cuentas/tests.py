@@ -1,3 +1,151 @@
-from django.test import TestCase
+"""
+Presupuesto de consultas SQL de las vistas de cuentas.urls.
 
-# Create your tests here.
+Igual que en tributaria/tests.py: cada vista se mide con 10 y con 1000
+usuarios, la cantidad de consultas tiene que ser la misma y no pasar de
+su presupuesto.
+"""
+from django.contrib.auth.models import Group, Permission
+from django.contrib.auth.tokens import default_token_generator
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from config import metricas
+
+from .models import Rol, Usuario
+from .roles import rol_de
+
+
+ESCALAS = (10, 1000)
+
+
+def tearDownModule():
+    # Lo que registraron las pruebas no es del despliegue: que el atexit de
+    # config.metricas no lo vuelque en METRICAS_DIR
+    metricas.registro.descartar()
+
+
+@override_settings(INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None)
+class PresupuestoConsultasCuentasTests(TestCase):
+    # nombre de URL -> máximo de consultas por petición
+    PRESUPUESTOS = {
+        "crear_usuario": 9,
+        "crear_usuario:post": 12,
+        "logout": 4,
+        "password_reset": 0,
+        "password_reset:post": 1,
+        "password_reset_done": 0,
+        "password_reset_confirm": 5,
+        "password_reset_complete": 0,
+    }
+
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.admin = Usuario.objects.create_user(
+            username="admin_presupuesto", password="x", email="admin@nuam.cl",
+            rol=Rol.objects.get(nombre="Administrador"),
+        )
+
+    def agregar_usuarios(self, hasta):
+        roles = list(Rol.objects.all())
+        actuales = Usuario.objects.count()
+        Usuario.objects.bulk_create(
+            Usuario(username=f"usuario{i}", email=f"usuario{i}@nuam.cl", rol=roles[i % len(roles)])
+            for i in range(actuales, hasta)
+        )
+
+    def contar_consultas(self, url, metodo="get", datos=None, logeado=True):
+        cache.clear()
+        cliente = Client()
+        if logeado:
+            cliente.force_login(self.admin)
+        with CaptureQueriesContext(connection) as consultas:
+            response = getattr(cliente, metodo)(url, datos or {})
+        self.assertLess(response.status_code, 400, f"{url} respondió {response.status_code}")
+        return len(consultas)
+
+    def url_confirmacion(self):
+        # force_login cambia last_login, que es parte del token: generarlo al final
+        self.admin.refresh_from_db()
+        uid = urlsafe_base64_encode(force_bytes(self.admin.pk))
+        return reverse("password_reset_confirm", args=[uid, default_token_generator.make_token(self.admin)])
+
+    def medir(self, escala):
+        clave = f"Clave-presupuesto-{escala}"
+        return {
+            "crear_usuario": self.contar_consultas(reverse("crear_usuario")),
+            "crear_usuario:post": self.contar_consultas(
+                reverse("crear_usuario"),
+                "post",
+                {
+                    "username": f"nuevo{escala}",
+                    "email": f"nuevo{escala}@nuam.cl",
+                    "rol": Rol.objects.get(nombre="Corredor").pk,
+                    "password1": clave,
+                    "password2": clave,
+                },
+            ),
+            "logout": self.contar_consultas(reverse("logout"), "post"),
+            "password_reset": self.contar_consultas(reverse("password_reset"), logeado=False),
+            "password_reset:post": self.contar_consultas(
+                reverse("password_reset"), "post", {"email": "nadie@nuam.cl"}, logeado=False
+            ),
+            "password_reset_done": self.contar_consultas(reverse("password_reset_done"), logeado=False),
+            "password_reset_confirm": self.contar_consultas(self.url_confirmacion(), logeado=False),
+            "password_reset_complete": self.contar_consultas(reverse("password_reset_complete"), logeado=False),
+        }
+
+    def test_consultas_no_dependen_de_la_cantidad_de_usuarios(self):
+        medidas = {}
+        for escala in ESCALAS:
+            self.agregar_usuarios(escala)
+            medidas[escala] = self.medir(escala)
+
+        chica, grande = (medidas[e] for e in ESCALAS)
+        self.assertEqual(set(chica), set(self.PRESUPUESTOS))
+        for vista, maximo in self.PRESUPUESTOS.items():
+            with self.subTest(vista=vista):
+                self.assertEqual(chica[vista], grande[vista])
+                self.assertLessEqual(grande[vista], maximo, f"{vista} pasó su presupuesto de consultas")
+
+
+@override_settings(INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None)
+class RolesEnSesionTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.grupo = Group.objects.create(name="revisores")
+        self.usuario = Usuario.objects.create_user(
+            username="analista_roles", password="x", rol=Rol.objects.get(nombre="Analista"),
+        )
+        self.usuario.groups.add(self.grupo)
+        self.sesion = SessionStore()
+        self.sesion.create()
+
+    def resolver(self):
+        # Una petición nueva con la misma sesión (puede atenderla otro worker)
+        request = RequestFactory().get("/")
+        request.user = Usuario.objects.select_related("rol").get(pk=self.usuario.pk)
+        request.session = self.sesion
+        return rol_de(request)
+
+    def test_cambio_de_permisos_invalida_el_rol_cacheado(self):
+        self.assertEqual(self.resolver()["nombre"], "Analista")
+        # Solo la carga del usuario: el rol y los permisos salen de la sesión
+        with self.assertNumQueries(1):
+            self.assertNotIn("tributaria.delete_bitacora", self.resolver()["permisos"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.grupo.permissions.add(Permission.objects.get(codename="delete_bitacora"))
+        self.assertIn("tributaria.delete_bitacora", self.resolver()["permisos"])
+
+        rol = Rol.objects.get(nombre="Analista")
+        rol.nombre = "Analista senior"
+        with self.captureOnCommitCallbacks(execute=True):
+            rol.save()
+        self.assertEqual(self.resolver()["nombre"], "Analista senior")
@@ -4,6 +4,7 @@ from django.contrib.auth.decorators import login_required
 from django.http import HttpResponseForbidden
 
 from .forms import CrearUsuarioForm
+from .roles import rol_nombre
 
 
 def logout_view(request):
@@ -14,7 +15,7 @@ def logout_view(request):
 @login_required
 def crear_usuario(request):
     # SOLO Administrador puede crear usuarios
-    if not request.user.rol or request.user.rol.nombre != "Administrador":
+    if rol_nombre(request) != "Administrador":
         return HttpResponseForbidden("No autorizado")
 
     if request.method == "POST":
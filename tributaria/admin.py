@@ -1,13 +1,23 @@
+from django.conf import settings
 from django.contrib import admin
+from django.utils.html import format_html, format_html_join
+
+from .emisores import filtrar_emisor
+from .estados import TRANSICIONES, cambiar_estado
+from .forms import ReglaValidacionForm
 from .models import ErrorValidacion
 from .models import Notificacion
 from .models import (
     Emisor,
     ArchivoTributario,
     CalificacionTributaria,
+    CambioCalificacion,
     ErrorValidacion,
     Bitacora,
     Notificacion,
+    ExportacionCalificaciones,
+    FactorEmisor,
+    ReglaValidacion,
 )
 
 
@@ -16,12 +26,64 @@ class EmisorAdmin(admin.ModelAdmin):
     list_display = ('id', 'nombre', 'rut', 'email_contacto')
     search_fields = ('nombre', 'rut')
 
+    def get_search_results(self, request, queryset, search_term):
+        # Por RUT canónico o prefijo/trigrama del nombre normalizado, con índice
+        if not search_term.strip():
+            return queryset, False
+        return filtrar_emisor(queryset, search_term), False
+
 
 @admin.register(ArchivoTributario)
 class ArchivoAdmin(admin.ModelAdmin):
-    list_display = ('id', 'nombre_original', 'tipo_archivo', 'usuario', 'estado', 'fecha_subida')
+    list_display = ('id', 'nombre_original', 'tipo_archivo', 'usuario', 'estado', 'fecha_subida', 'duracion')
     list_filter = ('tipo_archivo', 'estado', 'fecha_subida')
     search_fields = ('nombre_original',)
+    exclude = ('metricas',)
+    readonly_fields = ('metricas_por_etapa',)
+
+    @admin.display(description="Duración (s)")
+    def duracion(self, obj):
+        return (obj.metricas or {}).get("segundos", "")
+
+    @admin.display(description="Métricas de la carga")
+    def metricas_por_etapa(self, obj):
+        metricas = obj.metricas or {}
+        if not metricas:
+            return "Sin métricas"
+        filas = format_html_join(
+            "",
+            "<tr><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>",
+            (
+                (e["nombre"], e["segundos"], e["consultas"], e["filas"], e.get("memoria_pico_kb", ""))
+                for e in metricas.get("etapas", [])
+            ),
+        )
+        return format_html(
+            "<p>Total: {} s, {} consultas, pico de memoria {} KB{}</p>"
+            "<table><tr><th>Etapa</th><th>Segundos</th><th>Consultas</th><th>Filas</th><th>Memoria pico (KB)</th></tr>{}</table>",
+            metricas.get("segundos", ""),
+            metricas.get("consultas", ""),
+            metricas.get("memoria_pico_kb", "-"),
+            format_html(" — perfil: <code>{}</code>", metricas["perfil"]) if metricas.get("perfil") else "",
+            filas,
+        )
+
+
+def _accion_estado(accion):
+    transicion = TRANSICIONES[accion]
+
+    @admin.action(description=f"{transicion.verbo} seleccionadas (a {transicion.destino})")
+    def cambiar(modeladmin, request, queryset):
+        # Un UPDATE por lote; las que no están en un estado de origen se ignoran
+        resultado = cambiar_estado(queryset, accion, request.user, lote=settings.CAMBIO_ESTADO_LOTE)
+        modeladmin.message_user(
+            request,
+            f"{resultado.cambiadas} calificaciones pasaron a {transicion.destino} "
+            f"(las demás seleccionadas no estaban en {' ni '.join(transicion.origenes)}).",
+        )
+
+    cambiar.__name__ = f"{accion}_calificaciones"
+    return cambiar
 
 
 @admin.register(CalificacionTributaria)
@@ -29,6 +91,7 @@ class CalificacionAdmin(admin.ModelAdmin):
     list_display = ('id', 'emisor', 'corredor', 'anio_tributario', 'monto', 'factor', 'estado', 'fecha_registro')
     list_filter = ('anio_tributario', 'estado', 'emisor')
     search_fields = ('corredor', 'instrumento')
+    actions = [_accion_estado(accion) for accion in TRANSICIONES]
 
 
 @admin.register(ErrorValidacion)
@@ -49,3 +112,53 @@ class NotificacionAdmin(admin.ModelAdmin):
     list_display = ("usuario", "mensaje", "nivel", "leida", "fecha")
     list_filter = ("nivel", "leida", "fecha")
     search_fields = ("mensaje", "usuario__username")
+
+
+@admin.register(CambioCalificacion)
+class CambioCalificacionAdmin(admin.ModelAdmin):
+    list_display = ("id", "secuencia", "calificacion_id", "operacion", "fecha")
+    list_filter = ("operacion",)
+    search_fields = ("calificacion_id",)
+
+
+@admin.register(ExportacionCalificaciones)
+class ExportacionCalificacionesAdmin(admin.ModelAdmin):
+    list_display = ("id", "usuario", "estado", "filas", "fecha_solicitud", "fecha_fin")
+    list_filter = ("estado",)
+    readonly_fields = ("huella",)
+
+
+@admin.register(ReglaValidacion)
+class ReglaValidacionAdmin(admin.ModelAdmin):
+    list_display = ("orden", "nombre", "campo", "operador", "valor", "valor_max", "solo_anio", "solo_rut_emisor", "activa")
+    list_filter = ("activa", "campo", "operador")
+    search_fields = ("nombre",)
+    readonly_fields = ("usuario_modificacion", "fecha_modificacion")
+
+    def get_form(self, request, obj=None, **kwargs):
+        # Mismas validaciones que la pantalla de Analistas
+        kwargs.setdefault("form", ReglaValidacionForm)
+        return super().get_form(request, obj, **kwargs)
+
+    def save_model(self, request, obj, form, change):
+        obj.usuario_modificacion = request.user
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(FactorEmisor)
+class FactorEmisorAdmin(admin.ModelAdmin):
+    # Se carga con `manage.py recalcular_montos_calificados`, que además ajusta las calificaciones
+    list_display = ("emisor", "anio_tributario", "factor", "usuario_modificacion", "fecha_modificacion")
+    list_filter = ("anio_tributario",)
+    list_select_related = ("emisor", "usuario_modificacion")
+    readonly_fields = ("usuario_modificacion", "fecha_modificacion")
+    raw_id_fields = ("emisor",)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        return filtrar_emisor(queryset, search_term, prefijo="emisor__"), False
+
+    def save_model(self, request, obj, form, change):
+        obj.usuario_modificacion = request.user
+        super().save_model(request, obj, form, change)
@@ -0,0 +1,227 @@
+"""
+API JSON de solo lectura para sistemas externos.
+
+- Paginación por cursor opaco (no usa OFFSET, el costo no crece con la página).
+- Selección de campos: ?campos=id,monto,estado
+- Mismos filtros que listar_calificaciones.
+- ETag / If-None-Match: el ETag se calcula con la versión de datos y los
+  parámetros, ANTES de consultar, así que un cliente que hace polling recibe
+  304 sin que el servidor vuelva a serializar nada.
+"""
+import base64
+import hashlib
+import json
+
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from config.routers import leer_de_replica
+from cuentas.decorators import rol_requerido
+
+from .cambios import cambios_desde
+from .emisores import filtrar_emisor, filtrar_por_nombre
+from .models import ArchivoTributario, CalificacionTributaria, Emisor
+from .versiones import obtener_version
+
+
+LIMITE_POR_DEFECTO = 100
+LIMITE_MAXIMO = 1000
+
+
+# Recurso -> modelo, entidad de versión, campos expuestos y filtros
+# (param GET -> lookup, o función (qs, valor) -> qs como en el listado HTML)
+RECURSOS = {
+    "calificaciones": {
+        "modelo": CalificacionTributaria,
+        "entidades": ("calificaciones",),
+        "campos": (
+            "id", "emisor_id", "corredor", "instrumento", "anio_tributario",
+            "monto", "factor", "monto_calificado", "fuente", "estado",
+            "fecha_registro", "archivo_origen_id", "usuario_responsable_id",
+        ),
+        "filtros": {
+            "anio_tributario": "anio_tributario",
+            "corredor": "corredor__icontains",
+            "emisor": lambda qs, valor: filtrar_emisor(qs, valor, prefijo="emisor__"),
+            "estado": "estado",
+        },
+    },
+    "emisores": {
+        "modelo": Emisor,
+        "entidades": ("emisores",),
+        "campos": ("id", "nombre", "rut", "email_contacto"),
+        "filtros": {
+            "nombre": filtrar_por_nombre,
+            "rut": "rut",
+        },
+    },
+    "archivos": {
+        "modelo": ArchivoTributario,
+        "entidades": ("archivos",),
+        "campos": (
+            "id", "tipo_archivo", "archivo", "nombre_original", "fecha_subida",
+            "usuario_id", "emisor_id", "estado", "mensaje_estado",
+        ),
+        "filtros": {
+            "estado": "estado",
+            "tipo_archivo": "tipo_archivo",
+        },
+    },
+}
+
+
+class ParametroInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(ultimo_id):
+    crudo = json.dumps({"id": ultimo_id}).encode("utf-8")
+    return base64.urlsafe_b64encode(crudo).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(cursor):
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        return int(datos["id"])
+    except Exception:
+        raise ParametroInvalido("cursor inválido")
+
+
+def _parametros(request, recurso):
+    conf = RECURSOS[recurso]
+
+    campos = [c.strip() for c in request.GET.get("campos", "").split(",") if c.strip()]
+    if campos:
+        desconocidos = [c for c in campos if c not in conf["campos"]]
+        if desconocidos:
+            raise ParametroInvalido(f"campos no soportados: {', '.join(desconocidos)}")
+    else:
+        campos = list(conf["campos"])
+
+    try:
+        limite = int(request.GET.get("limite", LIMITE_POR_DEFECTO))
+    except ValueError:
+        raise ParametroInvalido("limite debe ser numérico")
+    limite = max(1, min(limite, LIMITE_MAXIMO))
+
+    cursor = request.GET.get("cursor") or ""
+    desde_id = decodificar_cursor(cursor) if cursor else None
+
+    filtros = {}
+    for nombre in sorted(conf["filtros"]):
+        valor = (request.GET.get(nombre) or "").strip()
+        if valor:
+            filtros[nombre] = valor
+
+    return {"campos": campos, "limite": limite, "cursor": cursor, "desde_id": desde_id, "filtros": filtros}
+
+
+def _etag(recurso, params):
+    conf = RECURSOS[recurso]
+    versiones = [obtener_version(e) for e in conf["entidades"]]
+    huella = json.dumps(
+        [recurso, versiones, params["campos"], params["limite"], params["cursor"], params["filtros"]],
+        sort_keys=True,
+    )
+    return '"%s"' % hashlib.sha1(huella.encode("utf-8")).hexdigest()
+
+
+def _coincide_etag(request, etag):
+    cabecera = request.headers.get("If-None-Match", "")
+    return etag in [e.strip() for e in cabecera.split(",")] or cabecera.strip() == "*"
+
+
+def _listado(request, recurso):
+    conf = RECURSOS[recurso]
+
+    try:
+        params = _parametros(request, recurso)
+    except ParametroInvalido as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    etag = _etag(recurso, params)
+    if _coincide_etag(request, etag):
+        response = HttpResponse(status=304)
+    else:
+        qs = conf["modelo"].objects.order_by("id")
+        lookups = {}
+        for nombre, valor in params["filtros"].items():
+            filtro = conf["filtros"][nombre]
+            if callable(filtro):
+                qs = filtro(qs, valor)
+            else:
+                lookups[filtro] = valor
+        if params["desde_id"] is not None:
+            lookups["id__gt"] = params["desde_id"]
+
+        try:
+            qs = qs.filter(**lookups)
+        except (ValueError, TypeError) as e:
+            return JsonResponse({"error": f"filtro inválido: {e}"}, status=400)
+
+        # Se consulta uno extra para saber si hay página siguiente
+        columnas = list(dict.fromkeys(["id"] + params["campos"]))
+        filas = list(qs.values(*columnas)[: params["limite"] + 1])
+        hay_mas = len(filas) > params["limite"]
+        filas = filas[: params["limite"]]
+
+        siguiente = codificar_cursor(filas[-1]["id"]) if hay_mas else None
+        resultados = [{c: f[c] for c in params["campos"]} for f in filas]
+
+        response = JsonResponse({"resultados": resultados, "siguiente": siguiente})
+
+    response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ["Cookie"])
+    return response
+
+
+@login_required
+@leer_de_replica
+@rol_requerido("Corredor", "Analista", "Administrador", "Auditor", "Gerente")
+def api_calificaciones(request):
+    return _listado(request, "calificaciones")
+
+
+@login_required
+@leer_de_replica
+@rol_requerido("Corredor", "Analista", "Administrador", "Auditor", "Gerente")
+def api_emisores(request):
+    return _listado(request, "emisores")
+
+
+@login_required
+@leer_de_replica
+@rol_requerido("Analista", "Administrador", "Auditor")
+def api_archivos(request):
+    return _listado(request, "archivos")
+
+
+@login_required
+@leer_de_replica
+@rol_requerido("Corredor", "Analista", "Administrador", "Auditor", "Gerente")
+def api_cambios_calificaciones(request):
+    """
+    Feed incremental: /api/calificaciones/cambios/?desde=<secuencia>
+    Responder "siguiente" permite encadenar llamadas hasta vaciar el feed.
+    """
+    try:
+        desde = int(request.GET.get("desde", 0))
+        limite = max(1, min(int(request.GET.get("limite", LIMITE_MAXIMO)), LIMITE_MAXIMO))
+    except ValueError:
+        return JsonResponse({"error": "desde y limite deben ser numéricos"}, status=400)
+
+    cambios = [
+        {
+            "secuencia": c["secuencia"],
+            "calificacion_id": c["calificacion_id"],
+            "operacion": c["operacion"],
+            "fecha": c["fecha"],
+            "datos": c["datos"],
+        }
+        for c in cambios_desde(desde, limite)
+    ]
+    ultima = cambios[-1]["secuencia"] if cambios else desde
+    return JsonResponse({"cambios": cambios, "siguiente": ultima, "hay_mas": len(cambios) == limite})
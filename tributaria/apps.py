@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class TributariaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tributaria'
+
+    def ready(self):
+        import tributaria.checks
+        import tributaria.signals
@@ -0,0 +1,313 @@
+"""
+Escritura de Bitácora con buffer.
+
+Dentro de una petición (BitacoraMiddleware) o de un trabajo envuelto en
+`buffer_bitacora()`, registrar_bitacora() solo acumula las entradas en
+memoria y se escriben todas juntas con un bulk_create:
+
+- al hacer commit de la transacción en que se registraron (on_commit), o
+- al terminar la petición/trabajo (también si terminó con una excepción).
+
+Una entrada registrada dentro de una transacción corre su suerte, igual que
+un save() hecho en ella: si la transacción (o el savepoint) hace rollback,
+Django descarta su on_commit y la entrada no se escribe. Si al cerrar el
+buffer la transacción sigue abierta (buffer dentro de un atomic), las
+pendientes se escriben en ella.
+Fuera de un buffer (shell, scripts) se escribe de inmediato como antes.
+
+Con BITACORA_ESCRITURA_ASINCRONA=True el bulk_create se hace en un hilo
+aparte para no sumar la latencia del INSERT a la respuesta.
+"""
+import atexit
+import contextvars
+import gzip
+import json
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta, timezone as dt_timezone
+from functools import partial
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from .models import Bitacora
+from .paginacion import inicio_dia, iterar_keyset, pagina_keyset
+from .versiones import invalidar
+
+
+logger = logging.getLogger(__name__)
+
+_buffer_actual = contextvars.ContextVar("buffer_bitacora", default=None)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _obtener_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bitacora")
+            # Al apagar el proceso se espera a que termine lo pendiente
+            atexit.register(_executor.shutdown, wait=True)
+        return _executor
+
+
+def _escribir(entradas):
+    Bitacora.objects.bulk_create(entradas, batch_size=500)
+
+
+def _escribir_en_hilo(entradas):
+    try:
+        _escribir(entradas)
+    except Exception:
+        logger.exception("No se pudieron escribir %s entradas de bitácora", len(entradas))
+    finally:
+        connection.close()
+
+
+class BufferBitacora:
+    def __init__(self):
+        self.entradas = []      # listas para escribir
+        self.pendientes = []    # registradas en una transacción aún sin commit
+
+    def agregar(self, entrada):
+        if not transaction.get_connection().in_atomic_block:
+            self.entradas.append(entrada)
+            return
+        self.pendientes.append(entrada)
+        transaction.on_commit(partial(self._confirmar, entrada))
+
+    def _confirmar(self, entrada):
+        if entrada not in self.pendientes:
+            # Ya se escribió al cerrar el buffer, dentro de esta misma transacción
+            return
+        self.pendientes.remove(entrada)
+        self.entradas.append(entrada)
+        # Última confirmación del commit: un solo bulk_create. Si quedó alguna
+        # de un savepoint revertido, se espera al cierre (y ahí se descarta).
+        if not self.pendientes:
+            self.vaciar()
+
+    def cerrar(self):
+        """Fin de la petición/trabajo: escribe lo confirmado y descarta lo revertido."""
+        pendientes, self.pendientes = self.pendientes, []
+        if pendientes and transaction.get_connection().in_atomic_block:
+            _escribir(pendientes)
+        self.vaciar()
+
+    def vaciar(self):
+        entradas, self.entradas = self.entradas, []
+        if not entradas:
+            return
+        if getattr(settings, "BITACORA_ESCRITURA_ASINCRONA", False):
+            _obtener_executor().submit(_escribir_en_hilo, entradas)
+        else:
+            _escribir(entradas)
+
+
+@contextmanager
+def buffer_bitacora():
+    """Acumula las entradas de bitácora del bloque y las escribe al salir."""
+    buffer = BufferBitacora()
+    token = _buffer_actual.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _buffer_actual.reset(token)
+        buffer.cerrar()
+
+
+def registrar_bitacora(usuario, accion, entidad, id_registro=None, detalle=""):
+    entrada = Bitacora(
+        usuario=usuario,
+        accion=accion,
+        entidad=entidad,
+        id_registro=id_registro,
+        detalle=detalle,
+    )
+    buffer = _buffer_actual.get()
+    if buffer is None:
+        entrada.save()
+    else:
+        buffer.agregar(entrada)
+
+
+# ===================================================
+# Archivado (retención) de bitácora
+# ===================================================
+# Las entradas antiguas se mueven a archivos gzip de líneas JSON, uno por
+# mes (bitacora-AAAA-MM.jsonl.gz). Solo se agregan miembros gzip al final
+# (modo "ab"), nunca se reescribe un archivo.
+
+CAMPOS_ARCHIVO = ["id", "fecha", "usuario_id", "accion", "entidad", "id_registro", "detalle"]
+
+
+def directorio_archivo():
+    return getattr(settings, "BITACORA_ARCHIVO_DIR", os.path.join(settings.BASE_DIR, "archivo_bitacora"))
+
+
+def _ruta_mes(directorio, fecha):
+    return os.path.join(directorio, f"bitacora-{fecha:%Y-%m}.jsonl.gz")
+
+
+def archivar_bitacora(antes_de, lote=5000, directorio=None):
+    """
+    Mueve a archivo las entradas con fecha < antes_de, por lotes de `lote` ids.
+    Cada lote se escribe y sincroniza a disco ANTES de borrarse de la tabla.
+    Devuelve la cantidad de entradas archivadas.
+    """
+    directorio = directorio or directorio_archivo()
+    os.makedirs(directorio, exist_ok=True)
+
+    total = 0
+    ultimo_id = 0
+    while True:
+        filas = list(
+            Bitacora.objects.filter(fecha__lt=antes_de, id__gt=ultimo_id)
+            .order_by("id")
+            .values(*CAMPOS_ARCHIVO)[:lote]
+        )
+        if not filas:
+            break
+
+        por_mes = {}
+        for fila in filas:
+            por_mes.setdefault(_ruta_mes(directorio, fila["fecha"]), []).append(fila)
+
+        for ruta, grupo in por_mes.items():
+            with open(ruta, "ab") as crudo:
+                with gzip.GzipFile(fileobj=crudo, mode="ab") as gz:
+                    for fila in grupo:
+                        gz.write((json.dumps(fila, cls=DjangoJSONEncoder) + "\n").encode("utf-8"))
+                crudo.flush()
+                os.fsync(crudo.fileno())
+
+        ids = [f["id"] for f in filas]
+        Bitacora.objects.filter(id__in=ids).delete()
+        ultimo_id = ids[-1]
+        total += len(ids)
+
+    if total:
+        # Borrar lo antiguo no mueve el último id: la firma de las vistas usa esta versión
+        invalidar("bitacora")
+    return total
+
+
+# Un lote que se escribió pero no alcanzó a borrarse (caída) se vuelve a
+# archivar en la siguiente corrida, justo a continuación de sí mismo en el
+# mismo archivo. Basta recordar los últimos ids leídos, no todo el archivo;
+# la ventana tiene que ser al menos del tamaño de `lote` de archivar_bitacora.
+VENTANA_DUPLICADOS = 100_000
+
+
+class _IdsRecientes:
+    """Conjunto de los últimos `tamano` ids (memoria acotada)."""
+
+    def __init__(self, tamano):
+        self.tamano = tamano
+        self.orden = deque()
+        self.ids = set()
+
+    def __contains__(self, id_):
+        return id_ in self.ids
+
+    def agregar(self, id_):
+        self.orden.append(id_)
+        self.ids.add(id_)
+        if len(self.orden) > self.tamano:
+            self.ids.discard(self.orden.popleft())
+
+
+def leer_bitacora_archivada(desde=None, hasta=None, usuario_id=None, entidad=None,
+                            accion=None, id_registro=None, directorio=None,
+                            ventana=VENTANA_DUPLICADOS):
+    """
+    Lector de solo lectura del archivo de bitácora. Genera dicts.
+    `desde`/`hasta` son fechas (date) inclusivas en la zona horaria local
+    (TIME_ZONE), igual que el filtro de la vista; solo se abren los meses
+    necesarios.
+    """
+    directorio = directorio or directorio_archivo()
+    if not os.path.isdir(directorio):
+        return
+
+    # Los archivos se agrupan por mes en UTC: los límites del día local se
+    # pasan a UTC para elegir los meses (el día local puede caer en otro mes UTC)
+    inicio = inicio_dia(desde) if desde else None
+    fin = inicio_dia(hasta + timedelta(days=1)) if hasta else None
+    mes_desde = f"{inicio.astimezone(dt_timezone.utc):%Y-%m}" if inicio else None
+    mes_hasta = f"{(fin - timedelta(microseconds=1)).astimezone(dt_timezone.utc):%Y-%m}" if fin else None
+
+    for nombre in sorted(os.listdir(directorio)):
+        if not (nombre.startswith("bitacora-") and nombre.endswith(".jsonl.gz")):
+            continue
+        mes = nombre[len("bitacora-"):-len(".jsonl.gz")]
+        if mes_desde and mes < mes_desde:
+            continue
+        if mes_hasta and mes > mes_hasta:
+            continue
+
+        recientes = _IdsRecientes(ventana)
+        with gzip.open(os.path.join(directorio, nombre), "rt", encoding="utf-8") as f:
+            for linea in f:
+                fila = json.loads(linea)
+                if fila["id"] in recientes:
+                    continue
+                recientes.agregar(fila["id"])
+                if inicio or fin:
+                    fecha = parse_datetime(fila["fecha"])
+                    if inicio and fecha < inicio:
+                        continue
+                    if fin and fecha >= fin:
+                        continue
+                if usuario_id is not None and fila["usuario_id"] != usuario_id:
+                    continue
+                if entidad and fila["entidad"] != entidad:
+                    continue
+                if accion and accion.lower() not in fila["accion"].lower():
+                    continue
+                if id_registro is not None and fila["id_registro"] != id_registro:
+                    continue
+                yield fila
+
+
+# ===================================================
+# Consulta de bitácora (filtros + paginación keyset, ver paginacion.py)
+# ===================================================
+
+CAMPOS_LISTADO = ["id", "fecha", "usuario__username", "accion", "entidad", "id_registro", "detalle"]
+
+
+def filtrar_bitacora(qs, filtros):
+    """Aplica FiltroBitacoraForm.cleaned_data."""
+    if filtros.get("usuario"):
+        qs = qs.filter(usuario__username=filtros["usuario"])
+    if filtros.get("entidad"):
+        qs = qs.filter(entidad=filtros["entidad"])
+    if filtros.get("accion"):
+        # PostgreSQL: UPPER(accion::text) LIKE ..., con índice de expresión (migración 0016)
+        qs = qs.filter(accion__istartswith=filtros["accion"])
+    if filtros.get("id_registro") is not None:
+        qs = qs.filter(id_registro=filtros["id_registro"])
+    # Rango sobre la columna (no fecha__date) para que el índice sirva
+    if filtros.get("desde"):
+        qs = qs.filter(fecha__gte=inicio_dia(filtros["desde"]))
+    if filtros.get("hasta"):
+        qs = qs.filter(fecha__lt=inicio_dia(filtros["hasta"] + timedelta(days=1)))
+    return qs
+
+
+def pagina_bitacora(qs, cursor=None, tamano=100):
+    """Devuelve (filas, cursor_siguiente|None)."""
+    return pagina_keyset(qs, CAMPOS_LISTADO, cursor, tamano)
+
+
+def iterar_bitacora(qs, lote=2000):
+    return iterar_keyset(qs, CAMPOS_LISTADO, lote)
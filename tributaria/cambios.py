@@ -0,0 +1,133 @@
+"""
+Registro de cambios de calificaciones (feed incremental).
+
+Las altas/ediciones/borrados hechos con save()/delete() se registran por
+señales (signals.py). Los caminos masivos que no disparan señales
+(bulk_create, update) deben llamar a registrar_cambios() explícitamente.
+
+El id de CambioCalificacion no sirve como secuencia del feed: con
+transacciones concurrentes un id menor puede hacerse visible después de uno
+mayor y un cliente que ya avanzó su cursor no lo vería nunca. Las filas se
+insertan sin secuencia y, al confirmar, asignar_secuencias() numera las que
+ya son visibles, de a una asignación a la vez (fila de ContadorSecuencia
+bloqueada). Un cambio que confirma tarde recibe una secuencia mayor que todo
+lo ya asignado, así que el feed solo crece hacia adelante.
+"""
+from django.db import connection, transaction
+from django.db.models import CharField, DateTimeField, DecimalField, F, Max, Min, Value
+from django.db.models.functions import Cast, JSONObject
+from django.utils import timezone
+
+from .models import CalificacionTributaria, CambioCalificacion, ContadorSecuencia
+
+
+CAMPOS_SNAPSHOT = [f.attname for f in CalificacionTributaria._meta.concrete_fields]
+
+
+def snapshot(calificacion):
+    return {campo: getattr(calificacion, campo) for campo in CAMPOS_SNAPSHOT}
+
+
+CONTADOR = "cambios_calificaciones"
+
+
+def asignar_secuencias():
+    """
+    Numera los cambios confirmados que aún no tienen secuencia. Devuelve
+    cuántos numeró. Se llama al confirmar cada transacción que registra
+    cambios; correrla de más no hace daño.
+    """
+    with transaction.atomic():
+        contador, _ = ContadorSecuencia.objects.select_for_update().get_or_create(nombre=CONTADOR)
+        pendientes = CambioCalificacion.objects.filter(secuencia__isnull=True)
+        rango = pendientes.aggregate(minimo=Min("id"), maximo=Max("id"))
+        if rango["minimo"] is None:
+            return 0
+        # secuencia = id + desplazamiento: conserva el orden de los ids del
+        # rango y queda por encima de lo ya asignado. Solo el rango leído:
+        # un id menor que confirme entretanto espera a la próxima asignación.
+        desplazamiento = max(0, contador.valor - rango["minimo"] + 1)
+        numeradas = pendientes.filter(id__range=(rango["minimo"], rango["maximo"])).update(
+            secuencia=F("id") + desplazamiento
+        )
+        contador.valor = rango["maximo"] + desplazamiento
+        contador.save(update_fields=["valor"])
+    return numeradas
+
+
+def registrar_cambio(calificacion, operacion):
+    CambioCalificacion.objects.create(
+        calificacion_id=calificacion.pk,
+        operacion=operacion,
+        datos=None if operacion == "ELIMINAR" else snapshot(calificacion),
+    )
+    transaction.on_commit(asignar_secuencias, robust=True)
+
+
+def registrar_cambios(calificaciones, operacion, batch_size=1000):
+    """Versión masiva: un INSERT por lote en vez de uno por fila."""
+    CambioCalificacion.objects.bulk_create(
+        [
+            CambioCalificacion(
+                calificacion_id=c.pk,
+                operacion=operacion,
+                datos=None if operacion == "ELIMINAR" else snapshot(c),
+            )
+            for c in calificaciones
+        ],
+        batch_size=batch_size,
+    )
+    transaction.on_commit(asignar_secuencias, robust=True)
+
+
+def _expresion_snapshot():
+    """
+    snapshot() como expresión SQL (JSON_OBJECT / json_build_object /
+    json_object según el motor). Los decimales van como texto, igual que los
+    escribe DjangoJSONEncoder; las fechas, en el ISO 8601 del motor. En
+    SQLite (decimales como REAL) el texto no conserva los ceros finales.
+    """
+    campos = {}
+    for campo in CalificacionTributaria._meta.concrete_fields:
+        valor = F(campo.attname)
+        if isinstance(campo, DecimalField):
+            valor = Cast(valor, CharField())
+        campos[campo.attname] = valor
+    return JSONObject(**campos)
+
+
+def registrar_cambios_por_ids(ids, operacion, batch_size=1000):
+    """
+    Para UPDATE masivos: registra el estado final de las filas afectadas con
+    un INSERT ... SELECT por lote de ids; las filas no pasan por Python.
+    """
+    ids = list(ids)
+    tabla = connection.ops.quote_name(CambioCalificacion._meta.db_table)
+    columnas = ", ".join(
+        connection.ops.quote_name(CambioCalificacion._meta.get_field(c).column)
+        for c in ("calificacion_id", "operacion", "fecha", "datos")
+    )
+    ahora = timezone.now()
+    for i in range(0, len(ids), batch_size):
+        filas = CalificacionTributaria.objects.filter(id__in=ids[i:i + batch_size]).order_by("id").annotate(
+            c_operacion=Value(operacion, output_field=CharField()),
+            c_fecha=Value(ahora, output_field=DateTimeField()),
+            c_datos=_expresion_snapshot(),
+        ).values_list("id", "c_operacion", "c_fecha", "c_datos")
+        sql, params = filas.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {tabla} ({columnas}) {sql}", params)
+    transaction.on_commit(asignar_secuencias, robust=True)
+
+
+def cambios_desde(secuencia, limite=1000):
+    """
+    Cambios con secuencia > `secuencia`, en orden. Los aún sin secuencia
+    (recién confirmados, en numeración) aparecen en una llamada posterior,
+    siempre por encima de la última secuencia entregada.
+    """
+    return (
+        CambioCalificacion.objects.filter(secuencia__gt=secuencia)
+        .order_by("secuencia")
+        .values("secuencia", "calificacion_id", "operacion", "fecha", "datos")[:limite]
+    )
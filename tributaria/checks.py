@@ -0,0 +1,28 @@
+"""
+Chequeos de arranque (`manage.py check`, runserver, migrate).
+
+Versiones de datos (versiones.py), roles cacheados (cuentas/roles.py),
+reglas compiladas (reglas.py) y contadores de notificaciones viven en la
+caché por defecto: si es una caché por proceso, cada worker tiene los
+suyos y una invalidación solo llega al worker que la hizo.
+"""
+from django.conf import settings
+from django.core import checks
+
+
+CACHES_POR_PROCESO = ("django.core.cache.backends.locmem.LocMemCache",)
+
+
+@checks.register(checks.Tags.caches)
+def cache_compartida(app_configs, **kwargs):
+    backend = settings.CACHES.get("default", {}).get("BACKEND")
+    if backend in CACHES_POR_PROCESO and not getattr(settings, "CACHE_LOCAL_PERMITIDA", False):
+        return [
+            checks.Error(
+                "La caché por defecto es local a cada proceso: las invalidaciones de un worker no llegan a los demás.",
+                hint="Define CACHE_LOCATION (redis://... o una carpeta compartida), o CACHE_LOCAL_PERMITIDA=True "
+                     "si corre un solo proceso.",
+                id="tributaria.E001",
+            )
+        ]
+    return []
@@ -0,0 +1,117 @@
+"""
+Caché HTTP condicional para reportes y listados.
+
+La "firma" de los datos que muestra una vista se arma sin recorrer tablas:
+- las versiones de datos (versiones.py) de calificaciones, archivos, PDFs
+  y errores, que cambian en cada escritura (señales y caminos masivos);
+- para la bitácora, que se escribe en cada petición, su último id (una
+  lectura del índice de la PK) más la versión "bitacora", que cambia al
+  archivarla.
+Con ella se arma:
+- ETag / Last-Modified -> el navegador recibe 304 si nada cambió;
+- una clave de caché para guardar la respuesta ya renderizada.
+"""
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from config.metricas import contar_cache
+from cuentas.roles import rol_nombre
+
+from .models import Bitacora
+from .notificaciones import contar_no_leidas
+from .versiones import obtener_version
+
+
+# Tablas cuya firma es su versión de datos
+ENTIDADES = ("calificaciones", "archivos", "pdfs", "errores")
+TABLAS = (*ENTIDADES, "bitacora")
+
+
+def _desde_version(version):
+    # Las versiones son la hora (ns) de la última invalidación
+    return datetime.fromtimestamp(version / 1e9, tz=timezone.utc)
+
+
+def firma_datos(*tablas):
+    """
+    Devuelve (version:str, ultima_modificacion:datetime|None) para las tablas
+    indicadas (de TABLAS).
+    """
+    partes = []
+    fechas = []
+    for nombre in tablas:
+        if nombre == "bitacora":
+            version = obtener_version("bitacora")
+            ultima = Bitacora.objects.order_by("-id").values_list("id", "fecha").first()
+            partes.append(f"bitacora:{version}:{ultima[0] if ultima else 0}")
+            fechas.append(_desde_version(version))
+            if ultima:
+                fechas.append(ultima[1])
+        else:
+            version = obtener_version(nombre)
+            partes.append(f"{nombre}:{version}")
+            fechas.append(_desde_version(version))
+    return "|".join(partes), max(fechas, default=None)
+
+
+def respuesta_condicional(*tablas):
+    """
+    Decorador para vistas GET de solo lectura.
+
+    La respuesta cacheada depende de la versión de datos, el rol, la URL
+    completa y la sesión (la página incluye el usuario y el token CSRF del
+    formulario de cerrar sesión, por eso no se comparte entre sesiones).
+    También del contador de no leídas del badge de base.html: sale de la
+    misma caché que usa el context processor.
+    """
+    desconocidas = set(tablas) - set(TABLAS)
+    if desconocidas:
+        raise ValueError(f"Tablas sin firma: {', '.join(sorted(desconocidas))}")
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD") or len(get_messages(request)):
+                # Hay mensajes flash pendientes: la página no es reutilizable
+                return view_func(request, *args, **kwargs)
+
+            version, ultima = firma_datos(*tablas)
+            huella = "|".join([
+                view_func.__module__,
+                view_func.__name__,
+                version,
+                rol_nombre(request) or "",
+                request.get_full_path(),
+                request.session.session_key or "",
+                str(contar_no_leidas(request.user)) if request.user.is_authenticated else "",
+            ])
+            etag = '"%s"' % hashlib.sha1(huella.encode("utf-8")).hexdigest()
+            ultima_ts = int(ultima.timestamp()) if ultima else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=ultima_ts)
+            if response is None:
+                clave = f"tributaria:vista:{etag}"
+                response = cache.get(clave)
+                contar_cache("vistas", response is not None)
+                if response is None:
+                    response = view_func(request, *args, **kwargs)
+                    if response.status_code == 200 and not response.streaming:
+                        cache.set(clave, response, getattr(settings, "VISTAS_CACHE_SEGUNDOS", 300))
+
+            if response.status_code in (200, 304):
+                response["ETag"] = etag
+                if ultima_ts:
+                    response["Last-Modified"] = http_date(ultima_ts)
+                patch_cache_control(response, private=True, no_cache=True)
+                patch_vary_headers(response, ["Cookie"])
+            return response
+
+        return _wrapped_view
+    return decorator
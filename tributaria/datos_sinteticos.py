@@ -0,0 +1,171 @@
+"""
+Datos sintéticos para benchmarks y pruebas de carga.
+
+Todo con bulk_create (sin señales, sin registro de cambios) para poder
+sembrar millones de filas en minutos. NO usar contra la base real.
+"""
+import random
+from decimal import Decimal
+
+from django.db import transaction
+
+from cuentas.models import Rol, Usuario
+
+from .emisores import completar_campos
+from .models import (
+    ArchivoTributario,
+    Bitacora,
+    CalificacionTributaria,
+    Emisor,
+    ErrorValidacion,
+    Notificacion,
+)
+from .rut import dv_de, formatear
+
+
+LOTE = 5000
+
+ROLES = ("Corredor", "Analista", "Auditor", "Administrador", "Gerente")
+ESTADOS = ("BORRADOR", "VALIDADA", "PUBLICADA")
+CONTRASENA = "benchmark"
+
+
+def _en_lotes(modelo, generador):
+    creados = 0
+    lote = []
+    for obj in generador:
+        lote.append(obj)
+        if len(lote) >= LOTE:
+            modelo.objects.bulk_create(lote, batch_size=LOTE)
+            creados += len(lote)
+            lote = []
+    if lote:
+        modelo.objects.bulk_create(lote, batch_size=LOTE)
+        creados += len(lote)
+    return creados
+
+
+def crear_usuarios():
+    """Un usuario por rol: bench_<rol> / CONTRASENA. Devuelve {rol: usuario}."""
+    usuarios = {}
+    for nombre in ROLES:
+        rol, _ = Rol.objects.get_or_create(nombre=nombre)
+        usuario = Usuario.objects.filter(username=f"bench_{nombre.lower()}").first()
+        if usuario is None:
+            usuario = Usuario.objects.create_user(
+                username=f"bench_{nombre.lower()}", password=CONTRASENA, rol=rol, is_staff=nombre == "Administrador"
+            )
+        usuarios[nombre] = usuario
+    return usuarios
+
+
+@transaction.atomic
+def sembrar(calificaciones, semilla=1, progreso=None):
+    """
+    Crea `calificaciones` calificaciones y, en proporción:
+    emisores (1 cada 100, mínimo 50), bitácora (1 por calificación),
+    archivos (1 cada 1000) con errores de validación (1 cada 10 calificaciones)
+    y notificaciones (1 cada 10). Devuelve un dict con lo creado.
+    """
+    aleatorio = random.Random(semilla)
+    aviso = progreso or (lambda texto: None)
+    usuarios = crear_usuarios()
+    lista_usuarios = list(usuarios.values())
+
+    n_emisores = max(50, calificaciones // 100)
+    desde = (Emisor.objects.order_by("-id").values_list("id", flat=True).first() or 0) + 1
+    _en_lotes(
+        Emisor,
+        (
+            # bulk_create no pasa por pre_save: rut_cuerpo/nombre_busqueda a mano
+            completar_campos(Emisor(nombre=f"Emisor {i}", rut=formatear(76000000 + i, dv_de(76000000 + i))))
+            for i in range(desde, desde + n_emisores)
+        ),
+    )
+    emisores = list(Emisor.objects.order_by("-id").values_list("id", flat=True)[:n_emisores])
+    aviso(f"{n_emisores} emisores")
+
+    def generar_calificaciones():
+        for i in range(calificaciones):
+            monto = Decimal(aleatorio.randint(10_000, 50_000_000))
+            factor = Decimal(aleatorio.randint(1, 100_000)) / Decimal(100_000)
+            yield CalificacionTributaria(
+                emisor_id=aleatorio.choice(emisores),
+                corredor=f"corredor{i % 200}",
+                instrumento=aleatorio.choice(("ACCION", "BONO", "FONDO")),
+                anio_tributario=aleatorio.randint(2015, 2025),
+                monto=monto,
+                factor=factor,
+                monto_calificado=(monto * factor).quantize(Decimal("0.01")),
+                fuente="BENCHMARK",
+                estado=aleatorio.choice(ESTADOS),
+            )
+
+    _en_lotes(CalificacionTributaria, generar_calificaciones())
+    aviso(f"{calificaciones} calificaciones")
+
+    _en_lotes(
+        Bitacora,
+        (
+            Bitacora(
+                usuario=aleatorio.choice(lista_usuarios),
+                accion=aleatorio.choice(("Crear calificación", "Editar calificación", "Carga masiva de archivo")),
+                entidad=aleatorio.choice(("CalificacionTributaria", "ArchivoTributario")),
+                id_registro=aleatorio.randint(1, max(1, calificaciones)),
+                detalle="",
+            )
+            for _ in range(calificaciones)
+        ),
+    )
+    aviso(f"{calificaciones} entradas de bitácora")
+
+    n_archivos = max(1, calificaciones // 1000)
+    _en_lotes(
+        ArchivoTributario,
+        (
+            ArchivoTributario(
+                tipo_archivo="CSV",
+                archivo=f"archivos_tributarios/bench_{i}.csv",
+                nombre_original=f"bench_{i}.csv",
+                usuario=aleatorio.choice(lista_usuarios),
+                estado="CON_ERRORES",
+            )
+            for i in range(n_archivos)
+        ),
+    )
+    archivos = list(ArchivoTributario.objects.order_by("-id").values_list("id", flat=True)[:n_archivos])
+
+    n_errores = calificaciones // 10
+    _en_lotes(
+        ErrorValidacion,
+        (
+            ErrorValidacion(archivo_id=aleatorio.choice(archivos), nro_linea=i + 2, mensaje="monto_bruto no es numérico")
+            for i in range(n_errores)
+        ),
+    )
+    aviso(f"{n_archivos} archivos, {n_errores} errores de validación")
+
+    n_notificaciones = calificaciones // 10
+    _en_lotes(
+        Notificacion,
+        (
+            Notificacion(
+                usuario=aleatorio.choice(lista_usuarios),
+                mensaje=f"Notificación {i}",
+                nivel=aleatorio.choice(("INFO", "WARNING", "ERROR")),
+                leida=aleatorio.random() < 0.7,
+            )
+            for i in range(n_notificaciones)
+        ),
+    )
+    aviso(f"{n_notificaciones} notificaciones")
+
+    return {
+        "emisores": n_emisores,
+        "calificaciones": calificaciones,
+        "bitacora": calificaciones,
+        "archivos": n_archivos,
+        "errores": n_errores,
+        "notificaciones": n_notificaciones,
+        "usuarios": usuarios,
+    }
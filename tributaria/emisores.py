@@ -0,0 +1,77 @@
+"""
+Emisores: RUT canónico y búsqueda por nombre.
+
+- Emisor.rut_cuerpo (entero indexado) + rut_dv se completan al guardar
+  (señal pre_save; bulk_create llama a completar_campos a mano). Así
+  "76.123.456-7" y "761234567" son el mismo emisor.
+- Emisor.nombre_busqueda = nombre en minúsculas, sin tildes ni espacios
+  repetidos. Se busca por "contiene" en todas las bases, como el
+  icontains sobre el nombre de antes. En PostgreSQL lo resuelve el índice
+  trigrama (pg_trgm) que crea la migración 0012, sin recorrer la tabla; en
+  las demás bases se recorre la columna (un índice B-tree no sirve para
+  "contiene", por eso la columna no lleva db_index).
+"""
+import re
+import unicodedata
+
+from django.db.models import Q
+
+from . import rut as rut_lib
+from .models import Emisor
+
+
+_RE_ESPACIOS = re.compile(r"\s+")
+
+
+def normalizar_nombre(nombre):
+    sin_tildes = unicodedata.normalize("NFKD", str(nombre or ""))
+    sin_tildes = "".join(c for c in sin_tildes if not unicodedata.combining(c))
+    largo = Emisor._meta.get_field("nombre_busqueda").max_length
+    return _RE_ESPACIOS.sub(" ", sin_tildes).strip().lower()[:largo]
+
+
+def completar_campos(emisor):
+    """Rellena rut canónico, rut_cuerpo/rut_dv y nombre_busqueda (no guarda)."""
+    normalizado = rut_lib.normalizar(emisor.rut)
+    if normalizado is not None:
+        emisor.rut_cuerpo, emisor.rut_dv = normalizado
+        emisor.rut = rut_lib.formatear(*normalizado)
+    else:
+        emisor.rut_cuerpo, emisor.rut_dv = None, ""
+    emisor.nombre_busqueda = normalizar_nombre(emisor.nombre)
+    return emisor
+
+
+def _q_nombre(texto, prefijo):
+    return Q(**{f"{prefijo}nombre_busqueda__contains": texto})
+
+
+def filtrar_por_nombre(qs, texto, prefijo=""):
+    """
+    Filtra `qs` por nombre de emisor. `prefijo` es el camino hasta el
+    emisor ("emisor__" para calificaciones).
+    """
+    texto = normalizar_nombre(texto)
+    if not texto:
+        return qs
+    return qs.filter(_q_nombre(texto, prefijo))
+
+
+def filtrar_emisor(qs, texto, prefijo=""):
+    """Como filtrar_por_nombre, pero si `texto` es un RUT también busca por rut_cuerpo."""
+    normalizado = rut_lib.normalizar(texto)
+    if normalizado is None:
+        return filtrar_por_nombre(qs, texto, prefijo)
+    condicion = Q(**{f"{prefijo}rut_cuerpo": normalizado[0]}) | _q_nombre(normalizar_nombre(texto), prefijo)
+    return qs.filter(condicion)
+
+
+def obtener_o_crear(rut, nombre):
+    """get_or_create por RUT canónico (o por el texto tal cual si no es un RUT)."""
+    normalizado = rut_lib.normalizar(rut)
+    if normalizado is None:
+        return Emisor.objects.get_or_create(rut=str(rut).strip(), rut_cuerpo=None, defaults={"nombre": nombre})
+    existente = Emisor.objects.filter(rut_cuerpo=normalizado[0]).order_by("id").first()
+    if existente is not None:
+        return existente, False
+    return Emisor.objects.create(rut=rut_lib.formatear(*normalizado), nombre=nombre), True
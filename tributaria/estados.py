@@ -0,0 +1,109 @@
+"""
+Cambios de estado masivos de calificaciones (validar, publicar, rechazar).
+
+Sin instanciar modelos: por cada lote de hasta `lote` ids (recorridos por
+id ascendente) se hace, en una transacción corta,
+
+  1. SELECT ... FOR UPDATE de los ids que siguen en un estado de origen
+     permitido (en SQLite, sin FOR UPDATE, la escritura ya es exclusiva);
+  2. un UPDATE ... SET estado = destino WHERE id IN (...) AND estado IN
+     (orígenes): la condición de origen se vuelve a exigir en el UPDATE;
+  3. las entradas de bitácora y del registro de cambios del lote, con
+     bulk_create (update() no dispara señales).
+
+Así una fila que otro usuario ya movió no se pisa, y un lote que falla no
+deja el estado cambiado sin su rastro de auditoría.
+"""
+from dataclasses import dataclass
+
+from django.db import transaction
+
+from .cambios import registrar_cambios_por_ids
+from .models import Bitacora
+from .versiones import invalidar
+
+
+@dataclass(frozen=True)
+class Transicion:
+    verbo: str       # "Validar", para bitácora y mensajes
+    destino: str
+    origenes: tuple
+
+
+# La carga masiva y la subida de PDF crean las calificaciones en PENDIENTE
+TRANSICIONES = {
+    "validar": Transicion("Validar", "VALIDADA", ("BORRADOR", "PENDIENTE")),
+    "publicar": Transicion("Publicar", "PUBLICADA", ("VALIDADA",)),
+    "rechazar": Transicion("Rechazar", "RECHAZADA", ("BORRADOR", "PENDIENTE", "VALIDADA")),
+}
+
+
+@dataclass
+class ResultadoTransicion:
+    accion: str
+    candidatas: int = 0      # filas del filtro que estaban en un estado de origen
+    cambiadas: int = 0
+    lotes: int = 0
+
+    @property
+    def omitidas(self):
+        """Cambiaron de estado entre la lectura y el UPDATE (otro usuario)."""
+        return self.candidatas - self.cambiadas
+
+
+def cambiar_estado(qs, accion, usuario=None, lote=1000, simular=False):
+    """
+    Aplica la transición `accion` (clave de TRANSICIONES) a las calificaciones
+    de `qs` que estén en un estado de origen permitido; las demás no se tocan.
+    Con `simular` solo cuenta cuántas cambiarían.
+    """
+    transicion = TRANSICIONES[accion]
+    resultado = ResultadoTransicion(accion)
+    qs = qs.filter(estado__in=transicion.origenes).order_by("pk")
+
+    if simular:
+        resultado.candidatas = qs.count()
+        return resultado
+
+    modelo = qs.model
+    desde = 0
+    try:
+        while True:
+            with transaction.atomic(using=qs.db):
+                ids = list(
+                    qs.filter(pk__gt=desde)
+                    .select_for_update(of=("self",))
+                    .values_list("pk", flat=True)[:lote]
+                )
+                if not ids:
+                    break
+                desde = ids[-1]
+                resultado.candidatas += len(ids)
+
+                cambiadas = modelo.objects.filter(pk__in=ids, estado__in=transicion.origenes).update(
+                    estado=transicion.destino
+                )
+                if cambiadas != len(ids):
+                    # Alguna fila cambió entre el SELECT y el UPDATE (backend sin FOR UPDATE)
+                    ids = list(modelo.objects.filter(pk__in=ids, estado=transicion.destino).values_list("pk", flat=True))
+                resultado.cambiadas += len(ids)
+                resultado.lotes += 1
+
+                Bitacora.objects.bulk_create(
+                    [
+                        Bitacora(
+                            usuario=usuario,
+                            accion=f"{transicion.verbo} calificación (masivo)",
+                            entidad="CalificacionTributaria",
+                            id_registro=id_calificacion,
+                            detalle=f"Estado -> {transicion.destino}",
+                        )
+                        for id_calificacion in ids
+                    ],
+                    batch_size=500,
+                )
+                registrar_cambios_por_ids(ids, "ACTUALIZAR", batch_size=len(ids) or 1)
+    finally:
+        if resultado.cambiadas:
+            invalidar("calificaciones")
+    return resultado
@@ -0,0 +1,139 @@
+"""
+Eventos en vivo (server-sent events) sobre ASGI.
+
+- Progreso de carga de un ArchivoTributario: canal "archivo:<id>".
+- Notificaciones nuevas de un usuario: canal "usuario:<id>".
+
+El bus por defecto vive en memoria del proceso: sirve cuando la carga y el
+navegador caen en el mismo proceso ASGI (uvicorn/daphne). Para varios
+procesos se reemplaza por otra clase con la misma interfaz
+(publicar / ultimo / olvidar / suscribir / desuscribir) vía settings.EVENTOS_BUS.
+"""
+import asyncio
+import json
+import threading
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+
+class BusEnMemoria:
+    """
+    Pub/sub en memoria. `publicar` se puede llamar desde código síncrono
+    (otro hilo); los suscriptores son colas asyncio de su propio event loop.
+    El último evento se recuerda solo para los `maximo_ultimos` canales
+    publicados más recientemente: quien se suscribe a un canal olvidado arma
+    su estado inicial desde la BD.
+    """
+
+    def __init__(self, maximo_ultimos=None):
+        self._suscriptores = defaultdict(set)
+        self._ultimo = OrderedDict()
+        self._maximo_ultimos = maximo_ultimos or getattr(settings, "EVENTOS_ULTIMOS_MAX", 1000)
+        self._lock = threading.Lock()
+
+    def publicar(self, canal, tipo, datos):
+        evento = {"tipo": tipo, "datos": datos}
+        with self._lock:
+            self._ultimo[canal] = evento
+            self._ultimo.move_to_end(canal)
+            while len(self._ultimo) > self._maximo_ultimos:
+                self._ultimo.popitem(last=False)
+            suscriptores = list(self._suscriptores.get(canal, ()))
+
+        for loop, cola in suscriptores:
+            try:
+                loop.call_soon_threadsafe(cola.put_nowait, evento)
+            except RuntimeError:
+                # El loop del suscriptor ya se cerró
+                pass
+
+    def ultimo(self, canal):
+        with self._lock:
+            return self._ultimo.get(canal)
+
+    def olvidar(self, canal):
+        with self._lock:
+            self._ultimo.pop(canal, None)
+
+    def suscribir(self, canal):
+        """Debe llamarse desde el event loop del suscriptor. Devuelve la cola."""
+        cola = asyncio.Queue()
+        with self._lock:
+            self._suscriptores[canal].add((asyncio.get_running_loop(), cola))
+        return cola
+
+    def desuscribir(self, canal, cola):
+        with self._lock:
+            suscriptores = self._suscriptores.get(canal, set())
+            for entrada in [e for e in suscriptores if e[1] is cola]:
+                suscriptores.discard(entrada)
+            if not suscriptores:
+                self._suscriptores.pop(canal, None)
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def obtener_bus():
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            _bus = import_string(getattr(settings, "EVENTOS_BUS", "tributaria.eventos.BusEnMemoria"))()
+        return _bus
+
+
+def canal_archivo(archivo_id):
+    return f"archivo:{archivo_id}"
+
+
+def canal_usuario(usuario_id):
+    return f"usuario:{usuario_id}"
+
+
+def publicar_progreso(archivo_id, filas, total, ok, errores, fin=False):
+    obtener_bus().publicar(
+        canal_archivo(archivo_id),
+        "fin" if fin else "progreso",
+        {"archivo": archivo_id, "filas": filas, "total": total, "ok": ok, "errores": errores},
+    )
+
+
+def formatear_sse(tipo, datos):
+    return f"event: {tipo}\ndata: {json.dumps(datos, cls=DjangoJSONEncoder)}\n\n"
+
+
+async def flujo_sse(canal, estado_inicial=None, terminar_con=("fin",)):
+    """
+    Generador asíncrono de texto SSE para un canal.
+    `estado_inicial` es una corrutina que devuelve (tipo, datos) o None; se
+    consulta DESPUÉS de suscribirse para no perder eventos intermedios.
+    """
+    bus = obtener_bus()
+    espera = getattr(settings, "EVENTOS_KEEPALIVE_SEGUNDOS", 15)
+
+    cola = bus.suscribir(canal)
+    try:
+        if estado_inicial is not None:
+            inicial = await estado_inicial()
+            if inicial is not None:
+                yield formatear_sse(*inicial)
+                if inicial[0] in terminar_con:
+                    return
+
+        while True:
+            try:
+                evento = await asyncio.wait_for(cola.get(), timeout=espera)
+            except asyncio.TimeoutError:
+                # Comentario SSE: mantiene viva la conexión a través de proxies
+                yield ": ping\n\n"
+                continue
+
+            yield formatear_sse(evento["tipo"], evento["datos"])
+            if evento["tipo"] in terminar_con:
+                return
+    finally:
+        bus.desuscribir(canal, cola)
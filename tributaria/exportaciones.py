@@ -0,0 +1,247 @@
+"""
+Exportaciones de calificaciones encoladas.
+
+La vista solo registra la solicitud (ExportacionCalificaciones en PENDIENTE);
+el comando `manage.py procesar_exportaciones` la toma, escribe el Excel en
+media/exportaciones/ y notifica al usuario con el enlace de descarga.
+Solicitudes idénticas (mismos filtros, mismos datos) dentro de la ventana
+EXPORTACION_REUTILIZAR_MINUTOS reutilizan el archivo ya generado; la huella
+se calcula al generar, con los datos que realmente lleva el archivo.
+Una exportación que quedó en PROCESANDO más de EXPORTACION_TIMEOUT_MINUTOS
+(worker caído) se vuelve a tomar, hasta EXPORTACION_MAX_INTENTOS veces.
+"""
+import hashlib
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import F, Max, Q
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils import timezone
+
+from config import metricas
+from config.routers import lectura_en
+
+from .emisores import filtrar_emisor
+from .models import CalificacionTributaria, CambioCalificacion, ExportacionCalificaciones, Notificacion
+from .versiones import obtener_version
+
+
+COLUMNAS_EXCEL = [
+    "ID", "Emisor", "Corredor", "Año tributario", "Monto",
+    "Factor", "Monto calificado", "Estado", "Fuente",
+]
+
+
+def aplicar_filtros(qs, filtros):
+    """Filtros del listado de calificaciones (FiltroCalificacionForm.cleaned_data)."""
+    if filtros.get("anio_tributario"):
+        qs = qs.filter(anio_tributario=filtros["anio_tributario"])
+    if filtros.get("corredor"):
+        qs = qs.filter(corredor__icontains=filtros["corredor"])
+    if filtros.get("emisor"):
+        qs = filtrar_emisor(qs, filtros["emisor"], prefijo="emisor__")
+    if filtros.get("estado"):
+        qs = qs.filter(estado=filtros["estado"])
+    return qs
+
+
+def _filtros_limpios(filtros):
+    return {k: v for k, v in sorted((filtros or {}).items()) if v not in (None, "")}
+
+
+def calcular_huella(filtros):
+    """
+    Huella = filtros normalizados + última secuencia del registro de cambios
+    + versión de emisores (el Excel lleva nombre y RUT del emisor, y renombrar
+    uno no pasa por el registro de cambios). Si algo cambió, la huella cambia
+    y no se reutiliza el archivo.
+    """
+    ultima = CambioCalificacion.objects.aggregate(m=Max("id"))["m"] or 0
+    crudo = json.dumps([_filtros_limpios(filtros), ultima, obtener_version("emisores")], sort_keys=True)
+    return hashlib.sha256(crudo.encode("utf-8")).hexdigest()
+
+
+def _ventana():
+    minutos = getattr(settings, "EXPORTACION_REUTILIZAR_MINUTOS", 15)
+    return timezone.now() - timedelta(minutes=minutos)
+
+
+def buscar_reutilizable(huella):
+    return (
+        ExportacionCalificaciones.objects.filter(
+            huella=huella,
+            estado="LISTA",
+            fecha_fin__gte=_ventana(),
+        )
+        .exclude(archivo="")
+        .order_by("-fecha_fin")
+        .first()
+    )
+
+
+def solicitar_exportacion(usuario, filtros):
+    """Encola una exportación. Devuelve la ExportacionCalificaciones creada."""
+    return ExportacionCalificaciones.objects.create(usuario=usuario, filtros=_filtros_limpios(filtros))
+
+
+def _notificar_lista(exportacion):
+    Notificacion.objects.create(
+        usuario=exportacion.usuario,
+        mensaje=f"Exportación #{exportacion.id} lista ({exportacion.filas} filas).",
+        nivel="INFO",
+        enlace=reverse("descargar_exportacion", args=[exportacion.id]),
+    )
+
+
+def escribir_excel(qs, destino):
+    """
+    Escribe el Excel fila a fila (openpyxl en modo write_only + iterator),
+    sin cargar el listado completo en memoria. `destino` es una ruta o un
+    archivo abierto. Devuelve la cantidad de filas.
+    """
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    hoja = wb.create_sheet("Calificaciones")
+    hoja.append(COLUMNAS_EXCEL)
+
+    filas = 0
+    columnas = qs.values_list(
+        "id", "emisor__nombre", "emisor__rut", "corredor", "anio_tributario",
+        "monto", "factor", "monto_calificado", "estado", "fuente",
+    )
+    for (id_, nombre, rut, corredor, anio, monto, factor, monto_calif, estado, fuente) in columnas.iterator(chunk_size=2000):
+        hoja.append([
+            id_,
+            f"{nombre} ({rut})",
+            corredor,
+            anio,
+            float(monto),
+            float(factor),
+            float(monto_calif),
+            estado,
+            fuente or "",
+        ])
+        filas += 1
+
+    wb.save(destino)
+    return filas
+
+
+def _medir(modo, resultado, filas=None, tamano=None):
+    metricas.incrementar("nuam_exportaciones_total", modo=modo, resultado=resultado)
+    if filas is not None:
+        metricas.observar("nuam_exportacion_filas", filas, modo=modo)
+    if tamano is not None:
+        metricas.observar("nuam_exportacion_bytes", tamano, modo=modo)
+
+
+def exportar_calificaciones_excel(qs):
+    """Excel generado dentro de la petición (listados hasta EXPORTACION_MAX_SINCRONA filas)."""
+    buffer = io.BytesIO()
+    filas = escribir_excel(qs.order_by("id"), buffer)
+    _medir("sincrona", "lista", filas, buffer.tell())
+    buffer.seek(0)
+    response = HttpResponse(
+        buffer,
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    )
+    response["Content-Disposition"] = 'attachment; filename="calificaciones.xlsx"'
+    return response
+
+
+def procesar_exportacion(exportacion):
+    """Genera (o reutiliza) el archivo de una exportación ya tomada por el worker."""
+    # Huella antes de leer los datos y de la misma base que el Excel: si algo
+    # cambia mientras se genera, la próxima solicitud tendrá otra huella
+    with lectura_en("replica"):
+        exportacion.huella = calcular_huella(exportacion.filtros)
+    previa = buscar_reutilizable(exportacion.huella)
+    if previa is not None:
+        exportacion.archivo.name = previa.archivo.name
+        exportacion.filas = previa.filas
+        exportacion.mensaje = f"Reutiliza exportación #{previa.id}."
+    else:
+        qs = aplicar_filtros(CalificacionTributaria.objects.order_by("id"), exportacion.filtros)
+        fd, ruta_tmp = tempfile.mkstemp(suffix=".xlsx")
+        os.close(fd)
+        try:
+            # La consulta grande va a la réplica, si hay (config/routers.py)
+            with lectura_en("replica"):
+                exportacion.filas = escribir_excel(qs, ruta_tmp)
+            with open(ruta_tmp, "rb") as f:
+                exportacion.archivo.save(f"calificaciones_{exportacion.id}.xlsx", File(f), save=False)
+        finally:
+            os.remove(ruta_tmp)
+
+    exportacion.estado = "LISTA"
+    exportacion.fecha_fin = timezone.now()
+    exportacion.save(update_fields=["huella", "archivo", "filas", "mensaje", "estado", "fecha_fin"])
+    if previa is not None:
+        _medir("segundo_plano", "reutilizada")
+    else:
+        _medir("segundo_plano", "lista", exportacion.filas, exportacion.archivo.size)
+    _notificar_lista(exportacion)
+
+
+def _fallar(exportacion, mensaje):
+    exportacion.estado = "ERROR"
+    exportacion.mensaje = mensaje
+    exportacion.fecha_fin = timezone.now()
+    exportacion.save(update_fields=["estado", "mensaje", "fecha_fin"])
+    _medir("segundo_plano", "error")
+    Notificacion.objects.create(
+        usuario=exportacion.usuario,
+        mensaje=f"Exportación #{exportacion.id} falló: {mensaje}"[:255],
+        nivel="ERROR",
+    )
+
+
+def tomar_pendiente():
+    """
+    Marca como PROCESANDO la exportación pendiente (o abandonada) más antigua.
+    El UPDATE condicionado al estado y a la fecha de toma leídos evita que
+    dos workers tomen la misma.
+    """
+    vencidas = timezone.now() - timedelta(minutes=getattr(settings, "EXPORTACION_TIMEOUT_MINUTOS", 60))
+    candidatas = ExportacionCalificaciones.objects.filter(
+        Q(estado="PENDIENTE") | Q(estado="PROCESANDO", fecha_toma__lt=vencidas)
+    ).order_by("id")[:10]
+    for exportacion in candidatas:
+        ahora = timezone.now()
+        tomadas = ExportacionCalificaciones.objects.filter(
+            id=exportacion.id, estado=exportacion.estado, fecha_toma=exportacion.fecha_toma
+        ).update(estado="PROCESANDO", fecha_toma=ahora, intentos=F("intentos") + 1)
+        if not tomadas:
+            continue
+        abandonada = exportacion.estado == "PROCESANDO"
+        exportacion.estado, exportacion.fecha_toma = "PROCESANDO", ahora
+        exportacion.intentos += 1
+        if exportacion.intentos > getattr(settings, "EXPORTACION_MAX_INTENTOS", 3):
+            _fallar(exportacion, f"Se abandonó {exportacion.intentos - 1} veces sin terminar.")
+            continue
+        if abandonada:
+            metricas.incrementar("nuam_exportaciones_total", modo="segundo_plano", resultado="reintentada")
+        return exportacion
+    return None
+
+
+def procesar_pendientes(maximo=None):
+    """Procesa exportaciones pendientes. Devuelve cuántas se procesaron."""
+    hechas = 0
+    while maximo is None or hechas < maximo:
+        exportacion = tomar_pendiente()
+        if exportacion is None:
+            break
+        try:
+            procesar_exportacion(exportacion)
+        except Exception as e:
+            _fallar(exportacion, str(e))
+        hechas += 1
+    return hechas
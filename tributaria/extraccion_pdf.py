@@ -0,0 +1,33 @@
+"""
+Extracción de datos desde el PDF de un certificado tributario.
+
+PyPDF2 se importa al usarse, no al cargar las vistas.
+"""
+import re
+import time
+
+from config import metricas
+
+
+def extraer_datos_desde_pdf(ruta_pdf):
+    from PyPDF2 import PdfReader
+
+    inicio = time.perf_counter()
+    try:
+        reader = PdfReader(ruta_pdf)
+        texto = "\n".join((page.extract_text() or "") for page in reader.pages)
+    finally:
+        metricas.observar("nuam_pdf_extraccion_segundos", time.perf_counter() - inicio)
+
+    def buscar(patron):
+        m = re.search(patron, texto, re.IGNORECASE | re.DOTALL)
+        return m.group(1).strip() if m else None
+
+    datos = {
+        "rut_emisor": buscar(r"RUT\s+Emisor\s+([\d\.\-Kk]+)"),
+        "nombre_emisor": buscar(r"Nombre\s+Emisor\s+([^\n]+)"),
+        "anio_tributario": buscar(r"Año\s+Tributario\s+([0-9]{4})"),
+        "monto_bruto": buscar(r"Monto\s+Bruto\s+\$?([\d\.\,]+)"),
+        "factor": buscar(r"Factor\s+([\d\.\,]+)"),
+    }
+    return datos
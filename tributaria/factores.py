@@ -0,0 +1,230 @@
+"""
+Factores y monto calificado.
+
+monto_calificado = monto * factor, redondeado a centavos con la mitad hacia
+arriba (lo mismo que ROUND de PostgreSQL/MySQL sobre NUMERIC). En Python se
+calcula con Decimal (calcular_monto_calificado); nunca con float.
+
+Cuando el SII corrige factores de un año:
+
+1. cargar_tabla() guarda el archivo (emisor, año) -> factor en FactorEmisor
+   con un upsert (bulk_create ... ON CONFLICT).
+2. recalcular() ajusta las calificaciones de esos años con UPDATE por lotes
+   de ids, sin traer filas a Python:
+
+    UPDATE calificacion SET factor = (SELECT factor FROM factor_emisor WHERE
+               emisor_id = calificacion.emisor_id AND anio = calificacion.anio),
+           monto_calificado = ROUND(monto * (SELECT ...), 2)
+    WHERE id IN (lote de ids con anio IN (...) y factor o monto distinto)
+
+   La subconsulta lee por el índice único (emisor, año): el costo crece con
+   las filas, no con el tamaño de la tabla de factores. Cada lote registra
+   sus cambios con un INSERT ... SELECT (registrar_cambios_por_ids: update()
+   no dispara señales y las filas no vuelven a Python).
+
+En SQLite los decimales se guardan como REAL, así que el UPDATE multiplica
+en punto flotante; el cálculo exacto es el de PostgreSQL/MySQL.
+"""
+import csv
+import logging
+import time
+from dataclasses import dataclass, field
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DecimalField, Exists, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Round
+
+from .auditoria import registrar_bitacora
+from .cambios import registrar_cambios_por_ids
+from .models import CalificacionTributaria, Emisor, FactorEmisor
+from .rut import normalizar
+from .versiones import invalidar
+
+
+logger = logging.getLogger(__name__)
+
+_CAMPO_MONTO = CalificacionTributaria._meta.get_field("monto")
+_CAMPO_FACTOR = CalificacionTributaria._meta.get_field("factor")
+_CAMPO_CALIFICADO = CalificacionTributaria._meta.get_field("monto_calificado")
+
+EXPONENTE_MONTO = Decimal(1).scaleb(-_CAMPO_MONTO.decimal_places)
+CENTAVOS = Decimal(1).scaleb(-_CAMPO_CALIFICADO.decimal_places)
+EXPONENTE_FACTOR = Decimal(1).scaleb(-_CAMPO_FACTOR.decimal_places)
+
+COLUMNAS_TABLA = ("rut_emisor", "anio_tributario", "factor")
+
+
+class TablaFactoresInvalida(ValueError):
+    def __init__(self, errores):
+        super().__init__("; ".join(errores))
+        self.errores = errores
+
+
+def cuantizar(valor, exponente):
+    """Número (o texto) -> Decimal con los decimales del campo, mitad hacia arriba."""
+    return Decimal(str(valor)).quantize(exponente, rounding=ROUND_HALF_UP)
+
+
+def calcular_monto_calificado(monto, factor):
+    """monto y factor ya con los decimales de sus campos (ver cuantizar)."""
+    return (monto * factor).quantize(CENTAVOS, rounding=ROUND_HALF_UP)
+
+
+# ===================================================
+# Tabla de factores
+# ===================================================
+
+def leer_tabla(ruta):
+    """
+    CSV (separado por "," o ";") con columnas rut_emisor, anio_tributario y
+    factor. Devuelve {(cuerpo_rut, año): factor}. Si alguna línea no sirve
+    lanza TablaFactoresInvalida con todos los errores: la tabla se aplica
+    completa o no se aplica.
+    """
+    with open(ruta, newline="", encoding="utf-8-sig") as f:
+        muestra = f.read(4096)
+        f.seek(0)
+        separador = ";" if muestra.count(";") > muestra.count(",") else ","
+        lector = csv.DictReader(f, delimiter=separador)
+        lector.fieldnames = [str(c).strip().lower().replace(" ", "_") for c in lector.fieldnames or []]
+        faltantes = [c for c in COLUMNAS_TABLA if c not in lector.fieldnames]
+        if faltantes:
+            raise TablaFactoresInvalida([f"Faltan columnas: {', '.join(faltantes)}"])
+
+        tabla, errores = {}, []
+        for nro_linea, fila in enumerate(lector, start=2):
+            rut = normalizar(fila["rut_emisor"])
+            try:
+                anio = int(str(fila["anio_tributario"]).strip())
+                factor = Decimal(str(fila["factor"]).strip().replace(",", "."))
+            except (ValueError, InvalidOperation):
+                errores.append(f"Línea {nro_linea}: año o factor no numérico")
+                continue
+            if rut is None:
+                errores.append(f"Línea {nro_linea}: rut_emisor no tiene formato de RUT")
+            elif not factor.is_finite() or factor <= 0:
+                errores.append(f"Línea {nro_linea}: el factor debe ser mayor a 0")
+            elif factor != factor.quantize(EXPONENTE_FACTOR, rounding=ROUND_HALF_UP) or factor.adjusted() >= (
+                _CAMPO_FACTOR.max_digits - _CAMPO_FACTOR.decimal_places
+            ):
+                errores.append(
+                    f"Línea {nro_linea}: factor fuera de lo que admite la columna "
+                    f"({_CAMPO_FACTOR.max_digits} dígitos, {_CAMPO_FACTOR.decimal_places} decimales)"
+                )
+            elif tabla.setdefault((rut[0], anio), factor) != factor:
+                errores.append(f"Línea {nro_linea}: el emisor {rut[0]} ya tiene otro factor para {anio}")
+    if errores:
+        raise TablaFactoresInvalida(errores)
+    return tabla
+
+
+def cargar_tabla(tabla, usuario=None, lote=1000):
+    """
+    Guarda `tabla` ({(cuerpo_rut, año): factor}) en FactorEmisor, para todos
+    los emisores con ese RUT. Devuelve (pares guardados, cuerpos sin emisor).
+    """
+    ids_por_cuerpo = {}
+    cuerpos = {cuerpo for cuerpo, _ in tabla}
+    for id_emisor, cuerpo in Emisor.objects.filter(rut_cuerpo__in=cuerpos).values_list("id", "rut_cuerpo"):
+        ids_por_cuerpo.setdefault(cuerpo, []).append(id_emisor)
+    factores = [
+        FactorEmisor(emisor_id=id_emisor, anio_tributario=anio, factor=factor, usuario_modificacion=usuario)
+        for (cuerpo, anio), factor in sorted(tabla.items())
+        for id_emisor in ids_por_cuerpo.get(cuerpo, ())
+    ]
+    FactorEmisor.objects.bulk_create(
+        factores,
+        batch_size=lote,
+        update_conflicts=True,
+        unique_fields=["emisor", "anio_tributario"],
+        update_fields=["factor", "fecha_modificacion", "usuario_modificacion"],
+    )
+    return len(factores), sorted(cuerpos - set(ids_por_cuerpo))
+
+
+# ===================================================
+# Recálculo
+# ===================================================
+
+@dataclass
+class ResultadoRecalculo:
+    anios: list = field(default_factory=list)
+    filas: int = 0
+    lotes: int = 0
+    diferencia: Decimal = Decimal("0")  # suma de (monto_calificado nuevo - anterior)
+    segundos: float = 0.0
+
+    def resumen(self):
+        return (
+            f"{self.filas} calificaciones recalculadas en {self.lotes} lotes ({self.segundos:.1f} s) "
+            f"para los años {', '.join(map(str, self.anios)) or '-'}; "
+            f"diferencia total de monto calificado: {self.diferencia}"
+        )
+
+
+def _expresiones():
+    """(hay factor en la tabla, factor de la tabla, monto calificado con ese factor)."""
+    del_emisor = FactorEmisor.objects.filter(emisor_id=OuterRef("emisor_id"), anio_tributario=OuterRef("anio_tributario"))
+    factor = Subquery(
+        del_emisor.values("factor"),
+        output_field=DecimalField(max_digits=_CAMPO_FACTOR.max_digits, decimal_places=_CAMPO_FACTOR.decimal_places),
+    )
+    monto = Round(
+        F("monto") * factor,
+        _CAMPO_CALIFICADO.decimal_places,
+        output_field=DecimalField(max_digits=_CAMPO_CALIFICADO.max_digits, decimal_places=_CAMPO_CALIFICADO.decimal_places),
+    )
+    return Exists(del_emisor), factor, monto
+
+
+def recalcular(anios, usuario=None, qs=None, lote=None, simular=False):
+    """
+    Lleva factor y monto_calificado de las calificaciones de `qs` (todas por
+    defecto) de los años `anios` a lo que dice FactorEmisor. Solo toca las
+    filas en que algo cambia, así que repetirlo no hace nada. Con `simular`
+    solo cuenta las filas y la diferencia total.
+    """
+    inicio = time.perf_counter()
+    resultado = ResultadoRecalculo(anios=sorted(anios))
+    qs = CalificacionTributaria.objects.all() if qs is None else qs
+    lote = lote or settings.RECALCULO_LOTE
+
+    con_factor, factor, monto = _expresiones()
+    pendientes = (
+        qs.filter(con_factor, anio_tributario__in=resultado.anios)
+        .exclude(factor=factor, monto_calificado=monto)
+        .order_by("pk")
+    )
+    diferencia = Sum(monto - F("monto_calificado"))
+
+    if simular:
+        resultado.filas = pendientes.count()
+        resultado.diferencia = cuantizar(pendientes.aggregate(d=diferencia)["d"] or 0, CENTAVOS)
+        return resultado
+
+    desde = 0
+    try:
+        while True:
+            with transaction.atomic(using=qs.db):
+                ids = list(
+                    pendientes.filter(pk__gt=desde).select_for_update(of=("self",)).values_list("pk", flat=True)[:lote]
+                )
+                if not ids:
+                    break
+                desde = ids[-1]
+                # Filas ya bloqueadas: el WHERE no necesita volver a evaluar las subconsultas
+                bloqueadas = CalificacionTributaria.objects.filter(pk__in=ids)
+                resultado.diferencia += cuantizar(bloqueadas.aggregate(d=diferencia)["d"] or 0, CENTAVOS)
+                resultado.filas += bloqueadas.update(factor=factor, monto_calificado=monto)
+                resultado.lotes += 1
+                registrar_cambios_por_ids(ids, "ACTUALIZAR", batch_size=len(ids))
+    finally:
+        resultado.segundos = time.perf_counter() - inicio
+        if resultado.filas:
+            invalidar("calificaciones")
+            registrar_bitacora(usuario, "Recalcular monto calificado (masivo)", "CalificacionTributaria",
+                               detalle=resultado.resumen())
+    logger.info("%s", resultado.resumen())
+    return resultado
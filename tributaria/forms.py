@@ -1,5 +1,6 @@
 from django import forms
-from .models import ArchivoTributario, CalificacionTributaria, DocumentoPDF
+from .models import ArchivoTributario, CalificacionTributaria, DocumentoPDF, ReglaValidacion
+from .rut import formatear, normalizar
 
 
 # ────────────────────────────────
@@ -19,6 +20,12 @@ class CalificacionForm(forms.ModelForm):
         model = CalificacionTributaria
         fields = "__all__"
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Usuario.__str__ muestra el rol: sin esto, una consulta por opción
+        campo = self.fields["usuario_responsable"]
+        campo.queryset = campo.queryset.select_related("rol")
+
 
 # ────────────────────────────────
 # Formulario de filtros
@@ -44,3 +51,52 @@ class DocumentoPDFForm(forms.ModelForm):
     class Meta:
         model = DocumentoPDF
         fields = ["nombre", "archivo"]
+
+
+# ────────────────────────────────
+# Filtros de bitácora
+# ────────────────────────────────
+class FiltroBitacoraForm(forms.Form):
+    usuario = forms.CharField(required=False, label="Usuario")
+    entidad = forms.CharField(required=False, label="Entidad")
+    accion = forms.CharField(required=False, label="Acción")
+    id_registro = forms.IntegerField(required=False, label="ID registro")
+    desde = forms.DateField(required=False, label="Desde", widget=forms.DateInput(attrs={"type": "date"}))
+    hasta = forms.DateField(required=False, label="Hasta", widget=forms.DateInput(attrs={"type": "date"}))
+
+
+# ────────────────────────────────
+# Reglas de validación de la carga masiva
+# ────────────────────────────────
+class ReglaValidacionForm(forms.ModelForm):
+    class Meta:
+        model = ReglaValidacion
+        fields = [
+            "nombre", "campo", "operador", "valor", "valor_max",
+            "solo_anio", "solo_rut_emisor", "mensaje", "orden", "activa",
+        ]
+
+    def clean(self):
+        datos = super().clean()
+        campo, operador = datos.get("campo"), datos.get("operador")
+        valor, valor_max = datos.get("valor"), datos.get("valor_max")
+
+        if operador and operador != "OBLIGATORIO":
+            if campo and campo not in ReglaValidacion.CAMPOS_NUMERICOS:
+                self.add_error("operador", "Solo los campos numéricos se comparan con un valor.")
+            if valor is None:
+                self.add_error("valor", "Indica el valor a comparar.")
+        if operador == "ENTRE":
+            if valor_max is None:
+                self.add_error("valor_max", "Indica el valor máximo.")
+            elif valor is not None and valor_max < valor:
+                self.add_error("valor_max", "El máximo no puede ser menor que el mínimo.")
+
+        rut = datos.get("solo_rut_emisor")
+        if rut:
+            normalizado = normalizar(rut)
+            if normalizado is None:
+                self.add_error("solo_rut_emisor", "No es un RUT válido.")
+            else:
+                datos["solo_rut_emisor"] = formatear(*normalizado)
+        return datos
@@ -0,0 +1,44 @@
+"""
+Informes en PDF (xhtml2pdf).
+
+xhtml2pdf arrastra reportlab y compañía; se importa solo al generar un
+informe. Si no está instalado (pasó en Render) la vista avisa en vez de caer.
+"""
+from importlib.util import find_spec
+
+from django.db.models import Sum
+from django.template.loader import get_template
+from django.utils import timezone
+
+from cuentas.models import Rol, Usuario
+
+from .models import ArchivoTributario, CalificacionTributaria, DocumentoPDF
+
+
+def xhtml2pdf_disponible():
+    return find_spec("xhtml2pdf") is not None
+
+
+def contexto_informe_gestion(usuario):
+    # Conteos/estadísticas (ajusta estados si tus choices son distintos)
+    qs = CalificacionTributaria.objects.all()
+    return {
+        "usuarios_total": Usuario.objects.count(),
+        "usuarios_por_rol": Rol.objects.all(),
+        "calificaciones_total": qs.count(),
+        "monto_total": qs.aggregate(total=Sum("monto")).get("total") or 0,
+        "pendientes": qs.filter(estado="PENDIENTE").count(),
+        "validadas": qs.filter(estado="VALIDADA").count(),
+        "archivos": ArchivoTributario.objects.count(),
+        "pdfs": DocumentoPDF.objects.count(),
+        "usuario": usuario,
+        "fecha": timezone.now(),
+    }
+
+
+def renderizar_pdf(nombre_template, contexto, destino):
+    """Renderiza el template HTML y escribe el PDF en `destino` (archivo o HttpResponse)."""
+    from xhtml2pdf import pisa
+
+    html = get_template(nombre_template).render(contexto)
+    return pisa.CreatePDF(html, dest=destino)
@@ -0,0 +1,273 @@
+"""
+Carga masiva de calificaciones desde Excel/CSV.
+
+pandas se importa dentro de las funciones: cargarlo cuesta tiempo y varias
+decenas de MB por worker, y solo lo necesita la vista de subida.
+"""
+import os
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+from django.db import transaction
+
+from config import metricas
+
+from .cambios import registrar_cambios, registrar_cambios_por_ids
+from .emisores import completar_campos
+from .factores import EXPONENTE_FACTOR, EXPONENTE_MONTO, calcular_monto_calificado, cuantizar
+from .eventos import publicar_progreso
+from .medicion import MedicionEtapas, ruta_perfil
+from .models import ArchivoTributario, CalificacionTributaria, Emisor, ErrorValidacion
+from .reglas import COLUMNAS_RUT, preparar, reglas_vigentes
+from .rut import formatear, normalizar_columna
+from .versiones import invalidar
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+EXT_PERMITIDAS = {".csv", ".xlsx", ".xls"}
+
+# Columnas obligatorias del formato NUAM esperado
+COLUMNAS_REQUERIDAS = {
+    "rut_contribuyente",
+    "nombre_contribuyente",
+    "rut_emisor",
+    "nombre_emisor",
+    "monto_bruto",
+    "factor",
+    "anio_tributario",
+}
+
+def _normalizar_columnas(df: "pd.DataFrame") -> "pd.DataFrame":
+    mapping = {}
+    for col in df.columns:
+        clave = str(col).strip().lower().replace(" ", "_")
+        mapping[col] = clave
+    return df.rename(columns=mapping)
+
+
+def procesar_archivo_tributario(archivo_obj, usuario, perfil=None):
+    """
+    Retorna: (ok:int, fail:int, archivo_valido:bool)
+    - archivo_valido=False significa: el archivo NO corresponde al formato esperado (por columnas)
+    - en ese caso NO se crean calificaciones.
+
+    Deja en archivo_obj.metricas el tiempo, consultas, filas y memoria de
+    cada etapa (también si falla). `perfil` (o INGESTA_PERFIL=True) guarda
+    un cProfile del proceso en esa ruta.
+    """
+    if perfil is None:
+        perfil = ruta_perfil("archivo", archivo_obj.id)
+    medicion = MedicionEtapas(perfil=perfil)
+    resultado = "fallido"
+    try:
+        with medicion.activa():
+            ok, fail, valido = _procesar(archivo_obj, usuario, medicion)
+        resultado = "invalido" if not valido else ("con_errores" if fail else "procesado")
+        metricas.incrementar("nuam_filas_ingestadas_total", ok)
+        metricas.incrementar("nuam_filas_rechazadas_total", fail)
+        return ok, fail, valido
+    finally:
+        # Fuera de la transacción de _procesar: sobrevive a un rollback
+        archivo_obj.metricas = medicion.resultado()
+        ArchivoTributario.objects.filter(pk=archivo_obj.pk).update(metricas=archivo_obj.metricas)
+        metricas.incrementar("nuam_archivos_procesados_total", resultado=resultado)
+        metricas.observar("nuam_ingesta_duracion_segundos", medicion.segundos)
+
+
+@transaction.atomic
+def _procesar(archivo_obj, usuario, medicion):
+    ruta = archivo_obj.archivo.path
+    extension = os.path.splitext(ruta)[1].lower()
+
+    # 1) Leer archivo
+    with medicion.etapa("lectura") as etapa:
+        # La primera carga del worker paga aquí el import de pandas
+        import pandas as pd
+
+        try:
+            if extension == ".csv":
+                df = pd.read_csv(ruta)
+            elif extension == ".xlsx":
+                df = pd.read_excel(ruta, engine="openpyxl")
+            elif extension == ".xls":
+                df = pd.read_excel(ruta)  # xlrd solo si está instalado
+            else:
+                # no debería llegar por validación previa
+                raise Exception(f"Formato no soportado: {extension}")
+        except Exception as e:
+            raise Exception(f"No se pudo leer el archivo. Error: {e}")
+        etapa["filas"] = len(df)
+
+    with medicion.etapa("normalizacion", filas=len(df)):
+        df = _normalizar_columnas(df)
+
+    # 2) Validar columnas (SI FALLA -> archivo inválido, registrar ErrorValidacion y salir sin crear calificaciones)
+    faltantes = sorted(list(COLUMNAS_REQUERIDAS - set(df.columns)))
+    if faltantes:
+        with medicion.etapa("errores", filas=1):
+            ErrorValidacion.objects.filter(archivo=archivo_obj).delete()
+            ErrorValidacion.objects.create(
+                archivo=archivo_obj,
+                nro_linea=1,
+                mensaje=f"Archivo inválido: faltan columnas obligatorias: {', '.join(faltantes)}",
+            )
+            invalidar("errores")
+        publicar_progreso(archivo_obj.id, 0, len(df), 0, 0, fin=True)
+        return 0, 0, False
+
+    # 3) Validar y guardar por lotes de INGESTA_LOTE filas (aquí sí se crean
+    # calificaciones SOLO para filas válidas). Las reglas (reglas.py) se
+    # evalúan por columna sobre el lote entero, y las consultas dependen del
+    # número de lotes, no del de filas.
+    ok = 0
+    fail = 0
+    total = len(df)
+    cada = getattr(settings, "EVENTOS_PROGRESO_CADA", 500)
+    tamano_lote = max(1, getattr(settings, "INGESTA_LOTE", 1000))
+    # IMPORTANTE: tu modelo tiene corredor como CharField, así que guardamos username
+    corredor_txt = getattr(usuario, "username", str(usuario))
+    lote = _Lote(archivo_obj, corredor_txt)
+
+    with medicion.etapa("errores"):
+        ErrorValidacion.objects.filter(archivo=archivo_obj).delete()
+
+    with medicion.etapa("ruts", filas=total):
+        # Formato, DV y forma canónica de cada columna de RUT de una vez: el
+        # emisor se busca por cuerpo del RUT (entero), no por el texto tal cual
+        ruts = {campo: normalizar_columna(df[campo]) for campo in COLUMNAS_RUT}
+
+    with medicion.etapa("validacion"):
+        valores = preparar(df, ruts)
+        reglas = reglas_vigentes()
+
+    for inicio in range(0, total, tamano_lote):
+        bloque = valores.iloc[inicio:inicio + tamano_lote]
+        with medicion.etapa("validacion", filas=len(bloque)):
+            filas = zip(
+                reglas.evaluar(bloque),
+                bloque["rut_emisor:cuerpo"].tolist(),
+                bloque["rut_emisor:dv"].tolist(),
+                bloque["nombre_emisor"].tolist(),
+                bloque["anio_tributario"].tolist(),
+                bloque["monto_bruto"].tolist(),
+                bloque["factor"].tolist(),
+            )
+
+        for posicion, (errores, cuerpo, dv, nombre, anio, monto, factor) in enumerate(filas, start=inicio):
+            if posicion and posicion % cada == 0:
+                publicar_progreso(archivo_obj.id, posicion, total, ok, fail)
+            if errores:
+                fail += 1
+                lote.agregar_errores(posicion + 2, errores)
+            else:
+                ok += 1
+                lote.agregar_calificacion(cuerpo, dv, str(nombre).strip(), int(anio), monto, factor)
+
+        lote.guardar(medicion)
+
+    lote.invalidar_versiones()
+
+    publicar_progreso(archivo_obj.id, total, total, ok, fail, fin=True)
+    return ok, fail, True
+
+
+class _Lote:
+    """
+    Filas ya validadas pendientes de escribir. guardar() las inserta con un
+    número fijo de consultas: errores, emisores (buscar/crear) y calificaciones
+    más su registro de cambios (bulk_create no dispara las señales).
+    """
+
+    def __init__(self, archivo_obj, corredor):
+        self.archivo = archivo_obj
+        self.corredor = corredor
+        self.emisores = {}  # cuerpo del RUT -> id, de este lote y los anteriores
+        self.emisores_nuevos = False
+        self.calificaciones = []  # (cuerpo_rut, dv, nombre_emisor, anio, monto, factor)
+        self.errores = []
+        self.ultimo_id = 0
+
+    def agregar_errores(self, nro_linea, mensajes):
+        self.errores.extend(
+            ErrorValidacion(archivo=self.archivo, nro_linea=nro_linea, mensaje=m) for m in mensajes
+        )
+
+    def agregar_calificacion(self, cuerpo_rut, dv, nombre_emisor, anio, monto, factor):
+        self.calificaciones.append((cuerpo_rut, dv, nombre_emisor, anio, monto, factor))
+
+    def guardar(self, medicion):
+        if self.errores:
+            with medicion.etapa("errores", filas=len(self.errores)):
+                ErrorValidacion.objects.bulk_create(self.errores, batch_size=len(self.errores))
+        if self.calificaciones:
+            with medicion.etapa("emisores", filas=len(self.calificaciones)):
+                self._resolver_emisores()
+            with medicion.etapa("insercion", filas=len(self.calificaciones)):
+                self._insertar_calificaciones()
+        self.errores = []
+        self.calificaciones = []
+
+    def _resolver_emisores(self):
+        # Como el get_or_create de antes: el primer nombre visto para un rut gana
+        faltantes = {}
+        for cuerpo, dv, nombre, *_ in self.calificaciones:
+            if cuerpo not in self.emisores:
+                faltantes.setdefault(cuerpo, (dv, nombre))
+        if not faltantes:
+            return
+
+        self._leer_emisores(faltantes)
+        nuevos = [
+            # Sin pre_save en bulk_create: rut_cuerpo y nombre_busqueda a mano
+            completar_campos(Emisor(rut=formatear(cuerpo, dv), nombre=nombre))
+            for cuerpo, (dv, nombre) in faltantes.items()
+            if cuerpo not in self.emisores
+        ]
+        if nuevos:
+            # Sin señales: la versión de "emisores" se invalida al final de la carga
+            Emisor.objects.bulk_create(nuevos, batch_size=len(nuevos))
+            self.emisores_nuevos = True
+            # MySQL no devuelve los ids de un INSERT masivo: se releen por rut
+            self._leer_emisores([e.rut_cuerpo for e in nuevos])
+
+    def _leer_emisores(self, cuerpos):
+        # El rut no es único en la tabla: si hay repetidos se usa el más antiguo
+        emisores = Emisor.objects.filter(rut_cuerpo__in=list(cuerpos)).order_by("id").values_list("id", "rut_cuerpo")
+        for id_emisor, cuerpo in emisores:
+            self.emisores.setdefault(cuerpo, id_emisor)
+
+    def _insertar_calificaciones(self):
+        objetos = []
+        for cuerpo, _, _, anio, monto, factor in self.calificaciones:
+            # Los números llegan como float: monto_calificado se calcula en Decimal
+            monto, factor = cuantizar(monto, EXPONENTE_MONTO), cuantizar(factor, EXPONENTE_FACTOR)
+            objetos.append(CalificacionTributaria(
+                archivo_origen=self.archivo,
+                emisor_id=self.emisores[cuerpo],
+                anio_tributario=anio,
+                monto=monto,
+                factor=factor,
+                monto_calificado=calcular_monto_calificado(monto, factor),
+                corredor=self.corredor,
+                estado="PENDIENTE",
+                fuente="EXCEL/CSV",
+            ))
+        creadas = CalificacionTributaria.objects.bulk_create(objetos, batch_size=len(objetos))
+        if creadas[0].pk is not None:
+            registrar_cambios(creadas, "CREAR", batch_size=len(creadas))
+            return
+        # Backend sin ids en bulk_create (MySQL): se releen por archivo de origen
+        ids = list(
+            CalificacionTributaria.objects.filter(archivo_origen=self.archivo, id__gt=self.ultimo_id)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        registrar_cambios_por_ids(ids, "CREAR", batch_size=len(ids))
+        self.ultimo_id = ids[-1]
+
+    def invalidar_versiones(self):
+        # Los errores previos del archivo se borran aunque no haya nuevos
+        entidades = ("emisores", "calificaciones") if self.emisores_nuevos else ("calificaciones",)
+        invalidar("errores", *entidades)
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+
+from tributaria.retencion import POLITICAS, purgar_huerfanos
+
+
+def formatear_bytes(n):
+    for unidad in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unidad == "GB":
+            return f"{n:.0f} {unidad}" if unidad == "B" else f"{n:.1f} {unidad}"
+        n /= 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Aplica las políticas de retención (RETENCION_* en settings): errores de validación, "
+        "notificaciones, exportaciones vencidas y archivos huérfanos en media/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Solo informa lo que se borraría.")
+        parser.add_argument("--lote", type=int, default=1000, help="Filas por lote de borrado.")
+        parser.add_argument("--pausa", type=float, default=0, help="Segundos de espera entre lotes.")
+        parser.add_argument(
+            "--solo", action="append", choices=sorted(POLITICAS) + ["huerfanos"],
+            help="Aplica solo esta política (se puede repetir).",
+        )
+        parser.add_argument("--horas-huerfanos", type=float, default=None,
+                            help="Antigüedad mínima de un archivo huérfano (por defecto RETENCION_HUERFANOS_HORAS).")
+
+    def handle(self, *args, **options):
+        simular = options["dry_run"]
+        elegidas = options["solo"] or sorted(POLITICAS) + ["huerfanos"]
+
+        resultados = []
+        for nombre in elegidas:
+            if nombre == "huerfanos":
+                resultados.append(purgar_huerfanos(simular=simular, horas=options["horas_huerfanos"]))
+            else:
+                resultados.append(POLITICAS[nombre](lote=options["lote"], simular=simular, pausa=options["pausa"]))
+
+        verbo = "se borrarían" if simular else "borrados"
+        total = 0
+        for r in resultados:
+            total += r.bytes_filas + r.bytes_archivos
+            self.stdout.write(
+                f"{r.politica}: {r.filas} filas (~{formatear_bytes(r.bytes_filas)}), "
+                f"{r.archivos} archivos ({formatear_bytes(r.bytes_archivos)}) {verbo}."
+            )
+        prefijo = "[dry-run] " if simular else ""
+        self.stdout.write(self.style.SUCCESS(f"{prefijo}Espacio recuperado aprox.: {formatear_bytes(total)}."))
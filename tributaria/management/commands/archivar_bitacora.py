@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tributaria.auditoria import archivar_bitacora, directorio_archivo
+
+
+def restar_meses(fecha, meses):
+    total = fecha.year * 12 + (fecha.month - 1) - meses
+    return fecha.replace(year=total // 12, month=total % 12 + 1, day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+class Command(BaseCommand):
+    help = "Mueve las entradas de bitácora más antiguas que N meses a archivos gzip (JSON por línea)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--meses", type=int, default=12, help="Meses completos que se conservan en la tabla.")
+        parser.add_argument("--lote", type=int, default=5000, help="Entradas por lote de borrado.")
+        parser.add_argument("--directorio", default=None, help="Carpeta de archivo (por defecto BITACORA_ARCHIVO_DIR).")
+
+    def handle(self, *args, **options):
+        antes_de = restar_meses(timezone.now(), options["meses"])
+        directorio = options["directorio"] or directorio_archivo()
+        total = archivar_bitacora(antes_de, lote=options["lote"], directorio=directorio)
+        self.stdout.write(f"{total} entradas anteriores a {antes_de:%Y-%m-%d} archivadas en {directorio}.")
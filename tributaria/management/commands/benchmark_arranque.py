@@ -0,0 +1,116 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+# Se ejecuta en un intérprete nuevo por medición: el proceso actual ya tiene todo importado.
+SCRIPT = r"""
+import json, os, sys, time
+
+def rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1])
+    except OSError:
+        pass
+    import resource
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maximo // 1024 if sys.platform == "darwin" else maximo
+
+inicio = time.perf_counter()
+if os.environ.get("BENCH_PRECARGAR") == "1":
+    # Igual que antes: views.py importaba estas librerías al cargarse
+    import pandas, PyPDF2
+    try:
+        import xhtml2pdf.pisa
+    except ImportError:
+        pass
+precarga = time.perf_counter() - inicio
+
+import django
+t0 = time.perf_counter()
+django.setup()
+t_setup = time.perf_counter() - t0
+
+from django.urls import get_resolver, resolve
+t0 = time.perf_counter()
+get_resolver().url_patterns  # importa config.urls y las vistas
+for ruta in json.loads(os.environ["BENCH_RUTAS"]):
+    resolve(ruta)
+t_urls = time.perf_counter() - t0
+
+print(json.dumps({
+    "precarga_s": precarga,
+    "setup_s": t_setup,
+    "urls_s": t_urls,
+    "total_s": precarga + t_setup + t_urls,
+    "rss_mb": rss_kb() / 1024,
+    "modulos_pesados": [m for m in ("pandas", "PyPDF2", "xhtml2pdf", "openpyxl") if m in sys.modules],
+}))
+"""
+
+RUTAS = ["/dashboard/", "/calificaciones/", "/subir-archivo/", "/subir-pdf/", "/reportes/informe-gestion/"]
+
+
+def _medir(precargar):
+    env = dict(os.environ)
+    env["DJANGO_SETTINGS_MODULE"] = os.environ.get("DJANGO_SETTINGS_MODULE", "config.settings")
+    env["BENCH_PRECARGAR"] = "1" if precargar else "0"
+    env["BENCH_RUTAS"] = json.dumps(RUTAS)
+    salida = subprocess.run(
+        [sys.executable, "-c", SCRIPT],
+        env=env,
+        cwd=str(settings.BASE_DIR),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def _resumir(muestras):
+    claves = ("precarga_s", "setup_s", "urls_s", "total_s", "rss_mb")
+    resumen = {k: statistics.median(m[k] for m in muestras) for k in claves}
+    resumen["modulos_pesados"] = muestras[-1]["modulos_pesados"]
+    return resumen
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el arranque de un worker: django.setup() + carga/resolución de URLs y RSS. "
+        "Compara carga perezosa (actual) contra precargar pandas/PyPDF2/xhtml2pdf (como antes)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeticiones", type=int, default=5)
+        parser.add_argument("--json", action="store_true", help="Salida en JSON.")
+
+    def handle(self, *args, **options):
+        n = max(1, options["repeticiones"])
+        resultados = {
+            "perezoso": _resumir([_medir(False) for _ in range(n)]),
+            "precargado": _resumir([_medir(True) for _ in range(n)]),
+        }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(resultados, indent=2))
+            return
+
+        self.stdout.write(f"Mediana de {n} arranques (intérprete nuevo cada vez):")
+        for nombre, r in resultados.items():
+            self.stdout.write(
+                f"  {nombre:<11} total={r['total_s'] * 1000:7.1f} ms "
+                f"(precarga {r['precarga_s'] * 1000:.1f}, setup {r['setup_s'] * 1000:.1f}, "
+                f"urls {r['urls_s'] * 1000:.1f})  RSS={r['rss_mb']:.1f} MB  "
+                f"pesados={','.join(r['modulos_pesados']) or '-'}"
+            )
+        ahorro_ms = (resultados["precargado"]["total_s"] - resultados["perezoso"]["total_s"]) * 1000
+        ahorro_mb = resultados["precargado"]["rss_mb"] - resultados["perezoso"]["rss_mb"]
+        self.stdout.write(self.style.SUCCESS(f"Ahorro por worker: {ahorro_ms:.0f} ms y {ahorro_mb:.1f} MB de RSS."))
@@ -0,0 +1,147 @@
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+from django.test import Client
+from django.urls import reverse
+
+from config.bd.base import cerrar_pools, estadisticas
+from cuentas.models import Usuario
+
+from .benchmark_vistas import _commit, _percentil
+
+
+MODOS = ("nueva", "persistente", "pool")
+
+
+class Command(BaseCommand):
+    help = (
+        "Latencia de peticiones con una conexión nueva por petición, con conexiones "
+        "persistentes y con pool, contra la BD configurada. Solo hace lecturas. Salida JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--usuario", required=True, help="Username con el que se hacen las peticiones.")
+        parser.add_argument("--url", help="Ruta a pedir (por defecto /api/emisores/?limite=1).")
+        parser.add_argument("--peticiones", type=int, default=200, help="Peticiones por modo.")
+        parser.add_argument("--hilos", type=int, default=4, help="Hilos (workers) haciendo peticiones a la vez.")
+        parser.add_argument("--pool-max", type=int, default=4, help="Tamaño del pool en el modo pool.")
+        parser.add_argument("--modo", action="append", choices=MODOS, help="Medir solo este modo (repetible).")
+        parser.add_argument("--salida", help="Archivo donde escribir el JSON (por defecto stdout).")
+
+    def handle(self, *args, **options):
+        bd = connections.settings[DEFAULT_DB_ALIAS]
+        if not bd["ENGINE"].startswith("config.bd."):
+            raise CommandError(f"El ENGINE {bd['ENGINE']} no mide conexiones: usar uno de config.bd (MOTORES_MEDIDOS).")
+        usuario = Usuario.objects.filter(username=options["usuario"]).first()
+        if usuario is None:
+            raise CommandError(f"No existe el usuario {options['usuario']}.")
+        url = options["url"] or f"{reverse('api_emisores')}?limite=1"
+
+        original = {
+            "CONN_MAX_AGE": bd["CONN_MAX_AGE"],
+            "POOL_PROCESO": bd.get("POOL_PROCESO"),
+            "pool": bd.get("OPTIONS", {}).get("pool"),
+        }
+        resultados = {}
+        try:
+            for modo in options["modo"] or MODOS:
+                self.stderr.write(f"Midiendo {modo}...")
+                self._configurar(bd, modo, options["pool_max"])
+                resultados[modo] = self._medir(usuario, url, options["peticiones"], options["hilos"])
+        finally:
+            self._restaurar(bd, original)
+
+        informe = {
+            "commit": _commit(),
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "motor": bd["ENGINE"],
+            "url": url,
+            "peticiones_por_modo": options["peticiones"],
+            "hilos": options["hilos"],
+            "pool_max": options["pool_max"],
+            "modos": resultados,
+        }
+        texto = json.dumps(informe, indent=2, ensure_ascii=False)
+        if options["salida"]:
+            with open(options["salida"], "w", encoding="utf-8") as f:
+                f.write(texto + "\n")
+            self.stderr.write(f"Informe escrito en {options['salida']}")
+        else:
+            self.stdout.write(texto)
+
+    def _reiniciar_conexiones(self):
+        connections.close_all()
+        cerrar_pools()
+        conexion = connections[DEFAULT_DB_ALIAS]
+        if hasattr(conexion, "close_pool"):
+            conexion.close_pool()
+
+    def _configurar(self, bd, modo, pool_max):
+        """Cambia la configuración compartida por los hilos (connections.settings)."""
+        self._reiniciar_conexiones()
+        bd.pop("POOL_PROCESO", None)
+        bd.get("OPTIONS", {}).pop("pool", None)
+        bd["CONN_MAX_AGE"] = 600 if modo == "persistente" else 0
+        if modo != "pool":
+            return
+        if bd["ENGINE"] == "config.bd.postgresql":
+            bd.setdefault("OPTIONS", {})["pool"] = {"min_size": 1, "max_size": pool_max, "timeout": 30}
+        else:
+            bd["POOL_PROCESO"] = {"maximo": pool_max, "espera": 30}
+
+    def _restaurar(self, bd, original):
+        self._reiniciar_conexiones()
+        bd["CONN_MAX_AGE"] = original["CONN_MAX_AGE"]
+        bd.pop("POOL_PROCESO", None)
+        bd.get("OPTIONS", {}).pop("pool", None)
+        if original["POOL_PROCESO"]:
+            bd["POOL_PROCESO"] = original["POOL_PROCESO"]
+        if original["pool"]:
+            bd["OPTIONS"]["pool"] = original["pool"]
+
+    def _medir(self, usuario, url, peticiones, hilos):
+        hilos = max(1, hilos)
+
+        def trabajador(cantidad):
+            cliente = Client()
+            cliente.force_login(usuario)
+            close_old_connections()
+            latencias = []
+            try:
+                for _ in range(cantidad):
+                    inicio = time.perf_counter()
+                    # Lo que hace el handler real: request_started / request_finished
+                    close_old_connections()
+                    response = cliente.get(url)
+                    close_old_connections()
+                    latencias.append((time.perf_counter() - inicio) * 1000)
+                    if response.status_code != 200:
+                        raise CommandError(f"{url} respondió {response.status_code}")
+            finally:
+                connections.close_all()
+            return latencias
+
+        reparto = [peticiones // hilos + (1 if i < peticiones % hilos else 0) for i in range(hilos)]
+        estadisticas.reiniciar()
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            latencias = [ms for parte in pool.map(trabajador, reparto) for ms in parte]
+        total = time.perf_counter() - inicio
+        conexiones = estadisticas.foto()
+
+        return {
+            "p50_ms": round(_percentil(latencias, 50), 2),
+            "p95_ms": round(_percentil(latencias, 95), 2),
+            "max_ms": round(max(latencias), 2),
+            "media_ms": round(statistics.fmean(latencias), 2),
+            "peticiones_por_segundo": round(len(latencias) / total, 1),
+            "conexiones_obtenidas": conexiones["obtenidas"],
+            "conexiones_nuevas": conexiones["nuevas"],
+            "espera_conexion_media_ms": round(conexiones["segundos"] * 1000 / max(1, conexiones["obtenidas"]), 3),
+            "espera_conexion_total_ms": round(conexiones["segundos"] * 1000, 2),
+        }
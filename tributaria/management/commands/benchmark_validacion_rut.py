@@ -0,0 +1,113 @@
+import json
+import random
+import time
+from datetime import datetime
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from tributaria.datos_sinteticos import crear_usuarios
+from tributaria.ingesta import procesar_archivo_tributario
+from tributaria.reglas import COLUMNAS_RUT
+from tributaria.models import ArchivoTributario
+from tributaria.rut import dv_de, es_valido
+
+from .benchmark_vistas import _commit
+
+
+def _rut_de_prueba(aleatorio, invalidos, cuerpos):
+    cuerpo = aleatorio.randint(*cuerpos)
+    dv = dv_de(cuerpo)
+    sorteo = aleatorio.random()
+    if sorteo < invalidos / 2:
+        dv = "0" if dv != "0" else "1"  # DV incorrecto
+    elif sorteo < invalidos:
+        return aleatorio.choice(("sin rut", f"{cuerpo}-", f"{cuerpo}-X", "1-2-3"))
+    forma = aleatorio.randrange(3)
+    if forma == 0:
+        return f"{cuerpo:,}".replace(",", ".") + f"-{dv}"
+    return f"{cuerpo}-{dv}" if forma == 1 else f"{cuerpo}{dv}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Carga un CSV sintético con procesar_archivo_tributario y compara la etapa de validación de "
+        "RUT (formato y dígito verificador, por columna) con el total de la carga. "
+        "Usar con --settings=config.settings_benchmark. Salida JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--filas", type=int, default=1_000_000, help="Filas del archivo sintético.")
+        parser.add_argument("--invalidos", type=float, default=0.02, help="Proporción de RUT inválidos (0-1).")
+        parser.add_argument("--emisores", type=int, default=2000, help="RUT de emisor distintos.")
+        parser.add_argument("--semilla", type=int, default=1)
+        parser.add_argument("--salida", help="Archivo donde escribir el JSON (por defecto stdout).")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError(
+                "El benchmark crea calificaciones de prueba: solo corre sobre SQLite (--settings=config.settings_benchmark)."
+            )
+        call_command("migrate", verbosity=0)
+        usuario = crear_usuarios()["Analista"]
+
+        filas = options["filas"]
+        aleatorio = random.Random(options["semilla"])
+        primer_emisor = 76_000_000
+        emisores = (primer_emisor, primer_emisor + max(1, options["emisores"]) - 1)
+        self.stderr.write(f"Generando {filas} filas...")
+        ruts = {
+            "rut_contribuyente": [_rut_de_prueba(aleatorio, options["invalidos"], (1_000_000, 25_000_000)) for _ in range(filas)],
+            "rut_emisor": [_rut_de_prueba(aleatorio, options["invalidos"], emisores) for _ in range(filas)],
+        }
+        lineas = ["rut_contribuyente,nombre_contribuyente,rut_emisor,nombre_emisor,monto_bruto,factor,anio_tributario"]
+        lineas.extend(
+            f"{contribuyente},Contribuyente,{emisor},Emisor,{1000 + i % 5000},0.5,2024"
+            for i, (contribuyente, emisor) in enumerate(zip(ruts["rut_contribuyente"], ruts["rut_emisor"]))
+        )
+        archivo = ArchivoTributario.objects.create(
+            tipo_archivo="CSV",
+            archivo=ContentFile(("\n".join(lineas) + "\n").encode("utf-8"), name="benchmark_ruts.csv"),
+            nombre_original="benchmark_ruts.csv",
+            usuario=usuario,
+        )
+        del lineas
+
+        self.stderr.write("Procesando con procesar_archivo_tributario...")
+        try:
+            with override_settings(INGESTA_MEDIR_MEMORIA=False, INGESTA_PERFIL=False):
+                ok, fail, _ = procesar_archivo_tributario(archivo, usuario)
+        finally:
+            archivo.archivo.delete(save=False)
+        etapas = {e["nombre"]: e["segundos"] for e in archivo.metricas["etapas"]}
+        total = archivo.metricas["segundos"]
+
+        # Alternativa fila a fila (un regex por valor), para comparar
+        inicio = time.perf_counter()
+        for campo in COLUMNAS_RUT:
+            for valor in ruts[campo]:
+                es_valido(valor)
+        por_fila = time.perf_counter() - inicio
+
+        informe = {
+            "commit": _commit(),
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "filas": filas,
+            "filas_ok": ok,
+            "filas_rechazadas": fail,
+            "carga_total_s": total,
+            "etapas_s": etapas,
+            "validacion_rut_vectorizada_s": etapas.get("ruts"),
+            "validacion_rut_por_fila_s": round(por_fila, 3),
+            "sobrecosto_pct": round(100 * etapas.get("ruts", 0) / total, 2) if total else None,
+        }
+        texto = json.dumps(informe, indent=2, ensure_ascii=False)
+        if options["salida"]:
+            with open(options["salida"], "w", encoding="utf-8") as f:
+                f.write(texto + "\n")
+            self.stderr.write(f"Informe escrito en {options['salida']}")
+        else:
+            self.stdout.write(texto)
@@ -0,0 +1,178 @@
+import json
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from config.middleware import RegistroConsultas
+from tributaria.datos_sinteticos import crear_usuarios, sembrar
+from tributaria.models import ArchivoTributario, CalificacionTributaria
+
+
+# Vista -> rol con el que se consulta
+VISTAS = {
+    "listar_calificaciones": "Analista",
+    "reporte_calificaciones": "Analista",
+    "reporte_consolidado": "Gerente",
+    "dashboard": "Gerente",
+    "ver_bitacora": "Auditor",
+    "errores_validacion": "Auditor",
+}
+
+
+def _percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, round(p / 100 * len(ordenados) + 0.5) - 1))
+    return ordenados[indice]
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=str(settings.BASE_DIR), capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark HTTP de las vistas de tributaria sobre una base SQLite sembrada con datos sintéticos. "
+        "Usar con --settings=config.settings_benchmark. Salida JSON (p50/p95 y consultas por vista)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--escala", type=int, default=10000, help="Cantidad de calificaciones (10000, 100000, 1000000...).")
+        parser.add_argument("--peticiones", type=int, default=30, help="Peticiones por vista.")
+        parser.add_argument("--concurrencia", type=int, default=4, help="Hilos que hacen peticiones a la vez.")
+        parser.add_argument("--vista", action="append", choices=sorted(VISTAS), help="Medir solo esta vista (repetible).")
+        parser.add_argument("--resembrar", action="store_true", help="Borra la base y vuelve a sembrar.")
+        parser.add_argument(
+            "--con-cache", action="store_true",
+            help="No variar la URL: mide respuestas cacheadas por respuesta_condicional.",
+        )
+        parser.add_argument("--salida", help="Archivo donde escribir el JSON (por defecto stdout).")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError(
+                "El benchmark siembra y borra datos: solo corre sobre SQLite (--settings=config.settings_benchmark)."
+            )
+
+        self._preparar_base(options["escala"], options["resembrar"])
+        usuarios = crear_usuarios()
+
+        resultados = {}
+        for nombre in options["vista"] or VISTAS:
+            self.stderr.write(f"Midiendo {nombre}...")
+            resultados[nombre] = self._medir_vista(
+                nombre, usuarios[VISTAS[nombre]], options["peticiones"], options["concurrencia"], options["con_cache"]
+            )
+
+        informe = {
+            "commit": _commit(),
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "escala": options["escala"],
+            "peticiones_por_vista": options["peticiones"],
+            "concurrencia": options["concurrencia"],
+            "con_cache": options["con_cache"],
+            "vistas": resultados,
+        }
+        texto = json.dumps(informe, indent=2, ensure_ascii=False)
+        if options["salida"]:
+            with open(options["salida"], "w", encoding="utf-8") as f:
+                f.write(texto + "\n")
+            self.stderr.write(f"Informe escrito en {options['salida']}")
+        else:
+            self.stdout.write(texto)
+
+    def _preparar_base(self, escala, resembrar):
+        if resembrar:
+            call_command("flush", interactive=False, verbosity=0)
+        call_command("migrate", verbosity=0)
+
+        with connection.cursor() as cursor:
+            # Solo para sembrar rápido; la base es desechable
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=OFF")
+
+        actuales = CalificacionTributaria.objects.count()
+        if actuales == escala:
+            self.stderr.write(f"Reutilizando base con {actuales} calificaciones.")
+            return
+        if actuales:
+            raise CommandError(
+                f"La base tiene {actuales} calificaciones y se pidieron {escala}: usa --resembrar u otro BENCHMARK_DB."
+            )
+
+        inicio = time.perf_counter()
+        sembrar(escala, progreso=lambda texto: self.stderr.write(f"  sembrado: {texto}"))
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.stderr.write(f"Sembrado en {time.perf_counter() - inicio:.1f} s.")
+
+    def _url(self, nombre):
+        if nombre == "errores_validacion":
+            # Un archivo con errores, como al llegar desde la carga
+            archivo = ArchivoTributario.objects.order_by("id").values_list("id", flat=True).first()
+            if archivo:
+                return reverse("errores_validacion_por_archivo", args=[archivo])
+        return reverse(nombre)
+
+    def _medir_vista(self, nombre, usuario, peticiones, concurrencia, con_cache):
+        url = self._url(nombre)
+        local = threading.local()
+        contador = iter(range(peticiones))
+        lock = threading.Lock()
+
+        def una_peticion(_):
+            cliente = getattr(local, "cliente", None)
+            if cliente is None:
+                cliente = local.cliente = Client()
+                cliente.force_login(usuario)
+            with lock:
+                n = next(contador)
+            destino = url if con_cache else f"{url}?_bench={n}"
+            consultas = RegistroConsultas()
+            # `connection` resuelve la conexión del hilo actual
+            with connection.execute_wrapper(consultas):
+                inicio = time.perf_counter()
+                response = cliente.get(destino)
+                if response.streaming:
+                    b"".join(response.streaming_content)
+                duracion = (time.perf_counter() - inicio) * 1000
+            return duracion, consultas.cantidad, consultas.repetidas(), response.status_code
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrencia)) as pool:
+            medidas = list(pool.map(una_peticion, range(peticiones)))
+
+        latencias = [m[0] for m in medidas]
+        consultas = [m[1] for m in medidas]
+        estados = {}
+        for m in medidas:
+            estados[str(m[3])] = estados.get(str(m[3]), 0) + 1
+
+        return {
+            "url": url,
+            "peticiones": len(medidas),
+            "p50_ms": round(_percentil(latencias, 50), 2),
+            "p95_ms": round(_percentil(latencias, 95), 2),
+            "max_ms": round(max(latencias), 2),
+            "media_ms": round(statistics.fmean(latencias), 2),
+            "consultas_p50": _percentil(consultas, 50),
+            "consultas_max": max(consultas),
+            "consultas_repetidas_max": max(m[2] for m in medidas),
+            "estados": estados,
+        }
@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from cuentas.models import Usuario
+from tributaria.auditoria import registrar_bitacora
+from tributaria.estados import TRANSICIONES, cambiar_estado
+from tributaria.exportaciones import aplicar_filtros
+from tributaria.models import CalificacionTributaria
+
+
+class Command(BaseCommand):
+    help = (
+        "Valida, publica o rechaza en bloque las calificaciones que cumplen los filtros "
+        "(los mismos del listado). Solo cambian las que están en un estado de origen permitido."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("accion", choices=sorted(TRANSICIONES))
+        parser.add_argument("--usuario", required=True, help="Username que queda en la bitácora.")
+        parser.add_argument("--anio", type=int, help="Año tributario.")
+        parser.add_argument("--emisor", help="Nombre o RUT del emisor.")
+        parser.add_argument("--corredor", help="Corredor (contiene).")
+        parser.add_argument(
+            "--estado", action="append",
+            # PENDIENTE (carga masiva / PDF) no está en ESTADO_CHOICES: se toman de las transiciones
+            choices=sorted({e for t in TRANSICIONES.values() for e in (*t.origenes, t.destino)}),
+            help="Cambiar solo calificaciones en este estado (se puede repetir; por defecto todos los "
+                 "estados de origen de la acción).",
+        )
+        parser.add_argument("--lote", type=int, default=None, help="Filas por UPDATE (por defecto CAMBIO_ESTADO_LOTE).")
+        parser.add_argument("--dry-run", action="store_true", help="Solo informa cuántas cambiarían.")
+
+    def handle(self, *args, **options):
+        usuario = Usuario.objects.filter(username=options["usuario"]).first()
+        if usuario is None:
+            raise CommandError(f"No existe el usuario {options['usuario']}.")
+        filtros = {
+            "anio_tributario": options["anio"],
+            "emisor": options["emisor"],
+            "corredor": options["corredor"],
+        }
+        accion = options["accion"]
+        transicion = TRANSICIONES[accion]
+        qs = aplicar_filtros(CalificacionTributaria.objects.all(), filtros)
+        if options["estado"]:
+            qs = qs.filter(estado__in=options["estado"])
+            filtros["estado"] = options["estado"]
+        resultado = cambiar_estado(
+            qs, accion, usuario,
+            lote=options["lote"] or settings.CAMBIO_ESTADO_LOTE,
+            simular=options["dry_run"],
+        )
+
+        if options["dry_run"]:
+            self.stdout.write(f"[dry-run] {resultado.candidatas} calificaciones pasarían a {transicion.destino}.")
+            return
+        usados = {k: v for k, v in filtros.items() if v}
+        registrar_bitacora(
+            usuario,
+            f"{transicion.verbo} calificaciones (masivo)",
+            "CalificacionTributaria",
+            detalle=f"{resultado.cambiadas} -> {transicion.destino}; filtros: {usados or 'ninguno'} (manage.py)",
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado.cambiadas} calificaciones pasaron a {transicion.destino} en {resultado.lotes} lotes"
+            f" ({resultado.omitidas} omitidas por cambiar de estado durante el proceso)."
+        ))
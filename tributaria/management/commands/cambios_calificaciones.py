@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+from tributaria.cambios import asignar_secuencias, cambios_desde
+
+
+class Command(BaseCommand):
+    help = "Imprime (JSON por línea) los cambios de calificaciones posteriores a una secuencia."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--desde", type=int, default=0, help="Última secuencia ya procesada.")
+        parser.add_argument("--lote", type=int, default=5000, help="Filas leídas por consulta.")
+
+    def handle(self, *args, **options):
+        # Numera lo que haya quedado sin secuencia (p.ej. un proceso que cayó
+        # entre el commit y su asignación)
+        asignar_secuencias()
+        desde = options["desde"]
+        total = 0
+        while True:
+            lote = list(cambios_desde(desde, options["lote"]))
+            if not lote:
+                break
+            for c in lote:
+                self.stdout.write(json.dumps(
+                    {
+                        "secuencia": c["secuencia"],
+                        "calificacion_id": c["calificacion_id"],
+                        "operacion": c["operacion"],
+                        "fecha": c["fecha"],
+                        "datos": c["datos"],
+                    },
+                    cls=DjangoJSONEncoder,
+                ))
+            desde = lote[-1]["secuencia"]
+            total += len(lote)
+
+        self.stderr.write(f"{total} cambios. Última secuencia: {desde}")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tributaria.particiones import crear_particiones, soporta_particiones
+
+
+class Command(BaseCommand):
+    help = "Crea por adelantado las particiones mensuales de bitácora (solo PostgreSQL)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--meses", type=int, default=3, help="Meses a crear desde el actual.")
+
+    def handle(self, *args, **options):
+        if not soporta_particiones():
+            self.stdout.write("La base de datos no usa particiones; nada que hacer.")
+            return
+
+        creadas = crear_particiones(timezone.localdate(), options["meses"])
+        for nombre in creadas:
+            self.stdout.write(f"Creada {nombre}")
+        self.stdout.write(f"{len(creadas)} partición(es) nueva(s).")
@@ -0,0 +1,29 @@
+import json
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from tributaria.auditoria import leer_bitacora_archivada
+
+
+class Command(BaseCommand):
+    help = "Busca en el archivo de bitácora (solo lectura). Imprime JSON por línea."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--desde", type=date.fromisoformat, default=None, help="AAAA-MM-DD (día local)")
+        parser.add_argument("--hasta", type=date.fromisoformat, default=None, help="AAAA-MM-DD (día local)")
+        parser.add_argument("--usuario", type=int, default=None, help="id de usuario")
+        parser.add_argument("--entidad", default=None)
+        parser.add_argument("--accion", default=None, help="texto contenido en la acción")
+        parser.add_argument("--id-registro", type=int, default=None)
+
+    def handle(self, *args, **options):
+        for fila in leer_bitacora_archivada(
+            desde=options["desde"],
+            hasta=options["hasta"],
+            usuario_id=options["usuario"],
+            entidad=options["entidad"],
+            accion=options["accion"],
+            id_registro=options["id_registro"],
+        ):
+            self.stdout.write(json.dumps(fila, ensure_ascii=False))
@@ -0,0 +1,54 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from config.middleware import acumulado, leer_acumulados, reiniciar_acumulados
+
+
+ORDENES = ("total_ms", "promedio_ms", "consultas", "promedio_consultas", "repetidas", "peticiones", "lentas")
+
+
+class Command(BaseCommand):
+    help = "Muestra las métricas por URL que acumula InstrumentacionMiddleware (todos los procesos)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orden", choices=ORDENES, default="total_ms")
+        parser.add_argument("--limite", type=int, default=30)
+        parser.add_argument("--json", action="store_true", help="Salida en JSON.")
+        parser.add_argument("--reiniciar", action="store_true", help="Vuelve a cero después de mostrar (también en los workers en marcha).")
+
+    def handle(self, *args, **options):
+        directorio = getattr(settings, "INSTRUMENTACION_DIR", None)
+        acumulado.volcar()  # por si este mismo proceso atendió peticiones
+        filas = []
+        for url, d in leer_acumulados(directorio).items():
+            n = d["peticiones"] or 1
+            filas.append({
+                "url": url,
+                **d,
+                "promedio_ms": d["total_ms"] / n,
+                "promedio_bd_ms": d["bd_ms"] / n,
+                "promedio_consultas": d["consultas"] / n,
+            })
+        filas.sort(key=lambda f: f[options["orden"]], reverse=True)
+        filas = filas[: options["limite"]]
+
+        if options["json"]:
+            self.stdout.write(json.dumps(filas, indent=2))
+        elif not filas:
+            self.stdout.write(f"Sin datos en {directorio}.")
+        else:
+            self.stdout.write(
+                f"{'URL':<40} {'pet.':>7} {'prom ms':>9} {'máx ms':>9} {'prom BD ms':>11} "
+                f"{'cons/pet':>9} {'máx cons':>9} {'repetidas':>10} {'lentas':>7}"
+            )
+            for f in filas:
+                self.stdout.write(
+                    f"{f['url'][:40]:<40} {f['peticiones']:>7} {f['promedio_ms']:>9.1f} {f['max_ms']:>9.1f} "
+                    f"{f['promedio_bd_ms']:>11.1f} {f['promedio_consultas']:>9.1f} {f['max_consultas']:>9} "
+                    f"{f['repetidas']:>10} {f['lentas']:>7}"
+                )
+
+        if options["reiniciar"] and directorio:
+            reiniciar_acumulados(directorio)
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from tributaria.exportaciones import procesar_pendientes
+
+
+class Command(BaseCommand):
+    help = "Worker de exportaciones encoladas de calificaciones."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--continuo", action="store_true", help="No terminar: revisar la cola periódicamente.")
+        parser.add_argument("--intervalo", type=float, default=5.0, help="Segundos entre revisiones (modo continuo).")
+
+    def handle(self, *args, **options):
+        while True:
+            hechas = procesar_pendientes()
+            if hechas:
+                self.stdout.write(f"{hechas} exportación(es) procesada(s).")
+
+            if not options["continuo"]:
+                break
+
+            close_old_connections()
+            time.sleep(options["intervalo"])
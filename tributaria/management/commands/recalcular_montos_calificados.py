@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from cuentas.models import Usuario
+from tributaria.factores import TablaFactoresInvalida, cargar_tabla, leer_tabla, recalcular
+from tributaria.models import CalificacionTributaria
+
+
+class Command(BaseCommand):
+    help = (
+        "Carga una tabla de factores (CSV: rut_emisor, anio_tributario, factor) en FactorEmisor y "
+        "recalcula factor y monto_calificado de las calificaciones de esos años, con UPDATE por lotes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("tabla", help="Ruta del CSV de factores.")
+        parser.add_argument("--usuario", required=True, help="Username que queda en la bitácora.")
+        parser.add_argument(
+            "--estado", action="append",
+            help="Recalcular solo calificaciones en este estado (se puede repetir; por defecto todas).",
+        )
+        parser.add_argument("--lote", type=int, default=None, help="Filas por UPDATE (por defecto RECALCULO_LOTE).")
+        parser.add_argument("--dry-run", action="store_true", help="Solo informa qué cambiaría; no guarda nada.")
+
+    def handle(self, *args, **options):
+        usuario = Usuario.objects.filter(username=options["usuario"]).first()
+        if usuario is None:
+            raise CommandError(f"No existe el usuario {options['usuario']}.")
+        try:
+            tabla = leer_tabla(options["tabla"])
+        except OSError as e:
+            raise CommandError(f"No se pudo leer {options['tabla']}: {e}")
+        except TablaFactoresInvalida as e:
+            for error in e.errores:
+                self.stderr.write(error)
+            raise CommandError(f"La tabla tiene {len(e.errores)} errores; no se aplicó.")
+
+        qs = CalificacionTributaria.objects.all()
+        if options["estado"]:
+            qs = qs.filter(estado__in=options["estado"])
+        anios = {anio for _, anio in tabla}
+        simular = options["dry_run"]
+
+        if simular:
+            # La simulación necesita los factores nuevos en la tabla: se cargan y se deshace todo
+            with transaction.atomic():
+                pares, sin_emisor = cargar_tabla(tabla, usuario)
+                resultado = recalcular(anios, usuario, qs=qs, simular=True)
+                transaction.set_rollback(True)
+        else:
+            # Sin transacción envolvente: cada lote del recálculo hace commit por separado
+            pares, sin_emisor = cargar_tabla(tabla, usuario)
+            resultado = recalcular(anios, usuario, qs=qs, lote=options["lote"])
+
+        if sin_emisor:
+            self.stderr.write(f"RUT sin emisor en la BD (no se cargaron): {', '.join(map(str, sin_emisor))}")
+        prefijo = "[dry-run] " if simular else ""
+        self.stdout.write(f"{prefijo}{pares} factores emisor/año cargados.")
+        self.stdout.write(self.style.SUCCESS(f"{prefijo}{resultado.resumen()}"))
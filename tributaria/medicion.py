@@ -0,0 +1,150 @@
+"""
+Medición por etapas de un trabajo (p.ej. la carga de un ArchivoTributario).
+
+    medicion = MedicionEtapas()
+    with medicion.activa():
+        with medicion.etapa("lectura", filas=len(df)):
+            ...
+    archivo.metricas = medicion.resultado()
+
+Cada etapa acumula segundos, consultas SQL, filas y, con
+INGESTA_MEDIR_MEMORIA=True, pico de memoria (tracemalloc; apagado por
+defecto porque hace más lento el trabajo). Una etapa puede abrirse muchas
+veces (una por fila) y se suma.
+
+Con `perfil=<ruta>` se guarda además un cProfile del trabajo completo
+(abrir con `python -m pstats <ruta>` o snakeviz).
+"""
+import cProfile
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+
+# tracemalloc es global del proceso y varias mediciones pueden correr a la
+# vez (hilos): lo enciende la primera, lo apaga la última, y el pico solo se
+# reinicia si hay una sola (si no, las etapas reportan el pico de todas).
+# Si ya estaba encendido por fuera (python -X tracemalloc) no se toca.
+_memoria_lock = threading.Lock()
+_memoria_usuarios = 0
+_memoria_propia = False
+
+
+def _empezar_memoria():
+    global _memoria_usuarios, _memoria_propia
+    with _memoria_lock:
+        if _memoria_usuarios == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _memoria_propia = True
+        _memoria_usuarios += 1
+
+
+def _terminar_memoria():
+    global _memoria_usuarios, _memoria_propia
+    with _memoria_lock:
+        _memoria_usuarios -= 1
+        if _memoria_usuarios == 0 and _memoria_propia:
+            tracemalloc.stop()
+            _memoria_propia = False
+
+
+def _pico_memoria(reiniciar=False):
+    """Pico (bytes) desde el último reinicio; 0 si tracemalloc no está activo."""
+    with _memoria_lock:
+        if not tracemalloc.is_tracing():
+            return 0
+        pico = tracemalloc.get_traced_memory()[1]
+        if reiniciar and _memoria_propia and _memoria_usuarios == 1:
+            tracemalloc.reset_peak()
+        return pico
+
+
+class MedicionEtapas:
+    def __init__(self, medir_memoria=None, perfil=None):
+        if medir_memoria is None:
+            medir_memoria = getattr(settings, "INGESTA_MEDIR_MEMORIA", False)
+        self.medir_memoria = medir_memoria
+        self.perfil = perfil
+        self.etapas = {}
+        self.consultas = 0
+        self.segundos = 0.0
+        self.memoria_pico = 0
+
+    # execute_wrapper: cuenta todas las consultas del trabajo
+    def __call__(self, execute, sql, params, many, context):
+        self.consultas += 1
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def activa(self):
+        inicio = time.perf_counter()
+        if self.medir_memoria:
+            _empezar_memoria()
+        perfilador = cProfile.Profile() if self.perfil else None
+
+        try:
+            with ExitStack() as pila:
+                for alias in connections:
+                    pila.enter_context(connections[alias].execute_wrapper(self))
+                if perfilador is not None:
+                    perfilador.enable()
+                try:
+                    yield self
+                finally:
+                    if perfilador is not None:
+                        perfilador.disable()
+        finally:
+            self.segundos = time.perf_counter() - inicio
+            if self.medir_memoria:
+                self.memoria_pico = max(self.memoria_pico, _pico_memoria())
+                _terminar_memoria()
+            if perfilador is not None:
+                os.makedirs(os.path.dirname(self.perfil) or ".", exist_ok=True)
+                perfilador.dump_stats(self.perfil)
+
+    @contextmanager
+    def etapa(self, nombre, filas=0):
+        datos = self.etapas.setdefault(nombre, {"segundos": 0.0, "consultas": 0, "filas": 0, "memoria_pico_kb": 0})
+        consultas_antes = self.consultas
+        if self.medir_memoria:
+            self.memoria_pico = max(self.memoria_pico, _pico_memoria(reiniciar=True))
+        inicio = time.perf_counter()
+        try:
+            yield datos
+        finally:
+            datos["segundos"] += time.perf_counter() - inicio
+            datos["consultas"] += self.consultas - consultas_antes
+            datos["filas"] += filas
+            if self.medir_memoria:
+                pico = _pico_memoria()
+                self.memoria_pico = max(self.memoria_pico, pico)
+                datos["memoria_pico_kb"] = max(datos["memoria_pico_kb"], pico // 1024)
+
+    def resultado(self):
+        etapas = [
+            {"nombre": nombre, **{k: round(v, 4) if isinstance(v, float) else v for k, v in datos.items()}}
+            for nombre, datos in self.etapas.items()
+        ]
+        resultado = {
+            "segundos": round(self.segundos, 4),
+            "consultas": self.consultas,
+            "etapas": etapas,
+        }
+        if self.medir_memoria:
+            resultado["memoria_pico_kb"] = self.memoria_pico // 1024
+        if self.perfil:
+            resultado["perfil"] = self.perfil
+        return resultado
+
+
+def ruta_perfil(prefijo, identificador):
+    """Archivo .prof para un trabajo, o None si INGESTA_PERFIL está apagado."""
+    if not getattr(settings, "INGESTA_PERFIL", False):
+        return None
+    directorio = getattr(settings, "INGESTA_PERFIL_DIR", os.path.join(settings.BASE_DIR, "perfiles"))
+    return os.path.join(directorio, f"{prefijo}_{identificador}_{time.strftime('%Y%m%d-%H%M%S')}.prof")
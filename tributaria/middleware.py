@@ -0,0 +1,12 @@
+from .auditoria import buffer_bitacora
+
+
+class BitacoraMiddleware:
+    """Agrupa las escrituras de bitácora de la petición en bulk_create (ver auditoria.py)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with buffer_bitacora():
+            return self.get_response(request)
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:30
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tributaria', '0005_documentopdf_anio_tributario_documentopdf_estado_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioCalificacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calificacion_id', models.BigIntegerField(db_index=True)),
+                ('operacion', models.CharField(choices=[('CREAR', 'Crear'), ('ACTUALIZAR', 'Actualizar'), ('ELIMINAR', 'Eliminar')], max_length=10)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('datos', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+            ],
+            options={
+                'verbose_name': 'Cambio de calificación',
+                'verbose_name_plural': 'Cambios de calificaciones',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:34
+
+from datetime import date
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Copia congelada de tributaria/particiones.py tal como estaba al escribir
+# esta migración: si ese módulo cambia, la migración tiene que seguir
+# dejando la misma tabla.
+TABLA = "tributaria_bitacora"
+
+
+def _mes_siguiente(d):
+    return date(d.year + (d.month // 12), d.month % 12 + 1, 1)
+
+
+def _sql_particion_mensual(mes):
+    return (
+        f'CREATE TABLE "{TABLA}_{mes:%Y_%m}" PARTITION OF {TABLA} '
+        f"FOR VALUES FROM ('{mes:%Y-%m-%d}') TO ('{_mes_siguiente(mes):%Y-%m-%d}')"
+    )
+
+
+SQL_PARTICIONAR = f"""
+ALTER TABLE {TABLA} RENAME TO {TABLA}_sin_particion;
+CREATE SEQUENCE {TABLA}_part_id_seq;
+CREATE TABLE {TABLA} (
+    id bigint NOT NULL DEFAULT nextval('{TABLA}_part_id_seq'),
+    accion varchar(255) NOT NULL,
+    entidad varchar(100) NOT NULL,
+    id_registro integer NULL,
+    fecha timestamp with time zone NOT NULL,
+    detalle text NOT NULL,
+    usuario_id bigint NULL REFERENCES cuentas_usuario (id) DEFERRABLE INITIALLY DEFERRED,
+    PRIMARY KEY (id, fecha)
+) PARTITION BY RANGE (fecha);
+CREATE TABLE {TABLA}_default PARTITION OF {TABLA} DEFAULT;
+"""
+
+# Después de crear las particiones de los próximos meses: las filas de esos
+# meses van directo a su partición y no quedan en DEFAULT
+SQL_COPIAR_FILAS = f"""
+INSERT INTO {TABLA} (id, accion, entidad, id_registro, fecha, detalle, usuario_id)
+    SELECT id, accion, entidad, id_registro, fecha, detalle, usuario_id FROM {TABLA}_sin_particion;
+SELECT setval('{TABLA}_part_id_seq', COALESCE((SELECT MAX(id) FROM {TABLA}), 0) + 1, false);
+ALTER SEQUENCE {TABLA}_part_id_seq OWNED BY {TABLA}.id;
+DROP TABLE {TABLA}_sin_particion;
+CREATE INDEX {TABLA}_usuario_id_part_idx ON {TABLA} (usuario_id);
+"""
+
+# Vuelta a una tabla normal con la forma que creó 0001 (id identity como
+# BigAutoField). Borrar la particionada borra sus particiones y su secuencia.
+SQL_DESPARTICIONAR = f"""
+ALTER TABLE {TABLA} RENAME TO {TABLA}_particionada;
+CREATE TABLE {TABLA} (
+    id bigint NOT NULL PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+    accion varchar(255) NOT NULL,
+    entidad varchar(100) NOT NULL,
+    id_registro integer NULL,
+    fecha timestamp with time zone NOT NULL,
+    detalle text NOT NULL,
+    usuario_id bigint NULL REFERENCES cuentas_usuario (id) DEFERRABLE INITIALLY DEFERRED
+);
+INSERT INTO {TABLA} (id, accion, entidad, id_registro, fecha, detalle, usuario_id)
+    SELECT id, accion, entidad, id_registro, fecha, detalle, usuario_id FROM {TABLA}_particionada;
+SELECT setval(pg_get_serial_sequence('{TABLA}', 'id'), COALESCE((SELECT MAX(id) FROM {TABLA}), 0) + 1, false);
+DROP TABLE {TABLA}_particionada;
+CREATE INDEX {TABLA}_usuario_id_idx ON {TABLA} (usuario_id);
+"""
+
+
+def particionar_bitacora(apps, schema_editor):
+    # Solo PostgreSQL: tabla particionada por mes (ver tributaria/particiones.py)
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(SQL_PARTICIONAR)
+    mes = date.today().replace(day=1)
+    for _ in range(3):
+        schema_editor.execute(_sql_particion_mensual(mes))
+        mes = _mes_siguiente(mes)
+    schema_editor.execute(SQL_COPIAR_FILAS)
+
+
+def desparticionar_bitacora(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(SQL_DESPARTICIONAR)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tributaria', '0007_exportacioncalificaciones'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(particionar_bitacora, desparticionar_bitacora),
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['fecha', 'usuario', 'entidad'], name='bitacora_fecha_usr_ent_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tributaria', '0008_bitacora_fecha_usuario_entidad'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['fecha', 'id'], name='bitacora_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['usuario', 'fecha', 'id'], name='bitacora_usr_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['entidad', 'fecha', 'id'], name='bitacora_ent_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['id_registro', 'fecha', 'id'], name='bitacora_idreg_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['accion', 'fecha', 'id'], name='bitacora_accion_fecha_idx'),
+        ),
+    ]
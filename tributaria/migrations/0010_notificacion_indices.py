@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tributaria', '0009_bitacora_indices_explorador'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['usuario', 'leida', 'fecha'], name='notif_usr_leida_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['usuario', 'fecha', 'id'], name='notif_usr_fecha_id_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tributaria', '0010_notificacion_indices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivotributario',
+            name='metricas',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:05
+
+import re
+import unicodedata
+
+from django.db import DatabaseError, migrations, models, transaction
+
+
+# Copia congelada de tributaria/rut.py y tributaria/emisores.py tal como
+# estaban al escribir esta migración: si esos módulos cambian, la migración
+# tiene que seguir rellenando igual.
+_RE_RUT = re.compile(r"^0*(\d{1,8})-?([0-9K])$")
+_RE_SEPARADORES = re.compile(r"[.\s]")
+_RE_ESPACIOS = re.compile(r"\s+")
+LARGO_NOMBRE_BUSQUEDA = 150
+INDICE_TRIGRAMA = "emisor_nombre_trgm_idx"
+
+
+def _normalizar_rut(rut):
+    if rut is None:
+        return None
+    coincidencia = _RE_RUT.match(_RE_SEPARADORES.sub("", str(rut)).upper())
+    if coincidencia is None or int(coincidencia.group(1)) == 0:
+        return None
+    return int(coincidencia.group(1)), coincidencia.group(2)
+
+
+def _normalizar_nombre(nombre):
+    sin_tildes = unicodedata.normalize("NFKD", str(nombre or ""))
+    sin_tildes = "".join(c for c in sin_tildes if not unicodedata.combining(c))
+    return _RE_ESPACIOS.sub(" ", sin_tildes).strip().lower()[:LARGO_NOMBRE_BUSQUEDA]
+
+
+def _completar_campos(emisor):
+    normalizado = _normalizar_rut(emisor.rut)
+    if normalizado is not None:
+        emisor.rut_cuerpo, emisor.rut_dv = normalizado
+        emisor.rut = f"{normalizado[0]}-{normalizado[1]}"
+    else:
+        emisor.rut_cuerpo, emisor.rut_dv = None, ""
+    emisor.nombre_busqueda = _normalizar_nombre(emisor.nombre)
+    return emisor
+
+
+def completar_emisores(apps, schema_editor):
+    Emisor = apps.get_model("tributaria", "Emisor")
+    alias = schema_editor.connection.alias
+    lote = []
+    for emisor in Emisor.objects.using(alias).order_by("id").iterator(chunk_size=2000):
+        lote.append(_completar_campos(emisor))
+        if len(lote) >= 2000:
+            Emisor.objects.using(alias).bulk_update(lote, ["rut", "rut_cuerpo", "rut_dv", "nombre_busqueda"])
+            lote = []
+    if lote:
+        Emisor.objects.using(alias).bulk_update(lote, ["rut", "rut_cuerpo", "rut_dv", "nombre_busqueda"])
+
+
+def indice_trigrama(apps, schema_editor):
+    """
+    Solo PostgreSQL: índice GIN con pg_trgm para buscar por "contiene" en
+    nombre_busqueda. Si la extensión no se puede instalar (permisos) se
+    sigue sin él: la búsqueda funciona igual, recorriendo la tabla.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+    try:
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {INDICE_TRIGRAMA} "
+                "ON tributaria_emisor USING gin (nombre_busqueda gin_trgm_ops)"
+            )
+    except DatabaseError:
+        pass
+
+
+def quitar_indice_trigrama(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"DROP INDEX IF EXISTS {INDICE_TRIGRAMA}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tributaria', '0011_archivotributario_metricas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emisor',
+            name='nombre_busqueda',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=150),
+        ),
+        migrations.AddField(
+            model_name='emisor',
+            name='rut_cuerpo',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='emisor',
+            name='rut_dv',
+            field=models.CharField(blank=True, default='', editable=False, max_length=1),
+        ),
+        migrations.RunPython(completar_emisores, migrations.RunPython.noop),
+        migrations.RunPython(indice_trigrama, quitar_indice_trigrama),
+    ]
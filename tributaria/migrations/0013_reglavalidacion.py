@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:18
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Las validaciones que antes estaban fijas en ingesta.py
+REGLAS_INICIALES = [
+    ("rut_contribuyente obligatorio", "rut_contribuyente", "OBLIGATORIO", None, None, 10),
+    ("nombre_contribuyente obligatorio", "nombre_contribuyente", "OBLIGATORIO", None, None, 20),
+    ("rut_emisor obligatorio", "rut_emisor", "OBLIGATORIO", None, None, 30),
+    ("nombre_emisor obligatorio", "nombre_emisor", "OBLIGATORIO", None, None, 40),
+    ("Monto positivo", "monto_bruto", "MAYOR", Decimal("0"), None, 50),
+    ("Factor positivo", "factor", "MAYOR", Decimal("0"), None, 60),
+    ("Año tributario 2000-2100", "anio_tributario", "ENTRE", Decimal("2000"), Decimal("2100"), 70),
+]
+
+
+def crear_reglas_iniciales(apps, schema_editor):
+    ReglaValidacion = apps.get_model("tributaria", "ReglaValidacion")
+    ReglaValidacion.objects.using(schema_editor.connection.alias).bulk_create(
+        ReglaValidacion(nombre=nombre, campo=campo, operador=operador, valor=valor, valor_max=valor_max, orden=orden)
+        for nombre, campo, operador, valor, valor_max, orden in REGLAS_INICIALES
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tributaria', '0012_emisor_rut_normalizado'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReglaValidacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('campo', models.CharField(choices=[('rut_contribuyente', 'RUT contribuyente'), ('nombre_contribuyente', 'Nombre contribuyente'), ('rut_emisor', 'RUT emisor'), ('nombre_emisor', 'Nombre emisor'), ('monto_bruto', 'Monto bruto'), ('factor', 'Factor'), ('anio_tributario', 'Año tributario')], max_length=30)),
+                ('operador', models.CharField(choices=[('OBLIGATORIO', 'Obligatorio'), ('MAYOR', 'Mayor que'), ('MAYOR_IGUAL', 'Mayor o igual que'), ('MENOR', 'Menor que'), ('MENOR_IGUAL', 'Menor o igual que'), ('ENTRE', 'Entre (inclusive)')], max_length=15)),
+                ('valor', models.DecimalField(blank=True, decimal_places=5, max_digits=20, null=True)),
+                ('valor_max', models.DecimalField(blank=True, decimal_places=5, help_text="Solo para 'Entre'.", max_digits=20, null=True)),
+                ('solo_anio', models.IntegerField(blank=True, help_text='Aplicar solo a este año tributario.', null=True)),
+                ('solo_rut_emisor', models.CharField(blank=True, help_text='Aplicar solo a este emisor (RUT).', max_length=20)),
+                ('mensaje', models.CharField(blank=True, help_text='Vacío: se genera a partir de la regla.', max_length=255)),
+                ('orden', models.PositiveIntegerField(default=100)),
+                ('activa', models.BooleanField(default=True)),
+                ('fecha_modificacion', models.DateTimeField(auto_now=True)),
+                ('usuario_modificacion', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Regla de validación',
+                'verbose_name_plural': 'Reglas de validación',
+                'ordering': ['orden', 'id'],
+            },
+        ),
+        migrations.RunPython(crear_reglas_iniciales, migrations.RunPython.noop),
+    ]
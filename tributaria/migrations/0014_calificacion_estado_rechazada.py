@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tributaria', '0013_reglavalidacion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='calificaciontributaria',
+            name='estado',
+            field=models.CharField(choices=[('BORRADOR', 'Borrador'), ('VALIDADA', 'Validada'), ('PUBLICADA', 'Publicada'), ('RECHAZADA', 'Rechazada')], default='BORRADOR', max_length=20),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tributaria', '0014_calificacion_estado_rechazada'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FactorEmisor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('anio_tributario', models.IntegerField()),
+                ('factor', models.DecimalField(decimal_places=5, max_digits=10)),
+                ('fecha_modificacion', models.DateTimeField(auto_now=True)),
+                ('emisor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='factores', to='tributaria.emisor')),
+                ('usuario_modificacion', models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Factor de emisor',
+                'verbose_name_plural': 'Factores de emisores',
+                'constraints': [models.UniqueConstraint(fields=('emisor', 'anio_tributario'), name='factor_emisor_anio_unico')],
+            },
+        ),
+    ]
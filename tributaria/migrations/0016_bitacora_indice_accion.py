@@ -0,0 +1,42 @@
+from django.db import migrations
+
+# Mismo texto que arma Django para accion__istartswith en PostgreSQL:
+# UPPER("accion"::text) LIKE UPPER('texto%'). Con text_pattern_ops el LIKE
+# por prefijo usa el índice sin importar la collation de la base.
+INDICE_ACCION = "bitacora_accion_prefijo_idx"
+
+
+def crear_indice_accion(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {INDICE_ACCION} "
+        "ON tributaria_bitacora (UPPER(accion::text) text_pattern_ops)"
+    )
+
+
+def borrar_indice_accion(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"DROP INDEX IF EXISTS {INDICE_ACCION}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tributaria', '0015_factoremisor'),
+    ]
+
+    operations = [
+        # (fecha, usuario, entidad) lo cubren bitacora_fecha_id_idx y los
+        # índices por usuario/entidad; (accion, fecha, id) no sirve para
+        # UPPER(accion) LIKE ... en PostgreSQL
+        migrations.RemoveIndex(
+            model_name='bitacora',
+            name='bitacora_fecha_usr_ent_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='bitacora',
+            name='bitacora_accion_fecha_idx',
+        ),
+        migrations.RunPython(crear_indice_accion, borrar_indice_accion),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations, models
+from django.db.models import F, Max
+
+CONTADOR = "cambios_calificaciones"
+
+
+def numerar_existentes(apps, schema_editor):
+    # Lo ya registrado conserva su id como secuencia: los cursores que tienen
+    # los clientes siguen sirviendo
+    CambioCalificacion = apps.get_model("tributaria", "CambioCalificacion")
+    ContadorSecuencia = apps.get_model("tributaria", "ContadorSecuencia")
+    CambioCalificacion.objects.filter(secuencia__isnull=True).update(secuencia=F("id"))
+    ultima = CambioCalificacion.objects.aggregate(m=Max("secuencia"))["m"] or 0
+    ContadorSecuencia.objects.update_or_create(nombre=CONTADOR, defaults={"valor": ultima})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tributaria', '0016_bitacora_indice_accion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorSecuencia',
+            fields=[
+                ('nombre', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('valor', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='cambiocalificacion',
+            name='secuencia',
+            field=models.BigIntegerField(blank=True, null=True, unique=True),
+        ),
+        migrations.RunPython(numerar_existentes, migrations.RunPython.noop),
+    ]
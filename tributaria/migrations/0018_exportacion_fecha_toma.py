@@ -0,0 +1,35 @@
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def marcar_tomadas(apps, schema_editor):
+    # Las que están en proceso al migrar cuentan su plazo desde ahora: un
+    # worker vivo puede estar generándolas
+    ExportacionCalificaciones = apps.get_model("tributaria", "ExportacionCalificaciones")
+    ExportacionCalificaciones.objects.filter(estado="PROCESANDO").update(fecha_toma=timezone.now(), intentos=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tributaria', '0017_cambiocalificacion_secuencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportacioncalificaciones',
+            name='fecha_toma',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='exportacioncalificaciones',
+            name='intentos',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='exportacioncalificaciones',
+            name='huella',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.RunPython(marcar_tomadas, migrations.RunPython.noop),
+    ]
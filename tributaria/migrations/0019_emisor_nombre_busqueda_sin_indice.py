@@ -0,0 +1,18 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tributaria', '0018_exportacion_fecha_toma'),
+    ]
+
+    operations = [
+        # El B-tree no servía para nombre_busqueda__contains; en PostgreSQL la
+        # búsqueda usa el índice trigrama de la migración 0012
+        migrations.AlterField(
+            model_name='emisor',
+            name='nombre_busqueda',
+            field=models.CharField(blank=True, default='', editable=False, max_length=150),
+        ),
+    ]
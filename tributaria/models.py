@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 
 
 Usuario = settings.AUTH_USER_MODEL
@@ -13,6 +14,11 @@ class Emisor(models.Model):
     nombre = models.CharField(max_length=150)
     rut = models.CharField(max_length=20)
     email_contacto = models.CharField(max_length=100, blank=True)
+    # Derivados de rut y nombre al guardar (tributaria/emisores.py: completar_campos)
+    rut_cuerpo = models.PositiveIntegerField(null=True, blank=True, db_index=True, editable=False)
+    rut_dv = models.CharField(max_length=1, blank=True, default="", editable=False)
+    # Sin db_index: se busca por "contiene" (índice trigrama en PostgreSQL, migración 0012)
+    nombre_busqueda = models.CharField(max_length=150, blank=True, default="", editable=False)
 
     def __str__(self):
         return f"{self.nombre} ({self.rut})"
@@ -37,6 +43,8 @@ class ArchivoTributario(models.Model):
     emisor = models.ForeignKey(Emisor, on_delete=models.SET_NULL, null=True, blank=True)
     estado = models.CharField(max_length=20, default='PENDIENTE')  # PENDIENTE, PROCESADO, CON_ERRORES
     mensaje_estado = models.TextField(blank=True)
+    # Tiempo, consultas, filas y memoria por etapa de la carga (tributaria/medicion.py)
+    metricas = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return f"{self.nombre_original} ({self.tipo_archivo})"
@@ -50,6 +58,7 @@ class CalificacionTributaria(models.Model):
         ('BORRADOR', 'Borrador'),
         ('VALIDADA', 'Validada'),
         ('PUBLICADA', 'Publicada'),
+        ('RECHAZADA', 'Rechazada'),
     ]
 
     archivo_origen = models.ForeignKey(ArchivoTributario, on_delete=models.SET_NULL, null=True, blank=True)
@@ -70,6 +79,47 @@ class CalificacionTributaria(models.Model):
 
 
 
+class CambioCalificacion(models.Model):
+    """
+    Registro de cambios de calificaciones para sincronización incremental.
+    La secuencia se asigna al confirmar (cambios.asignar_secuencias), no al
+    insertar: crece en orden de visibilidad, así que un cliente pide "todo lo
+    posterior a la última secuencia que vi" sin perder cambios de
+    transacciones que confirmaron tarde.
+    """
+    OPERACION_CHOICES = [
+        ('CREAR', 'Crear'),
+        ('ACTUALIZAR', 'Actualizar'),
+        ('ELIMINAR', 'Eliminar'),
+    ]
+
+    calificacion_id = models.BigIntegerField(db_index=True)  # sin FK: debe sobrevivir al borrado
+    operacion = models.CharField(max_length=10, choices=OPERACION_CHOICES)
+    fecha = models.DateTimeField(auto_now_add=True)
+    datos = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    secuencia = models.BigIntegerField(null=True, blank=True, unique=True)  # None: aún sin asignar
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name = "Cambio de calificación"
+        verbose_name_plural = "Cambios de calificaciones"
+
+    def __str__(self):
+        return f"#{self.id} {self.operacion} calificación {self.calificacion_id}"
+
+
+class ContadorSecuencia(models.Model):
+    """
+    Última secuencia asignada a un registro. Su fila se bloquea
+    (select_for_update) para que las asignaciones se hagan de a una.
+    """
+    nombre = models.CharField(max_length=50, primary_key=True)
+    valor = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.nombre}: {self.valor}"
+
+
 
 class Bitacora(models.Model):
     """
@@ -82,6 +132,17 @@ class Bitacora(models.Model):
     fecha = models.DateTimeField(auto_now_add=True)
     detalle = models.TextField(blank=True)
 
+    class Meta:
+        # Paginación keyset (-fecha, -id) con y sin filtros del explorador.
+        # El filtro por acción (istartswith) usa un índice de expresión
+        # UPPER(accion) que solo existe en PostgreSQL (migración 0016).
+        indexes = [
+            models.Index(fields=["fecha", "id"], name="bitacora_fecha_id_idx"),
+            models.Index(fields=["usuario", "fecha", "id"], name="bitacora_usr_fecha_idx"),
+            models.Index(fields=["entidad", "fecha", "id"], name="bitacora_ent_fecha_idx"),
+            models.Index(fields=["id_registro", "fecha", "id"], name="bitacora_idreg_fecha_idx"),
+        ]
+
     def __str__(self):
         return f"[{self.fecha}] {self.usuario} - {self.accion}"
 
@@ -100,9 +161,18 @@ class Notificacion(models.Model):
     )
     mensaje = models.CharField(max_length=255)
     nivel = models.CharField(max_length=10, choices=NIVEL_CHOICES, default="INFO")
+    enlace = models.CharField(max_length=255, blank=True)  # p.ej. descarga de una exportación
     leida = models.BooleanField(default=False)
     fecha = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # no leídas de un usuario / marcar todas como leídas
+            models.Index(fields=["usuario", "leida", "fecha"], name="notif_usr_leida_fecha_idx"),
+            # bandeja paginada (-fecha, -id)
+            models.Index(fields=["usuario", "fecha", "id"], name="notif_usr_fecha_id_idx"),
+        ]
+
     def __str__(self):
         return f"{self.usuario} - {self.mensaje[:40]}"
 
@@ -160,4 +230,118 @@ class DocumentoPDF(models.Model):
     )
 
     def __str__(self):
-        return f"{self.nombre} ({self.rut_emisor or 'sin RUT'})"
\ No newline at end of file
+        return f"{self.nombre} ({self.rut_emisor or 'sin RUT'})"
+
+
+class ExportacionCalificaciones(models.Model):
+    """
+    Exportación a Excel encolada (listados muy grandes).
+    La genera el comando `procesar_exportaciones` y avisa con una Notificacion.
+    """
+    ESTADO_CHOICES = [
+        ("PENDIENTE", "Pendiente"),
+        ("PROCESANDO", "Procesando"),
+        ("LISTA", "Lista"),
+        ("ERROR", "Error"),
+    ]
+
+    usuario = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="exportaciones",
+    )
+    filtros = models.JSONField(default=dict, blank=True)
+    # filtros + versión de datos al generar el archivo: dos exportaciones con la
+    # misma huella dan el mismo archivo. Vacía hasta que el worker la toma.
+    huella = models.CharField(max_length=64, db_index=True, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default="PENDIENTE")
+    archivo = models.FileField(upload_to="exportaciones/", blank=True)
+    filas = models.IntegerField(null=True, blank=True)
+    mensaje = models.TextField(blank=True)
+    fecha_solicitud = models.DateTimeField(auto_now_add=True)
+    # Cuándo la tomó un worker y cuántas veces: una en PROCESANDO por más de
+    # EXPORTACION_TIMEOUT_MINUTOS (worker caído) se vuelve a tomar
+    fecha_toma = models.DateTimeField(null=True, blank=True)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Exportación de calificaciones"
+        verbose_name_plural = "Exportaciones de calificaciones"
+
+    def __str__(self):
+        return f"Exportación #{self.id} ({self.estado})"
+
+
+class ReglaValidacion(models.Model):
+    """
+    Regla de la carga masiva (Excel/CSV), editable por Analistas.
+    tributaria/reglas.py las compila a operaciones por columna y las evalúa
+    sobre cada lote de filas; se recompilan cuando alguna cambia.
+    """
+    CAMPO_CHOICES = [
+        ('rut_contribuyente', 'RUT contribuyente'),
+        ('nombre_contribuyente', 'Nombre contribuyente'),
+        ('rut_emisor', 'RUT emisor'),
+        ('nombre_emisor', 'Nombre emisor'),
+        ('monto_bruto', 'Monto bruto'),
+        ('factor', 'Factor'),
+        ('anio_tributario', 'Año tributario'),
+    ]
+    CAMPOS_NUMERICOS = ('monto_bruto', 'factor', 'anio_tributario')
+    OPERADOR_CHOICES = [
+        ('OBLIGATORIO', 'Obligatorio'),
+        ('MAYOR', 'Mayor que'),
+        ('MAYOR_IGUAL', 'Mayor o igual que'),
+        ('MENOR', 'Menor que'),
+        ('MENOR_IGUAL', 'Menor o igual que'),
+        ('ENTRE', 'Entre (inclusive)'),
+    ]
+
+    nombre = models.CharField(max_length=100)
+    campo = models.CharField(max_length=30, choices=CAMPO_CHOICES)
+    operador = models.CharField(max_length=15, choices=OPERADOR_CHOICES)
+    valor = models.DecimalField(max_digits=20, decimal_places=5, null=True, blank=True)
+    valor_max = models.DecimalField(
+        max_digits=20, decimal_places=5, null=True, blank=True, help_text="Solo para 'Entre'."
+    )
+    # Condiciones: la regla solo se aplica a las filas de ese año / emisor
+    solo_anio = models.IntegerField(null=True, blank=True, help_text="Aplicar solo a este año tributario.")
+    solo_rut_emisor = models.CharField(max_length=20, blank=True, help_text="Aplicar solo a este emisor (RUT).")
+    mensaje = models.CharField(max_length=255, blank=True, help_text="Vacío: se genera a partir de la regla.")
+    orden = models.PositiveIntegerField(default=100)
+    activa = models.BooleanField(default=True)
+    fecha_modificacion = models.DateTimeField(auto_now=True)
+    usuario_modificacion = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, editable=False)
+
+    class Meta:
+        ordering = ["orden", "id"]
+        verbose_name = "Regla de validación"
+        verbose_name_plural = "Reglas de validación"
+
+    def __str__(self):
+        return self.nombre
+
+
+class FactorEmisor(models.Model):
+    """
+    Factor vigente de un emisor para un año tributario (tabla del SII).
+    `manage.py recalcular_montos_calificados` lo carga desde un archivo y
+    ajusta factor y monto_calificado de las calificaciones (tributaria/factores.py).
+    """
+    emisor = models.ForeignKey(Emisor, on_delete=models.CASCADE, related_name="factores")
+    anio_tributario = models.IntegerField()
+    factor = models.DecimalField(max_digits=10, decimal_places=5)
+    fecha_modificacion = models.DateTimeField(auto_now=True)
+    usuario_modificacion = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, editable=False)
+
+    class Meta:
+        constraints = [
+            # Además es el índice del que lee el UPDATE del recálculo
+            models.UniqueConstraint(fields=["emisor", "anio_tributario"], name="factor_emisor_anio_unico"),
+        ]
+        verbose_name = "Factor de emisor"
+        verbose_name_plural = "Factores de emisores"
+
+    def __str__(self):
+        return f"{self.emisor} {self.anio_tributario}: {self.factor}"
@@ -0,0 +1,51 @@
+"""
+Contador de notificaciones no leídas por usuario.
+
+Se guarda en caché para que base.html muestre el badge sin un COUNT por
+página. Se mantiene al crear (señal post_save) y al marcar como leídas;
+si la clave no está en caché, se recalcula con un COUNT una sola vez.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from config.metricas import contar_cache
+
+from .models import Notificacion
+
+
+def _clave(usuario_id):
+    return f"tributaria:no_leidas:{usuario_id}"
+
+
+def _segundos():
+    return getattr(settings, "NOTIFICACIONES_CONTADOR_SEGUNDOS", 3600)
+
+
+def contar_no_leidas(usuario):
+    cantidad = cache.get(_clave(usuario.pk))
+    contar_cache("no_leidas", cantidad is not None)
+    if cantidad is None:
+        cantidad = Notificacion.objects.filter(usuario=usuario, leida=False).count()
+        cache.set(_clave(usuario.pk), cantidad, _segundos())
+    return cantidad
+
+
+def sumar_no_leidas(usuario_id, cantidad=1):
+    try:
+        cache.incr(_clave(usuario_id), cantidad)
+    except ValueError:
+        # No estaba en caché: se calculará en la próxima lectura
+        pass
+
+
+def marcar_todas_leidas(usuario):
+    """Un solo UPDATE. Devuelve cuántas se marcaron."""
+    marcadas = Notificacion.objects.filter(usuario=usuario, leida=False).update(leida=True)
+    cache.set(_clave(usuario.pk), 0, _segundos())
+    return marcadas
+
+
+def invalidar_no_leidas(usuario_ids):
+    """Descarta el contador cacheado (p.ej. tras borrar notificaciones)."""
+    if usuario_ids:
+        cache.delete_many([_clave(u) for u in usuario_ids])
@@ -0,0 +1,60 @@
+"""
+Paginación keyset sobre (fecha, id) descendente.
+
+El cursor guarda la (fecha, id) de la última fila mostrada y la página
+siguiente pide lo "anterior" a eso, apoyándose en índices que terminan en
+(fecha, id): el costo no crece con la profundidad como con OFFSET.
+"""
+import base64
+from datetime import datetime, time
+
+from django.db.models import Q
+from django.utils import timezone
+
+
+def inicio_dia(dia):
+    """Datetime aware del inicio del día (para filtrar por rango y no con __date)."""
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def codificar_cursor(fila, campo_fecha="fecha"):
+    crudo = f"{fila[campo_fecha].isoformat()}|{fila['id']}".encode("utf-8")
+    return base64.urlsafe_b64encode(crudo).decode("ascii")
+
+
+def decodificar_cursor(cursor):
+    """Devuelve (fecha, id) o None si el cursor no es válido."""
+    try:
+        fecha, id_ = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(fecha), int(id_)
+    except Exception:
+        return None
+
+
+def despues_de(qs, fecha, id_, campo_fecha="fecha"):
+    return qs.filter(Q(**{f"{campo_fecha}__lt": fecha}) | Q(**{campo_fecha: fecha, "id__lt": id_}))
+
+
+def pagina_keyset(qs, campos, cursor=None, tamano=100, campo_fecha="fecha"):
+    """Devuelve (filas, cursor_siguiente|None). `campos` debe incluir id y la fecha."""
+    qs = qs.order_by(f"-{campo_fecha}", "-id")
+    posicion = decodificar_cursor(cursor) if cursor else None
+    if posicion:
+        qs = despues_de(qs, *posicion, campo_fecha=campo_fecha)
+
+    filas = list(qs.values(*campos)[: tamano + 1])
+    siguiente = codificar_cursor(filas[tamano - 1], campo_fecha) if len(filas) > tamano else None
+    return filas[:tamano], siguiente
+
+
+def iterar_keyset(qs, campos, lote=2000, campo_fecha="fecha"):
+    """Recorre todo el resultado por lotes keyset (exportaciones sin cargar todo en memoria)."""
+    qs = qs.order_by(f"-{campo_fecha}", "-id")
+    posicion = None
+    while True:
+        pagina = qs if posicion is None else despues_de(qs, *posicion, campo_fecha=campo_fecha)
+        filas = list(pagina.values(*campos)[:lote])
+        if not filas:
+            return
+        yield from filas
+        posicion = (filas[-1][campo_fecha], filas[-1]["id"])
@@ -0,0 +1,83 @@
+"""
+Particiones mensuales de Bitácora (solo PostgreSQL).
+
+La migración 0008 convierte tributaria_bitacora en una tabla particionada
+por RANGE(fecha) con una partición DEFAULT; `manage.py crear_particiones_bitacora`
+crea por adelantado las particiones de los próximos meses (y, si llegó
+tarde, pasa a la nueva partición las filas que cayeron en DEFAULT). En
+MySQL/SQLite no se particiona: bastan los índices de Bitacora y el archivado
+de `manage.py archivar_bitacora`.
+"""
+from datetime import date
+
+from django.db import connection as conexion_por_defecto, transaction
+
+
+TABLA = "tributaria_bitacora"
+COLUMNAS = "id, accion, entidad, id_registro, fecha, detalle, usuario_id"
+
+
+def soporta_particiones(connection=None):
+    return (connection or conexion_por_defecto).vendor == "postgresql"
+
+
+def _mes_siguiente(d):
+    return date(d.year + (d.month // 12), d.month % 12 + 1, 1)
+
+
+def nombre_particion(mes):
+    return f"{TABLA}_{mes:%Y_%m}"
+
+
+def crear_particion_mensual(mes, connection=None):
+    """
+    Crea la partición del mes indicado si no existe. Devuelve True si la creó.
+
+    Si la DEFAULT ya tiene filas de ese mes (se escribieron antes de crear la
+    partición), PostgreSQL no deja crearla encima: se desengancha la DEFAULT,
+    se crea la partición, se le pasan esas filas y se vuelve a enganchar la
+    DEFAULT, todo en una transacción. Mientras dura, las lecturas y escrituras
+    de bitácora esperan (la tabla queda bloqueada).
+    """
+    connection = connection or conexion_por_defecto
+    mes = date(mes.year, mes.month, 1)
+    nombre = nombre_particion(mes)
+    rango = [mes, _mes_siguiente(mes)]
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [nombre])
+        if cursor.fetchone()[0] is not None:
+            return False
+        # El CREATE ... PARTITION OF igual lo toma; pedirlo antes evita que
+        # entre una fila del mes a la DEFAULT entre la revisión y el CREATE
+        cursor.execute(f"LOCK TABLE {TABLA} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {TABLA}_default WHERE fecha >= %s AND fecha < %s)", rango
+        )
+        en_default = cursor.fetchone()[0]
+        if en_default:
+            cursor.execute(f"ALTER TABLE {TABLA} DETACH PARTITION {TABLA}_default")
+        cursor.execute(
+            f'CREATE TABLE "{nombre}" PARTITION OF {TABLA} '
+            f"FOR VALUES FROM ('{mes:%Y-%m-%d}') TO ('{_mes_siguiente(mes):%Y-%m-%d}')"
+        )
+        if en_default:
+            cursor.execute(
+                f"INSERT INTO {TABLA} ({COLUMNAS}) SELECT {COLUMNAS} FROM {TABLA}_default "
+                "WHERE fecha >= %s AND fecha < %s",
+                rango,
+            )
+            cursor.execute(f"DELETE FROM {TABLA}_default WHERE fecha >= %s AND fecha < %s", rango)
+            cursor.execute(f"ALTER TABLE {TABLA} ATTACH PARTITION {TABLA}_default DEFAULT")
+    return True
+
+
+def crear_particiones(desde, meses, connection=None):
+    creadas = []
+    mes = date(desde.year, desde.month, 1)
+    for _ in range(meses):
+        if crear_particion_mensual(mes, connection):
+            creadas.append(nombre_particion(mes))
+        mes = _mes_siguiente(mes)
+    return creadas
+
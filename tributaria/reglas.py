@@ -0,0 +1,206 @@
+"""
+Reglas de validación de la carga masiva.
+
+Las reglas de negocio (obligatorios, rangos, topes por año o por emisor)
+están en la BD (ReglaValidacion) y las editan los Analistas. compilar()
+convierte cada regla en una función que recibe un lote ya preparado
+(DataFrame, ver preparar()) y devuelve una máscara: True = la fila no
+cumple. Así se evalúa el lote entero con operaciones por columna, no fila
+a fila.
+
+reglas_vigentes() guarda las reglas compiladas en memoria del proceso
+junto con la versión "reglas" con que se compilaron, y en cada llamada la
+compara con la versión de la caché compartida (versiones.py). Guardar o
+borrar una regla en cualquier worker cambia esa versión al hacer commit
+(signals.py) y la próxima carga de cada proceso las vuelve a compilar.
+
+Aparte van los chequeos que el formato exige siempre (sin ellos no se
+puede crear la calificación): RUT de emisor y nombre presentes, RUT con
+formato y dígito verificador, montos y año numéricos.
+"""
+import operator
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import TYPE_CHECKING, Callable
+
+from .models import ReglaValidacion
+from .rut import normalizar
+from .versiones import obtener_version
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+COLUMNAS_TEXTO = ("rut_contribuyente", "nombre_contribuyente", "rut_emisor", "nombre_emisor")
+COLUMNAS_RUT = ("rut_contribuyente", "rut_emisor")
+
+# Columna numérica -> mensaje si no se puede leer como número
+MENSAJES_NUMERICOS = {
+    "monto_bruto": "monto_bruto no es numérico",
+    "factor": "factor no es numérico",
+    "anio_tributario": "anio_tributario inválido",
+}
+
+_COMPARACIONES = {
+    "MAYOR": (operator.gt, "debe ser mayor a"),
+    "MAYOR_IGUAL": (operator.ge, "debe ser mayor o igual a"),
+    "MENOR": (operator.lt, "debe ser menor a"),
+    "MENOR_IGUAL": (operator.le, "debe ser menor o igual a"),
+}
+
+
+@dataclass
+class ReglaCompilada:
+    mensaje: str
+    incumple: Callable  # (lote preparado) -> ndarray de bool
+
+
+@dataclass
+class ReglasCompiladas:
+    version: int
+    obligatorias: list = field(default_factory=list)
+    resto: list = field(default_factory=list)
+
+    def evaluar(self, lote: "pd.DataFrame"):
+        """Lista con los mensajes de error de cada fila del lote (vacía = fila válida)."""
+        mensajes = [[] for _ in range(len(lote))]
+        chequeos = [*self.obligatorias, *CHEQUEOS_FIJOS, *self.resto]
+        for chequeo in chequeos:
+            for posicion in chequeo.incumple(lote).nonzero()[0]:
+                # Un obligatorio de la BD y el fijo del mismo campo no se repiten
+                if chequeo.mensaje not in mensajes[posicion]:
+                    mensajes[posicion].append(chequeo.mensaje)
+        return mensajes
+
+
+def _numero(valor):
+    """Decimal -> texto sin ceros de más (0, 2000, 0.5)."""
+    return format(Decimal(valor).normalize(), "f")
+
+
+def mensaje_por_defecto(regla):
+    if regla.operador == "OBLIGATORIO":
+        texto = f"{regla.campo} es obligatorio"
+    elif regla.operador == "ENTRE":
+        texto = f"{regla.campo} fuera de rango ({_numero(regla.valor)}-{_numero(regla.valor_max)})"
+    else:
+        texto = f"{regla.campo} {_COMPARACIONES[regla.operador][1]} {_numero(regla.valor)}"
+    condiciones = []
+    if regla.solo_anio is not None:
+        condiciones.append(f"año {regla.solo_anio}")
+    if regla.solo_rut_emisor:
+        condiciones.append(f"emisor {regla.solo_rut_emisor}")
+    return f"{texto} ({', '.join(condiciones)})" if condiciones else texto
+
+
+def compilar_regla(regla):
+    campo = regla.campo
+    if regla.operador == "OBLIGATORIO":
+        columna = f"{campo}:vacio" if campo in COLUMNAS_TEXTO else f"{campo}:nulo"
+
+        def base(lote):
+            return lote[columna].to_numpy()
+    else:
+        if regla.operador == "ENTRE":
+            minimo, maximo = float(regla.valor), float(regla.valor_max)
+
+            def cumple(valores):
+                return (valores >= minimo) & (valores <= maximo)
+        else:
+            comparar, limite = _COMPARACIONES[regla.operador][0], float(regla.valor)
+
+            def cumple(valores):
+                return comparar(valores, limite)
+
+        def base(lote):
+            valores = lote[campo].to_numpy()
+            # Lo no numérico ya lo marca el chequeo fijo
+            return ~lote[f"{campo}:nulo"].to_numpy() & ~cumple(valores)
+
+    filtros = []
+    if regla.solo_anio is not None:
+        anio = float(regla.solo_anio)
+        filtros.append(lambda lote: lote["anio_tributario"].to_numpy() == anio)
+    if regla.solo_rut_emisor:
+        normalizado = normalizar(regla.solo_rut_emisor)
+        cuerpo = normalizado[0] if normalizado else -1
+        filtros.append(lambda lote: lote["rut_emisor:cuerpo"].to_numpy() == cuerpo)
+
+    def incumple(lote):
+        mascara = base(lote)
+        for filtro in filtros:
+            mascara = mascara & filtro(lote)
+        return mascara
+
+    return ReglaCompilada(regla.mensaje or mensaje_por_defecto(regla), incumple)
+
+
+def compilar(reglas, version=0):
+    compiladas = ReglasCompiladas(version)
+    for regla in reglas:
+        destino = compiladas.obligatorias if regla.operador == "OBLIGATORIO" else compiladas.resto
+        destino.append(compilar_regla(regla))
+    return compiladas
+
+
+def _columna(nombre):
+    return lambda lote: lote[nombre].to_numpy()
+
+
+def _chequeos_fijos():
+    chequeos = [
+        ReglaCompilada("rut_emisor es obligatorio", _columna("rut_emisor:vacio")),
+        ReglaCompilada("nombre_emisor es obligatorio", _columna("nombre_emisor:vacio")),
+    ]
+    for campo in COLUMNAS_RUT:
+        chequeos.append(ReglaCompilada(f"{campo} no tiene formato de RUT (ej: 12345678-5)", _columna(f"{campo}:sin_formato")))
+        chequeos.append(ReglaCompilada(f"{campo} con dígito verificador incorrecto", _columna(f"{campo}:dv_malo")))
+    for campo, mensaje in MENSAJES_NUMERICOS.items():
+        chequeos.append(ReglaCompilada(mensaje, _columna(f"{campo}:nulo")))
+    return chequeos
+
+
+CHEQUEOS_FIJOS = _chequeos_fijos()
+
+_vigentes = None
+
+
+def reglas_vigentes():
+    """Reglas activas compiladas; se recompilan si la versión "reglas" compartida cambió."""
+    global _vigentes
+    version = obtener_version("reglas")
+    compiladas = _vigentes
+    if compiladas is None or compiladas.version != version:
+        compiladas = _vigentes = compilar(ReglaValidacion.objects.filter(activa=True), version)
+    return compiladas
+
+
+def preparar(df: "pd.DataFrame", ruts) -> "pd.DataFrame":
+    """
+    Columnas que usan las reglas, calculadas una vez para todo el archivo:
+    números ya convertidos (NaN si no se pudo), "<campo>:vacio" para textos,
+    "<campo>:nulo" para números y lo que resultó de validar los RUT
+    (`ruts`: campo -> rut.normalizar_columna).
+    """
+    import numpy as np
+    import pandas as pd
+
+    columnas = {}
+    for campo in COLUMNAS_TEXTO:
+        serie = df[campo]
+        columnas[campo] = serie
+        columnas[f"{campo}:vacio"] = (serie.isna() | (serie.astype(str).str.strip() == "")).to_numpy()
+    for campo in MENSAJES_NUMERICOS:
+        valores = pd.to_numeric(df[campo], errors="coerce").astype(float).to_numpy()
+        nulo = ~np.isfinite(valores)
+        if campo == "anio_tributario":
+            nulo |= ~nulo & (valores != np.floor(valores))
+        columnas[campo] = np.where(nulo, np.nan, valores)
+        columnas[f"{campo}:nulo"] = nulo
+    for campo in COLUMNAS_RUT:
+        r = ruts[campo]
+        columnas[f"{campo}:sin_formato"] = (~r["vacio"] & ~r["formato_ok"]).to_numpy()
+        columnas[f"{campo}:dv_malo"] = (r["formato_ok"] & ~r["dv_ok"]).to_numpy()
+    columnas["rut_emisor:cuerpo"] = ruts["rut_emisor"]["cuerpo"].fillna(-1).astype("int64").to_numpy()
+    columnas["rut_emisor:dv"] = ruts["rut_emisor"]["dv"].to_numpy()
+    return pd.DataFrame(columnas, index=df.index)
@@ -0,0 +1,139 @@
+"""
+Resumen multidimensional de calificaciones (tipo tabla dinámica).
+
+Se elige una lista de dimensiones, una lista de medidas y filtros opcionales;
+todo se resuelve con una sola consulta GROUP BY. El resultado se guarda en
+caché por consulta normalizada y se invalida cuando cambian las calificaciones.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Sum, Avg, Count
+
+from config.metricas import contar_cache
+
+from .models import CalificacionTributaria
+from .versiones import obtener_version
+
+
+# Dimensión -> campos del GROUP BY
+DIMENSIONES = {
+    "emisor": ("emisor_id", "emisor__rut", "emisor__nombre"),
+    "anio": ("anio_tributario",),
+    "estado": ("estado",),
+    "fuente": ("fuente",),
+    "corredor": ("corredor",),
+    "instrumento": ("instrumento",),
+}
+
+# Medida -> agregación
+MEDIDAS = {
+    "cantidad": lambda: Count("id"),
+    "suma_monto": lambda: Sum("monto"),
+    "suma_monto_calificado": lambda: Sum("monto_calificado"),
+    "promedio_factor": lambda: Avg("factor"),
+}
+
+# Filtro (parámetro GET) -> lookup del ORM
+FILTROS = {
+    "anio": "anio_tributario",
+    "anio_desde": "anio_tributario__gte",
+    "anio_hasta": "anio_tributario__lte",
+    "estado": "estado",
+    "fuente": "fuente",
+    "emisor": "emisor_id",
+    "corredor": "corredor__icontains",
+    "desde": "fecha_registro__date__gte",
+    "hasta": "fecha_registro__date__lte",
+}
+
+MEDIDAS_POR_DEFECTO = ["cantidad"]
+
+
+class ConsultaInvalida(ValueError):
+    pass
+
+
+def _lista(valor):
+    return [v.strip() for v in (valor or "").split(",") if v.strip()]
+
+
+def normalizar_consulta(params):
+    """
+    Valida y normaliza los parámetros GET.
+    Devuelve dict con dimensiones y medidas ordenadas y filtros ordenados,
+    de modo que dos consultas equivalentes comparten la misma clave de caché.
+    """
+    dimensiones = sorted(set(_lista(params.get("dimensiones"))))
+    medidas = sorted(set(_lista(params.get("medidas")) or MEDIDAS_POR_DEFECTO))
+
+    desconocidas = [d for d in dimensiones if d not in DIMENSIONES]
+    if desconocidas:
+        raise ConsultaInvalida(f"Dimensiones no soportadas: {', '.join(desconocidas)}")
+
+    desconocidas = [m for m in medidas if m not in MEDIDAS]
+    if desconocidas:
+        raise ConsultaInvalida(f"Medidas no soportadas: {', '.join(desconocidas)}")
+
+    filtros = {}
+    for nombre in sorted(FILTROS):
+        valor = (params.get(nombre) or "").strip()
+        if valor:
+            filtros[nombre] = valor
+
+    return {"dimensiones": dimensiones, "medidas": medidas, "filtros": filtros}
+
+
+def columnas(consulta):
+    cols = []
+    for d in consulta["dimensiones"]:
+        cols.extend(DIMENSIONES[d])
+    return cols + consulta["medidas"]
+
+
+def construir_queryset(consulta):
+    qs = CalificacionTributaria.objects.all()
+
+    lookups = {FILTROS[k]: v for k, v in consulta["filtros"].items()}
+    if lookups:
+        qs = qs.filter(**lookups)
+
+    campos = []
+    for d in consulta["dimensiones"]:
+        campos.extend(DIMENSIONES[d])
+
+    medidas = {m: MEDIDAS[m]() for m in consulta["medidas"]}
+
+    if not campos:
+        # Sin dimensiones: una sola fila con los totales
+        return [qs.aggregate(**medidas)]
+
+    return qs.values(*campos).annotate(**medidas).order_by(*campos)
+
+
+def clave_cache(consulta):
+    huella = hashlib.sha1(
+        json.dumps(consulta, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    return f"tributaria:resumen:{obtener_version('calificaciones')}:{huella}"
+
+
+def ejecutar_resumen(consulta):
+    """
+    Ejecuta (o recupera de caché) el resumen.
+    Retorna lista de dicts con las columnas de `columnas(consulta)`.
+    """
+    clave = clave_cache(consulta)
+    filas = cache.get(clave)
+    contar_cache("resumen", filas is not None)
+    if filas is None:
+        try:
+            filas = list(construir_queryset(consulta))
+        except (ValueError, TypeError, ValidationError) as e:
+            # Valores de filtro mal formados (p.ej. anio=abc)
+            raise ConsultaInvalida(f"Filtro inválido: {e}")
+        cache.set(clave, filas, getattr(settings, "RESUMEN_CACHE_SEGUNDOS", 300))
+    return filas
@@ -0,0 +1,222 @@
+"""
+Retención de datos: borra lo que ya no se necesita.
+
+Políticas (días configurables en settings, 0 = desactivada):
+- ErrorValidacion más antiguos que RETENCION_ERRORES_DIAS.
+- Notificacion leídas más antiguas que RETENCION_NOTIFICACIONES_LEIDAS_DIAS
+  y cualquiera más antigua que RETENCION_NOTIFICACIONES_DIAS.
+- ExportacionCalificaciones terminadas (LISTA/ERROR) más antiguas que
+  RETENCION_EXPORTACIONES_DIAS, junto con su archivo.
+- Archivos huérfanos en media/ (archivos_tributarios, pdfs, exportaciones)
+  que ninguna fila referencia y tienen más de RETENCION_HUERFANOS_HORAS.
+
+El borrado va por lotes de rangos de id (DELETE ... WHERE id BETWEEN a AND b
+AND <condición>), cada lote en su propia transacción corta, para no tener
+la tabla bloqueada durante todo el proceso.
+"""
+import os
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import Length
+from django.utils import timezone
+
+from .models import ArchivoTributario, DocumentoPDF, ErrorValidacion, ExportacionCalificaciones, Notificacion
+from .notificaciones import invalidar_no_leidas
+from .versiones import invalidar
+
+
+# Carpeta de media -> (modelo, campo) que referencia sus archivos
+CARPETAS_MEDIA = {
+    "archivos_tributarios": (ArchivoTributario, "archivo"),
+    "pdfs": (DocumentoPDF, "archivo"),
+    "exportaciones": (ExportacionCalificaciones, "archivo"),
+}
+
+
+@dataclass
+class Resultado:
+    politica: str
+    filas: int = 0
+    archivos: int = 0
+    bytes_filas: int = 0     # aproximado: largo del texto borrado
+    bytes_archivos: int = 0
+
+
+def _ajuste(nombre, por_defecto):
+    return getattr(settings, nombre, por_defecto)
+
+
+def _hace(dias):
+    return timezone.now() - timedelta(days=dias)
+
+
+def _tamano(ruta):
+    try:
+        return os.path.getsize(ruta)
+    except OSError:
+        return 0
+
+
+def borrar_por_lotes(qs, resultado, lote=1000, simular=False, campo_texto=None, antes_de_borrar=None, pausa=0):
+    """
+    Borra las filas de `qs` en lotes de hasta `lote` ids consecutivos.
+    Cada lote vuelve a aplicar la condición de `qs`, así que una fila que
+    cambió entre la lectura de ids y el DELETE no se borra por error.
+    `antes_de_borrar(qs_lote)` se llama dentro de la transacción del lote.
+    """
+    desde = 0
+    while True:
+        ids = list(qs.filter(pk__gt=desde).order_by("pk").values_list("pk", flat=True)[:lote])
+        if not ids:
+            break
+        desde = ids[-1]
+        qs_lote = qs.filter(pk__gte=ids[0], pk__lte=ids[-1])
+
+        with transaction.atomic():
+            if campo_texto:
+                resultado.bytes_filas += qs_lote.aggregate(t=Sum(Length(campo_texto)))["t"] or 0
+            if simular:
+                resultado.filas += len(ids)
+                continue
+            if antes_de_borrar is not None:
+                antes_de_borrar(qs_lote)
+            borradas, _ = qs_lote.delete()
+            resultado.filas += borradas
+
+        if pausa:
+            time.sleep(pausa)
+    return resultado
+
+
+def purgar_errores_validacion(lote=1000, simular=False, pausa=0):
+    resultado = Resultado("errores de validación")
+    dias = _ajuste("RETENCION_ERRORES_DIAS", 180)
+    if dias:
+        qs = ErrorValidacion.objects.filter(fecha__lt=_hace(dias))
+        borrar_por_lotes(qs, resultado, lote, simular, campo_texto="mensaje", pausa=pausa)
+        if resultado.filas and not simular:
+            invalidar("errores")
+    return resultado
+
+
+def purgar_notificaciones(lote=1000, simular=False, pausa=0):
+    resultado = Resultado("notificaciones")
+    dias_leidas = _ajuste("RETENCION_NOTIFICACIONES_LEIDAS_DIAS", 90)
+    dias_todas = _ajuste("RETENCION_NOTIFICACIONES_DIAS", 365)
+
+    condicion = Q()
+    if dias_leidas:
+        condicion |= Q(leida=True, fecha__lt=_hace(dias_leidas))
+    if dias_todas:
+        condicion |= Q(fecha__lt=_hace(dias_todas))
+    if not condicion:
+        return resultado
+
+    usuarios = set()
+
+    def recordar_usuarios(qs_lote):
+        # Se borran también no leídas antiguas: hay que recalcular el badge
+        usuarios.update(qs_lote.filter(leida=False).values_list("usuario_id", flat=True).distinct())
+
+    qs = Notificacion.objects.filter(condicion)
+    borrar_por_lotes(qs, resultado, lote, simular, campo_texto="mensaje", antes_de_borrar=recordar_usuarios, pausa=pausa)
+    invalidar_no_leidas(usuarios)
+    return resultado
+
+
+def purgar_exportaciones(lote=1000, simular=False, pausa=0):
+    resultado = Resultado("exportaciones")
+    dias = _ajuste("RETENCION_EXPORTACIONES_DIAS", 30)
+    if not dias:
+        return resultado
+
+    archivos = []
+
+    def juntar_archivos(qs_lote):
+        archivos.extend(n for n in qs_lote.exclude(archivo="").values_list("archivo", flat=True))
+
+    qs = ExportacionCalificaciones.objects.filter(estado__in=["LISTA", "ERROR"], fecha_fin__lt=_hace(dias))
+    if simular:
+        juntar_archivos(qs)
+    borrar_por_lotes(qs, resultado, lote, simular, antes_de_borrar=juntar_archivos, pausa=pausa)
+
+    # Un archivo reutilizado puede seguir referenciado por una exportación más nueva
+    vigentes = ExportacionCalificaciones.objects.filter(archivo__in=archivos)
+    if simular:
+        # No se borró nada: solo cuentan las que no se purgarían
+        vigentes = vigentes.exclude(pk__in=qs.values("pk"))
+    vigentes = set(vigentes.values_list("archivo", flat=True))
+    for nombre in set(archivos) - vigentes:
+        ruta = os.path.join(settings.MEDIA_ROOT, nombre)
+        if not os.path.exists(ruta):
+            continue
+        tamano = _tamano(ruta)
+        if not simular:
+            try:
+                os.remove(ruta)
+            except OSError:
+                continue
+        resultado.archivos += 1
+        resultado.bytes_archivos += tamano
+    return resultado
+
+
+def buscar_huerfanos(carpeta, horas=None):
+    """
+    Archivos de media/<carpeta> sin fila que los referencie.
+    Solo considera archivos con más de `horas` de antigüedad: una subida en
+    curso escribe el archivo antes de que la fila quede confirmada.
+    """
+    modelo, campo = CARPETAS_MEDIA[carpeta]
+    if horas is None:
+        horas = _ajuste("RETENCION_HUERFANOS_HORAS", 24)
+    limite = time.time() - horas * 3600
+
+    raiz = os.path.join(settings.MEDIA_ROOT, carpeta)
+    if not os.path.isdir(raiz):
+        return []
+
+    referenciados = set(
+        modelo.objects.exclude(**{campo: ""}).values_list(campo, flat=True).iterator(chunk_size=5000)
+    )
+    huerfanos = []
+    for directorio, _, nombres in os.walk(raiz):
+        for nombre in nombres:
+            ruta = os.path.join(directorio, nombre)
+            relativo = os.path.relpath(ruta, settings.MEDIA_ROOT).replace(os.sep, "/")
+            if relativo in referenciados:
+                continue
+            try:
+                if os.path.getmtime(ruta) > limite:
+                    continue
+            except OSError:
+                continue
+            huerfanos.append(ruta)
+    return huerfanos
+
+
+def purgar_huerfanos(simular=False, horas=None):
+    resultado = Resultado("archivos huérfanos")
+    for carpeta in CARPETAS_MEDIA:
+        for ruta in buscar_huerfanos(carpeta, horas):
+            tamano = _tamano(ruta)
+            if not simular:
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    continue
+            resultado.archivos += 1
+            resultado.bytes_archivos += tamano
+    return resultado
+
+
+POLITICAS = {
+    "errores": purgar_errores_validacion,
+    "notificaciones": purgar_notificaciones,
+    "exportaciones": purgar_exportaciones,
+}
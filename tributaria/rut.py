@@ -0,0 +1,204 @@
+"""
+RUT chileno: forma canónica y dígito verificador (módulo 11).
+
+"76.123.456-7", "76123456-7" y "761234567" son el mismo RUT: cuerpo
+76123456 (entero, lo que se indexa en Emisor.rut_cuerpo) y DV "7". La forma
+canónica para mostrar/guardar es "76123456-7" (sin puntos, DV en mayúscula).
+
+normalizar_columna() hace lo mismo para una columna entera de pandas
+(carga masiva) con operaciones vectorizadas, sin recorrer fila por fila.
+
+Un RUT sin guion ni puntos llega como número desde pandas (761234567, o
+761234567.0 si la columna tiene celdas vacías y pandas la lee como float):
+un número entero se toma como su texto sin decimales.
+"""
+import re
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Sin puntos ni espacios: cuerpo (hasta 8 dígitos, ceros a la izquierda aparte), guion opcional y DV
+PATRON = r"^0*(\d{1,8})-?([0-9K])$"
+_RE_RUT = re.compile(PATRON)
+_RE_SEPARADORES = re.compile(r"[.\s]")
+
+# Pesos del módulo 11, desde el dígito de las unidades
+PESOS = (2, 3, 4, 5, 6, 7, 2, 3)
+
+# normalizar_columna: más largo que esto no es un RUT (ni con puntos y ceros)
+MAX_LARGO = 20
+# Lo que _RE_SEPARADORES quita fuera de ASCII (espacios unicode)
+_ESPACIOS_UNICODE = [c for c in range(128, 0x3001) if chr(c).isspace()]
+
+
+def _limpiar(rut):
+    return _RE_SEPARADORES.sub("", str(rut)).upper()
+
+
+def dv_de(cuerpo):
+    """Dígito verificador que corresponde a `cuerpo` ("0"-"9" o "K")."""
+    suma = 0
+    for peso in PESOS:
+        suma += (cuerpo % 10) * peso
+        cuerpo //= 10
+    resto = 11 - suma % 11
+    return "0" if resto == 11 else "K" if resto == 10 else str(resto)
+
+
+def normalizar(rut):
+    """(cuerpo:int, dv:str) si `rut` tiene formato de RUT (sin validar el DV), si no None."""
+    if rut is None:
+        return None
+    if isinstance(rut, float) and rut.is_integer():
+        rut = int(rut)
+    coincidencia = _RE_RUT.match(_limpiar(rut))
+    if coincidencia is None or int(coincidencia.group(1)) == 0:
+        return None
+    return int(coincidencia.group(1)), coincidencia.group(2)
+
+
+def formatear(cuerpo, dv):
+    return f"{cuerpo}-{dv}"
+
+
+def es_valido(rut):
+    normalizado = normalizar(rut)
+    return normalizado is not None and dv_de(normalizado[0]) == normalizado[1]
+
+
+def _tablas():
+    """Por código ASCII (0-127): ignorado, es dígito, valor del dígito; 127 = cualquier otro carácter."""
+    import numpy as np
+
+    codigos = np.arange(128)
+    ignorado = np.array([c == 0 or chr(c) == "." or chr(c).isspace() for c in codigos])
+    es_digito = (codigos >= ord("0")) & (codigos <= ord("9"))
+    valor = np.where(es_digito, codigos - ord("0"), 0).astype(np.int8)
+    return ignorado, es_digito, valor
+
+
+def _numeros_como_texto(serie):
+    """Los números enteros de la columna pasan a texto sin decimales; lo demás queda igual."""
+    import numpy as np
+    import pandas as pd
+
+    if serie.dtype.kind in "fiu":
+        numeros = serie
+    elif serie.dtype == object:
+        # Columna mixta (Excel): solo las celdas numéricas, no los textos
+        es_numero = serie.map(type).isin([int, float, np.int64, np.float64])
+        if not es_numero.any():
+            return serie
+        numeros = pd.to_numeric(serie.where(es_numero), errors="coerce")
+    else:
+        return serie
+    enteros = (numeros.notna() & (numeros % 1 == 0)).to_numpy()
+    if not enteros.any():
+        return serie
+    texto = serie.astype(object)
+    texto[enteros] = numeros[enteros].astype("int64").astype(str)
+    return texto
+
+
+def _matriz_codigos(serie):
+    """Una fila por valor y una columna por carácter (códigos ASCII, uint8), y si es demasiado largo."""
+    import numpy as np
+
+    objetos = serie.to_numpy(dtype=object)
+    try:
+        textos = objetos.astype("S")
+        ancho_bytes = 1
+    except UnicodeEncodeError:
+        # Hay algo fuera de ASCII (no puede ser un RUT, salvo espacios unicode)
+        textos = objetos.astype(str)
+        ancho_bytes = 4
+    ancho = textos.dtype.itemsize // ancho_bytes
+    if ancho > MAX_LARGO:
+        demasiado_largo = np.char.str_len(textos) > MAX_LARGO
+        textos = textos.astype(f"{textos.dtype.kind}{MAX_LARGO}")
+        ancho = MAX_LARGO
+    else:
+        demasiado_largo = np.zeros(len(textos), dtype=bool)
+    ancho = max(1, ancho)
+    codigos = np.ascontiguousarray(textos).view(np.uint8 if ancho_bytes == 1 else np.uint32).reshape(-1, ancho)
+    if ancho_bytes == 4:
+        codigos = np.where(np.isin(codigos, _ESPACIOS_UNICODE), ord(" "), np.minimum(codigos, 127))
+    return np.minimum(codigos, 127).astype(np.uint8), demasiado_largo
+
+
+def normalizar_columna(serie: "pd.Series") -> "pd.DataFrame":
+    """
+    Versión vectorizada para una columna completa (mismo criterio que
+    normalizar/es_valido). Devuelve un DataFrame con el mismo índice y columnas:
+      cuerpo (Int64, nulo si no tiene formato), dv, formato_ok, dv_ok y
+      vacio (nulo o solo espacios: ni formato ni DV que revisar).
+
+    Sin regex por fila: la columna se pasa a una matriz de códigos ASCII
+    (una fila por RUT, un carácter por columna) y se cuentan posiciones
+    desde la derecha: 0 es el DV, luego el guion opcional y después los
+    dígitos del cuerpo.
+    """
+    import numpy as np
+    import pandas as pd
+
+    tabla_ignorado, tabla_digito, tabla_valor = _tablas()
+    # Cuerpo de hasta 8 dígitos: cabe en int32; la suma del módulo 11 en int16
+    pesos = np.array(PESOS, dtype=np.int16)
+    potencias = 10 ** np.arange(len(PESOS), dtype=np.int32)
+    n_pesos = len(PESOS)
+
+    serie = _numeros_como_texto(serie)
+    codigos, demasiado_largo = _matriz_codigos(serie)
+    codigos[codigos == ord("k")] = ord("K")
+
+    # Puntos, espacios y el relleno del ancho fijo no cuentan
+    visibles = ~tabla_ignorado[codigos]
+    desde_derecha = np.cumsum(visibles[:, ::-1], axis=1, dtype=np.int8)[:, ::-1] - 1
+    desde_derecha[~visibles] = -1
+    cantidad = desde_derecha.max(axis=1, initial=-1) + 1
+    vacio = serie.isna().to_numpy() | ~(visibles | (codigos == ord("."))).any(axis=1)
+
+    def caracter_en(posicion):
+        return np.where(desde_derecha == posicion, codigos, 0).max(axis=1, initial=0)
+
+    dv = caracter_en(0)
+    con_guion = caracter_en(1) == ord("-")
+    inicio = np.where(con_guion, 2, 1).astype(np.int8)
+
+    exponente = desde_derecha - inicio[:, None]  # 0 = unidades del cuerpo
+    en_cuerpo = exponente >= 0  # (los no visibles quedan en negativo)
+    es_digito = tabla_digito[codigos]
+    valor = tabla_valor[codigos]
+
+    formato_ok = (
+        ~demasiado_largo
+        & (cantidad > inicio)
+        & (es_digito | ~en_cuerpo).all(axis=1)
+        # Más de 8 dígitos solo si son ceros a la izquierda
+        & ((valor == 0) | (exponente < n_pesos)).all(axis=1)
+        & (tabla_digito[dv] | (dv == ord("K")))
+    )
+
+    cuenta = en_cuerpo & (exponente < n_pesos)
+    exp = np.where(cuenta, exponente, 0)
+    valor = np.where(cuenta, valor, 0)
+    cuerpos = (valor * potencias[exp]).sum(axis=1, dtype=np.int64)
+    suma = (valor * pesos[exp]).sum(axis=1, dtype=np.int16)
+    formato_ok &= cuerpos > 0
+
+    resto = 11 - suma % 11
+    esperado = np.where(resto == 11, ord("0"), np.where(resto == 10, ord("K"), resto + ord("0")))
+    dv_txt = np.where(formato_ok, dv, 0).astype(np.uint32).view("U1")
+
+    return pd.DataFrame(
+        {
+            "cuerpo": pd.Series(cuerpos, index=serie.index, dtype="Int64").where(formato_ok),
+            "dv": dv_txt,
+            "formato_ok": formato_ok,
+            "dv_ok": formato_ok & (dv == esperado),
+            "vacio": vacio,
+        },
+        index=serie.index,
+    )
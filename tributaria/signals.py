@@ -0,0 +1,71 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from .models import ArchivoTributario, CalificacionTributaria, DocumentoPDF, Emisor, Notificacion, ReglaValidacion
+from .cambios import registrar_cambio
+from .emisores import completar_campos
+from .eventos import canal_usuario, obtener_bus
+from .notificaciones import sumar_no_leidas
+from .versiones import invalidar
+
+
+@receiver([post_save, post_delete], sender=CalificacionTributaria)
+def calificacion_modificada(sender, **kwargs):
+    invalidar("calificaciones")
+
+
+@receiver(post_save, sender=CalificacionTributaria)
+def registrar_cambio_guardado(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        # loaddata: no es un cambio de negocio
+        return
+    registrar_cambio(instance, "CREAR" if created else "ACTUALIZAR")
+
+
+@receiver(post_delete, sender=CalificacionTributaria)
+def registrar_cambio_eliminado(sender, instance, **kwargs):
+    registrar_cambio(instance, "ELIMINAR")
+
+
+@receiver(pre_save, sender=Emisor)
+def emisor_campos_derivados(sender, instance, raw=False, **kwargs):
+    if not raw:
+        completar_campos(instance)
+
+
+@receiver([post_save, post_delete], sender=Emisor)
+def emisor_modificado(sender, **kwargs):
+    # Los reportes agrupan por nombre de emisor
+    invalidar("emisores", "calificaciones")
+
+
+@receiver([post_save, post_delete], sender=ReglaValidacion)
+def regla_modificada(sender, **kwargs):
+    # La próxima carga vuelve a compilar las reglas (reglas.reglas_vigentes)
+    invalidar("reglas")
+
+
+@receiver([post_save, post_delete], sender=ArchivoTributario)
+def archivo_modificado(sender, **kwargs):
+    invalidar("archivos")
+
+
+@receiver([post_save, post_delete], sender=DocumentoPDF)
+def pdf_modificado(sender, **kwargs):
+    invalidar("pdfs")
+
+
+@receiver(post_save, sender=Notificacion)
+def notificacion_creada(sender, instance, created, **kwargs):
+    if created and not instance.leida:
+        # Al confirmar: si la transacción se revierte, el contador no sube
+        transaction.on_commit(partial(sumar_no_leidas, instance.usuario_id), robust=True)
+
+    if created:
+        datos = {"id": instance.id, "mensaje": instance.mensaje, "nivel": instance.nivel, "enlace": instance.enlace}
+        transaction.on_commit(
+            lambda: obtener_bus().publicar(canal_usuario(instance.usuario_id), "notificacion", datos)
+        )
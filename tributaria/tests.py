@@ -1,3 +1,1619 @@
-from django.test import TestCase
+"""
+Presupuesto de consultas SQL por vista y para la carga masiva.
 
-# Create your tests here.
+Cada vista de tributaria.urls se mide con 10 y con 1000 calificaciones (y
+lo que siembra datos_sinteticos en proporción): la cantidad de consultas
+tiene que ser la misma en las dos escalas (sin N+1) y no pasar de su
+presupuesto. Si un cambio sube un presupuesto a propósito, actualizarlo
+aquí en el mismo commit.
+"""
+import json
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import tracemalloc
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
+from unittest import skipIf
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Max
+from django.http import HttpResponse
+from django.test import AsyncClient, Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from config import metricas
+from config.bd.base import PoolConexiones
+from config.metricas import Registro, compactar, escribir_json, leer_todos, texto_prometheus
+from config.middleware import Acumulado, leer_acumulados, leer_epoca
+from config.routers import COOKIE_PRIMARIA, RouterReplica, leer_de_replica, lectura_en, usar_primaria
+from cuentas.models import Usuario
+
+from .auditoria import (
+    _obtener_executor,
+    archivar_bitacora,
+    filtrar_bitacora,
+    leer_bitacora_archivada,
+    registrar_bitacora,
+)
+from .cambios import asignar_secuencias
+from .checks import cache_compartida
+from .condicional import firma_datos
+from .datos_sinteticos import crear_usuarios, sembrar
+from .emisores import filtrar_emisor
+from .estados import cambiar_estado
+from .eventos import BusEnMemoria, canal_archivo, obtener_bus, publicar_progreso
+from .exportaciones import calcular_huella, procesar_pendientes, solicitar_exportacion, tomar_pendiente
+from .factores import TablaFactoresInvalida, calcular_monto_calificado, cargar_tabla, leer_tabla, recalcular
+from .forms import ReglaValidacionForm
+from .medicion import MedicionEtapas
+from .middleware import BitacoraMiddleware
+from .particiones import crear_particion_mensual
+from .reglas import reglas_vigentes
+from .ingesta import procesar_archivo_tributario
+from .models import (
+    ArchivoTributario,
+    Bitacora,
+    CalificacionTributaria,
+    CambioCalificacion,
+    Emisor,
+    ErrorValidacion,
+    ExportacionCalificaciones,
+    FactorEmisor,
+    Notificacion,
+    ReglaValidacion,
+)
+from .retencion import purgar_errores_validacion, purgar_exportaciones
+from .resumen import ConsultaInvalida, clave_cache, ejecutar_resumen, normalizar_consulta
+from .rut import dv_de, es_valido, formatear, normalizar, normalizar_columna
+from .versiones import invalidar, nueva_version, obtener_version
+
+
+ESCALAS = (10, 1000)
+
+
+def tearDownModule():
+    # Lo que registraron las pruebas no es del despliegue: que el atexit de
+    # config.metricas no lo vuelque en METRICAS_DIR
+    metricas.registro.descartar()
+
+
+class MedicionConsultasMixin:
+    """Cuenta las consultas de una petición con sesión y caché frías."""
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        ajuste = override_settings(MEDIA_ROOT=self.media, INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        self.addCleanup(cache.clear)
+        self.usuarios = crear_usuarios()
+
+    def contar_consultas(self, usuario, url, metodo="get", datos=None):
+        # Cliente nuevo: sin rol cacheado en sesión ni respuestas condicionales previas
+        cache.clear()
+        cliente = Client()
+        cliente.force_login(usuario)
+        with CaptureQueriesContext(connection) as consultas:
+            response = getattr(cliente, metodo)(url, datos or {})
+            if response.streaming:
+                b"".join(response)
+        self.assertLess(response.status_code, 400, f"{url} respondió {response.status_code}")
+        return len(consultas)
+
+    def contar_consultas_asgi(self, usuario, url, consumir=True):
+        """Igual que contar_consultas, pero con una petición ASGI (vistas de eventos)."""
+        cache.clear()
+        cliente = AsyncClient()
+        cliente.force_login(usuario)
+
+        async def pedir():
+            response = await cliente.get(url)
+            if consumir:
+                async for _ in response.streaming_content:
+                    pass
+            return response
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = async_to_sync(pedir)()
+        self.assertEqual(response.status_code, 200)
+        return len(consultas)
+
+    def assertPresupuestoPorEscala(self, medidas, presupuestos):
+        """medidas: {escala: {vista: consultas}}."""
+        chica, grande = (medidas[e] for e in ESCALAS)
+        for vista, maximo in presupuestos.items():
+            with self.subTest(vista=vista):
+                self.assertEqual(
+                    chica[vista], grande[vista],
+                    f"{vista}: {chica[vista]} consultas con {ESCALAS[0]} filas y {grande[vista]} con {ESCALAS[1]}",
+                )
+                self.assertLessEqual(grande[vista], maximo, f"{vista} pasó su presupuesto de consultas")
+
+
+@override_settings(INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None)
+class PresupuestoConsultasVistasTests(MedicionConsultasMixin, TestCase):
+    # nombre de URL -> máximo de consultas por petición
+    PRESUPUESTOS = {
+        "dashboard": 18,
+        "subir_archivo": 8,
+        "crear_calificacion": 11,
+        "listar_calificaciones": 9,
+        "editar_calificacion": 12,
+        "eliminar_calificacion": 10,
+        "cambiar_estado_calificaciones": 11,
+        "descargar_exportacion": 8,
+        "listar_reglas": 9,
+        "crear_regla": 8,
+        "editar_regla": 9,
+        "eliminar_regla": 9,
+        "errores_validacion": 9,
+        "errores_validacion_por_archivo": 9,
+        "ver_bitacora": 10,
+        "ver_notificaciones": 9,
+        "marcar_notificaciones_leidas": 3,
+        "reporte_calificaciones": 12,
+        "reporte_consolidado": 11,
+        "reporte_resumen": 8,
+        "informe_gestion_pdf": 14,
+        "subir_pdf": 8,
+        "listar_pdfs": 9,
+        "eventos_archivo": 11,
+        "eventos_notificaciones": 2,
+        "api_calificaciones": 8,
+        "api_cambios_calificaciones": 8,
+        "api_emisores": 8,
+        "api_archivos": 8,
+        "logout": 4,
+    }
+
+    def peticiones(self):
+        """(vista, url, método[, datos]) para cada ruta de tributaria.urls."""
+        calificacion = CalificacionTributaria.objects.order_by("id").first()
+        archivo = ArchivoTributario.objects.order_by("id").first()
+        regla = ReglaValidacion.objects.order_by("id").first()
+        return [
+            ("dashboard", reverse("dashboard"), "get"),
+            ("subir_archivo", reverse("subir_archivo"), "get"),
+            ("crear_calificacion", reverse("crear_calificacion"), "get"),
+            ("listar_calificaciones", reverse("listar_calificaciones"), "get"),
+            ("editar_calificacion", reverse("editar_calificacion", args=[calificacion.pk]), "get"),
+            ("eliminar_calificacion", reverse("eliminar_calificacion", args=[calificacion.pk]), "get"),
+            # Filtro sin filas: lo fijo de la vista (el costo por lote se mide en CambioEstadoMasivoTests)
+            ("cambiar_estado_calificaciones", reverse("cambiar_estado_calificaciones"), "post",
+             {"accion": "rechazar", "anio_tributario": 1990}),
+            ("descargar_exportacion", reverse("descargar_exportacion", args=[self.exportacion.pk]), "get"),
+            ("listar_reglas", reverse("listar_reglas"), "get"),
+            ("crear_regla", reverse("crear_regla"), "get"),
+            ("editar_regla", reverse("editar_regla", args=[regla.pk]), "get"),
+            ("eliminar_regla", reverse("eliminar_regla", args=[regla.pk]), "get"),
+            ("errores_validacion", reverse("errores_validacion"), "get"),
+            ("errores_validacion_por_archivo", reverse("errores_validacion_por_archivo", args=[archivo.pk]), "get"),
+            ("ver_bitacora", reverse("ver_bitacora"), "get"),
+            ("ver_notificaciones", reverse("ver_notificaciones"), "get"),
+            ("marcar_notificaciones_leidas", reverse("marcar_notificaciones_leidas"), "post"),
+            ("reporte_calificaciones", reverse("reporte_calificaciones"), "get"),
+            ("reporte_consolidado", reverse("reporte_consolidado"), "get"),
+            ("reporte_resumen", reverse("reporte_resumen"), "get"),
+            ("informe_gestion_pdf", reverse("informe_gestion_pdf"), "get"),
+            ("subir_pdf", reverse("subir_pdf"), "get"),
+            ("listar_pdfs", reverse("listar_pdfs"), "get"),
+            ("eventos_archivo", reverse("eventos_archivo", args=[archivo.pk]), "get"),
+            # Stream sin fin: solo se mide hasta abrirlo
+            ("eventos_notificaciones", reverse("eventos_notificaciones"), "get"),
+            ("api_calificaciones", reverse("api_calificaciones"), "get"),
+            ("api_cambios_calificaciones", reverse("api_cambios_calificaciones"), "get"),
+            ("api_emisores", reverse("api_emisores"), "get"),
+            ("api_archivos", reverse("api_archivos"), "get"),
+            ("logout", reverse("logout"), "post"),
+        ]
+
+    def test_consultas_no_dependen_de_la_cantidad_de_filas(self):
+        admin = self.usuarios["Administrador"]
+        self.exportacion = ExportacionCalificaciones.objects.create(usuario=admin, huella="x" * 64, estado="LISTA")
+        self.exportacion.archivo.save("calificaciones.xlsx", ContentFile(b"xlsx"))
+
+        medidas = {}
+        sembradas = 0
+        for escala in ESCALAS:
+            sembrar(escala - sembradas)
+            sembradas = escala
+            medidas[escala] = {}
+            for vista, url, metodo, *datos in self.peticiones():
+                if vista == "eventos_archivo":
+                    medidas[escala][vista] = self.contar_consultas_asgi(admin, url)
+                elif vista == "eventos_notificaciones":
+                    medidas[escala][vista] = self.contar_consultas_asgi(admin, url, consumir=False)
+                else:
+                    medidas[escala][vista] = self.contar_consultas(admin, url, metodo, *datos)
+
+        self.assertEqual(set(medidas[ESCALAS[0]]), set(self.PRESUPUESTOS))
+        self.assertPresupuestoPorEscala(medidas, self.PRESUPUESTOS)
+
+
+@override_settings(
+    INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None,
+    INGESTA_MEDIR_MEMORIA=False, INGESTA_PERFIL=False, EVENTOS_PROGRESO_CADA=10**9,
+)
+class PresupuestoConsultasIngestaTests(MedicionConsultasMixin, TestCase):
+    LOTE = 50
+    # Consultas fijas de una carga (leer/borrar errores previos, guardar métricas, savepoints)
+    BASE = 4
+    # Por lote con errores y emisores nuevos: errores, buscar emisores,
+    # crear emisores, releer emisores, calificaciones, registro de cambios
+    POR_LOTE = 6
+
+    @staticmethod
+    def rut(cuerpo):
+        return formatear(cuerpo, dv_de(cuerpo))
+
+    def crear_archivo(self, filas):
+        lineas = ["rut_contribuyente,nombre_contribuyente,rut_emisor,nombre_emisor,monto_bruto,factor,anio_tributario"]
+        for i in range(filas):
+            # Una fila de cada 10 con monto inválido: todos los lotes tienen errores
+            monto = "abc" if i % 10 == 0 else str(1000 + i)
+            lineas.append(f"11111111-1,Contribuyente {i},{self.rut(76000000 + i)},Emisor {i},{monto},0.5,2024")
+        contenido = ("\n".join(lineas) + "\n").encode("utf-8")
+        return ArchivoTributario.objects.create(
+            tipo_archivo="CSV",
+            archivo=SimpleUploadedFile(f"carga_{filas}.csv", contenido, content_type="text/csv"),
+            nombre_original=f"carga_{filas}.csv",
+            usuario=self.usuarios["Analista"],
+        )
+
+    def procesar(self, archivo):
+        # Las reglas compiladas se cachean por proceso: se cargan fuera de la medición
+        reglas_vigentes()
+        with CaptureQueriesContext(connection) as consultas:
+            ok, fail, valido = procesar_archivo_tributario(archivo, self.usuarios["Analista"])
+        return ok, fail, valido, len(consultas)
+
+    def test_presupuesto_fijo_por_lote(self):
+        with self.settings(INGESTA_LOTE=self.LOTE):
+            for filas in ESCALAS:
+                with self.subTest(filas=filas):
+                    archivo = self.crear_archivo(filas)
+                    ok, fail, valido, consultas = self.procesar(archivo)
+                    lotes = -(-filas // self.LOTE)
+
+                    self.assertTrue(valido)
+                    self.assertEqual((ok, fail), (filas - filas // 10, filas // 10))
+                    self.assertEqual(consultas, self.BASE + lotes * self.POR_LOTE)
+                    self.assertEqual(CalificacionTributaria.objects.filter(archivo_origen=archivo).count(), ok)
+                    self.assertEqual(ErrorValidacion.objects.filter(archivo=archivo).count(), fail)
+
+    def test_versiones_cambian_al_confirmar_la_carga(self):
+        archivo = self.crear_archivo(10)
+        antes = [obtener_version(e) for e in ("calificaciones", "emisores", "errores")]
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.procesar(archivo)
+            self.assertEqual([obtener_version(e) for e in ("calificaciones", "emisores", "errores")], antes)
+        for callback in callbacks:
+            callback()
+        despues = [obtener_version(e) for e in ("calificaciones", "emisores", "errores")]
+        self.assertTrue(all(a != d for a, d in zip(antes, despues)))
+
+    def test_emisores_existentes_se_reusan_y_se_registran_los_cambios(self):
+        previo = Emisor.objects.create(rut=self.rut(76000001), nombre="Ya existía")
+        archivo = self.crear_archivo(10)
+        ok, _, _, _ = self.procesar(archivo)
+
+        creadas = CalificacionTributaria.objects.filter(archivo_origen=archivo)
+        self.assertEqual(creadas.filter(emisor=previo).count(), 1)
+        self.assertEqual(Emisor.objects.filter(rut=self.rut(76000001)).count(), 1)
+        self.assertEqual(
+            set(CambioCalificacion.objects.filter(operacion="CREAR").values_list("calificacion_id", flat=True)),
+            set(creadas.values_list("id", flat=True)),
+        )
+        self.assertEqual(creadas.count(), ok)
+
+    def test_mismo_rut_con_otro_formato_es_el_mismo_emisor(self):
+        previo = Emisor.objects.create(rut="76.000.001-" + dv_de(76000001).lower(), nombre="Ya existía")
+        self.assertEqual((previo.rut, previo.rut_cuerpo), (self.rut(76000001), 76000001))
+        archivo = self.crear_archivo(10)
+        self.procesar(archivo)
+
+        self.assertEqual(Emisor.objects.filter(rut_cuerpo=76000001).count(), 1)
+        nuevo = Emisor.objects.get(rut_cuerpo=76000002)
+        self.assertEqual((nuevo.rut, nuevo.nombre_busqueda), (self.rut(76000002), "emisor 2"))
+
+    def test_reglas_de_la_bd_con_condicion_por_anio_y_emisor(self):
+        ReglaValidacion.objects.create(
+            nombre="Tope factor 2024", campo="factor", operador="MENOR_IGUAL", valor=Decimal("0.4"), solo_anio=2024,
+        )
+        ReglaValidacion.objects.create(
+            nombre="Tope factor 2023", campo="factor", operador="MENOR_IGUAL", valor=Decimal("0.4"), solo_anio=2023,
+        )
+        ReglaValidacion.objects.create(
+            nombre="Tope monto emisor", campo="monto_bruto", operador="MENOR", valor=Decimal("1003"),
+            solo_rut_emisor=self.rut(76000004).replace("-", ""), mensaje="Monto sobre el tope del emisor",
+        )
+        archivo = self.crear_archivo(10)
+        ok, fail, _, _ = self.procesar(archivo)
+
+        self.assertEqual((ok, fail), (0, 10))
+        mensajes = list(ErrorValidacion.objects.filter(archivo=archivo, nro_linea=6).values_list("mensaje", flat=True))
+        self.assertEqual(
+            mensajes, ["factor debe ser menor o igual a 0.4 (año 2024)", "Monto sobre el tope del emisor"]
+        )
+
+    def test_ruts_invalidos_se_rechazan_con_su_mensaje(self):
+        dv_malo = "0" if dv_de(76000000) != "0" else "1"
+        contenido = (
+            "rut_contribuyente,nombre_contribuyente,rut_emisor,nombre_emisor,monto_bruto,factor,anio_tributario\n"
+            f"11.111.111-1,Bien,{self.rut(76000000)},Emisor,1000,0.5,2024\n"
+            f"11111111-1,DV malo,76000000-{dv_malo},Emisor,1000,0.5,2024\n"
+            "abc,Sin formato,,Emisor,1000,0.5,2024\n"
+        ).encode("utf-8")
+        archivo = ArchivoTributario.objects.create(
+            tipo_archivo="CSV",
+            archivo=SimpleUploadedFile("ruts.csv", contenido, content_type="text/csv"),
+            nombre_original="ruts.csv",
+            usuario=self.usuarios["Analista"],
+        )
+        ok, fail, _, _ = self.procesar(archivo)
+
+        self.assertEqual((ok, fail), (1, 2))
+        self.assertEqual(
+            list(ErrorValidacion.objects.filter(archivo=archivo).order_by("nro_linea", "id").values_list("nro_linea", "mensaje")),
+            [
+                (3, "rut_emisor con dígito verificador incorrecto"),
+                (4, "rut_emisor es obligatorio"),
+                (4, "rut_contribuyente no tiene formato de RUT (ej: 12345678-5)"),
+            ],
+        )
+
+    def test_columna_de_ruts_numericos_con_una_celda_vacia(self):
+        # Sin guion, pandas lee la columna como número; con una celda vacía, como float
+        emisor = self.rut(76000000).replace("-", "")  # DV numérico: la celda es un número
+        contenido = (
+            "rut_contribuyente,nombre_contribuyente,rut_emisor,nombre_emisor,monto_bruto,factor,anio_tributario\n"
+            f"111111111,Bien,{emisor},Emisor,1000,0.5,2024\n"
+            f"111111111,Bien,{emisor},Emisor,2000,0.5,2024\n"
+            "111111111,Sin emisor,,Emisor,1000,0.5,2024\n"
+        ).encode("utf-8")
+        archivo = ArchivoTributario.objects.create(
+            tipo_archivo="CSV",
+            archivo=SimpleUploadedFile("numericos.csv", contenido, content_type="text/csv"),
+            nombre_original="numericos.csv",
+            usuario=self.usuarios["Analista"],
+        )
+        ok, fail, _, _ = self.procesar(archivo)
+
+        self.assertEqual((ok, fail), (2, 1))
+        self.assertEqual(
+            list(ErrorValidacion.objects.filter(archivo=archivo).values_list("nro_linea", "mensaje")),
+            [(4, "rut_emisor es obligatorio")],
+        )
+        self.assertEqual(
+            set(CalificacionTributaria.objects.filter(archivo_origen=archivo).values_list("emisor__rut", flat=True)),
+            {self.rut(76000000)},
+        )
+
+
+@override_settings(BD_REPLICA="replica", REPLICA_APPS=("tributaria",))
+class RouterReplicaTests(SimpleTestCase):
+    """Solo decide el alias: no abre conexiones a la réplica."""
+
+    def setUp(self):
+        self.router = RouterReplica()
+        self.factory = RequestFactory()
+
+    def destino_en_vista(self, *decoradores, request=None):
+        def vista(request):
+            return self.router.db_for_read(CalificacionTributaria)
+
+        for decorador in reversed(decoradores):
+            vista = decorador(vista)
+        return vista(request or self.factory.get("/"))
+
+    def test_fuera_de_una_vista_de_lectura_va_a_la_primaria(self):
+        self.assertIsNone(self.router.db_for_read(CalificacionTributaria))
+        self.assertEqual(self.router.db_for_write(CalificacionTributaria), "default")
+
+    def test_vista_de_lectura_lee_de_la_replica_solo_modelos_de_tributaria(self):
+        self.assertEqual(self.destino_en_vista(leer_de_replica), "replica")
+        with lectura_en("replica"):
+            # Sesión, usuario y roles siempre de la primaria
+            self.assertIsNone(self.router.db_for_read(Usuario))
+
+    def test_lectura_despues_de_escritura_usa_la_primaria(self):
+        self.assertIsNone(self.destino_en_vista(usar_primaria, leer_de_replica))
+        self.assertIsNone(self.destino_en_vista(leer_de_replica, request=self.factory.post("/")))
+        tras_post = self.factory.get("/")
+        tras_post.COOKIES[COOKIE_PRIMARIA] = "1"
+        self.assertIsNone(self.destino_en_vista(leer_de_replica, request=tras_post))
+
+    @override_settings(BD_REPLICA=None)
+    def test_sin_replica_configurada_no_cambia_nada(self):
+        self.assertIsNone(self.destino_en_vista(leer_de_replica))
+
+
+class PoolConexionesTests(SimpleTestCase):
+    def crear(self):
+        self.creadas += 1
+        return sqlite3.connect(":memory:", check_same_thread=False)
+
+    def setUp(self):
+        self.creadas = 0
+
+    def test_reusa_las_conexiones_devueltas(self):
+        pool = PoolConexiones(maximo=2, espera=1)
+        primera, nueva = pool.tomar(self.crear, validar=True)
+        self.assertTrue(nueva)
+        pool.devolver(primera, reusable=True)
+
+        segunda, nueva = pool.tomar(self.crear, validar=True)
+        self.assertIs(segunda, primera)
+        self.assertFalse(nueva)
+        # Con error no vuelve al pool
+        pool.devolver(segunda, reusable=False)
+        self.assertIsNot(pool.tomar(self.crear, validar=True)[0], primera)
+        self.assertEqual(self.creadas, 2)
+
+    def test_no_entrega_mas_del_maximo(self):
+        pool = PoolConexiones(maximo=1, espera=0.05)
+        conexion, _ = pool.tomar(self.crear, validar=False)
+        with self.assertRaises(TimeoutError):
+            pool.tomar(self.crear, validar=False)
+        pool.devolver(conexion, reusable=True)
+        self.assertIs(pool.tomar(self.crear, validar=False)[0], conexion)
+
+    def test_conexiones_persistentes_solo_bajo_wsgi(self):
+        codigo = "import config.settings as s; print(s.DATABASES['default']['CONN_MAX_AGE'])"
+        for modo, esperado in (("wsgi", "600"), ("asgi", "0")):
+            with self.subTest(modo=modo):
+                entorno = {k: v for k, v in os.environ.items() if k != "BD_CONN_MAX_AGE"}
+                entorno.update(MODO_SERVIDOR=modo, BD_POOL="False")
+                salida = subprocess.run(
+                    [sys.executable, "-c", codigo], env=entorno, capture_output=True, text=True, check=True,
+                )
+                self.assertEqual(salida.stdout.strip(), esperado)
+
+
+@override_settings(INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None)
+class RutTests(TestCase):
+    MUESTRA = [
+        "76.123.456-7", "76123456-7", "761234567", " 76 123 456-7 ", "0076123456-7",
+        "12.345.678-5", "12345678-k", "1-9", "0-0", "123456789-0", "76.123.456-", "abc-1",
+        "1-2-3", "", None, float("nan"), 123456785, 761234567.0, 761234567.5, "7612345678901234567890-1",
+    ]
+
+    def test_columna_igual_que_un_rut_a_la_vez(self):
+        import pandas as pd
+
+        columna = normalizar_columna(pd.Series(self.MUESTRA))
+        for valor, fila in zip(self.MUESTRA, columna.itertuples(index=False)):
+            with self.subTest(valor=valor):
+                esperado = normalizar(valor)
+                self.assertEqual(fila.formato_ok, esperado is not None)
+                if esperado is not None:
+                    self.assertEqual((fila.cuerpo, fila.dv), esperado)
+                self.assertEqual(fila.dv_ok, es_valido(valor))
+
+    def test_columna_numerica_con_celdas_vacias(self):
+        import pandas as pd
+
+        # Así lee pandas una columna de RUT sin guion con una celda vacía
+        columna = normalizar_columna(pd.Series([761234567, None, 123456785]).astype(float))
+        self.assertEqual(columna["formato_ok"].tolist(), [True, False, True])
+        self.assertEqual(columna["vacio"].tolist(), [False, True, False])
+        self.assertEqual(columna["cuerpo"].tolist()[::2], [76123456, 12345678])
+
+    def test_busqueda_por_rut_y_por_nombre(self):
+        emisor = Emisor.objects.create(rut="76123456-0", nombre="  Compañía   Eléctrica SA")
+        otra = Emisor.objects.create(rut="96000000-1", nombre="Otra Compañía")
+
+        self.assertEqual(emisor.nombre_busqueda, "compania electrica sa")
+        for texto in ("76.123.456-0", "761234560", "compañia ELÉC", "eléctrica"):
+            with self.subTest(texto=texto):
+                self.assertEqual(list(filtrar_emisor(Emisor.objects.all(), texto)), [emisor])
+        # "Contiene" en todas las bases, no solo prefijo
+        self.assertEqual(list(filtrar_emisor(Emisor.objects.order_by("id"), "Compania")), [emisor, otra])
+
+
+@override_settings(INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None)
+class ReglasValidacionTests(TestCase):
+    def test_reglas_compiladas_se_reusan_hasta_que_cambian(self):
+        primeras = reglas_vigentes()
+        with self.assertNumQueries(0):
+            self.assertIs(reglas_vigentes(), primeras)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            regla = ReglaValidacion.objects.create(nombre="Tope", campo="factor", operador="MENOR", valor=Decimal("2"))
+        segundas = reglas_vigentes()
+        self.assertIsNot(segundas, primeras)
+        self.assertEqual(len(segundas.resto), len(primeras.resto) + 1)
+
+        regla.activa = False
+        with self.captureOnCommitCallbacks(execute=True):
+            regla.save()
+        self.assertEqual(len(reglas_vigentes().resto), len(primeras.resto))
+
+    def test_cambio_hecho_en_otro_worker_se_recompila(self):
+        self.addCleanup(cache.clear)
+        primeras = reglas_vigentes()
+        # Otro proceso edita una regla: aquí no corre la señal, solo cambia la
+        # versión en la caché compartida
+        ReglaValidacion.objects.create(nombre="Tope", campo="factor", operador="MENOR", valor=Decimal("2"))
+        self.assertIs(reglas_vigentes(), primeras)
+        cache.set("tributaria:version:reglas", nueva_version(), None)
+        self.assertEqual(len(reglas_vigentes().resto), len(primeras.resto) + 1)
+
+        # Si la caché pierde la clave, la versión sembrada es nueva: no se reusan las viejas
+        actuales = reglas_vigentes()
+        cache.delete("tributaria:version:reglas")
+        self.assertIsNot(reglas_vigentes(), actuales)
+
+    def test_formulario_exige_valores_coherentes(self):
+        datos = {"nombre": "x", "campo": "nombre_emisor", "operador": "ENTRE", "valor": "5", "valor_max": "1", "orden": 1}
+        form = ReglaValidacionForm(datos)
+        self.assertFalse(form.is_valid())
+        self.assertEqual(set(form.errors), {"operador", "valor_max"})
+
+        form = ReglaValidacionForm({**datos, "campo": "monto_bruto", "valor_max": "9", "solo_rut_emisor": "76.123.456-0"})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data["solo_rut_emisor"], "76123456-0")
+
+
+@override_settings(INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None)
+class CambioEstadoMasivoTests(MedicionConsultasMixin, TestCase):
+    # Por lote: savepoint, SELECT FOR UPDATE, UPDATE, bitácora, INSERT ... SELECT de cambios, release
+    POR_LOTE = 6
+
+    def setUp(self):
+        super().setUp()
+        sembrar(60)
+        # Como quedan tras la carga masiva (PENDIENTE) o creadas a mano (BORRADOR)
+        CalificacionTributaria.objects.update(estado="BORRADOR")
+        primeras = list(CalificacionTributaria.objects.order_by("id").values_list("id", flat=True)[:20])
+        CalificacionTributaria.objects.filter(id__in=primeras).update(estado="PENDIENTE")
+        self.validadas = set(CalificacionTributaria.objects.filter(anio_tributario__lt=2020).values_list("id", flat=True))
+        CalificacionTributaria.objects.filter(id__in=self.validadas).update(estado="VALIDADA")
+
+    def estados(self):
+        return dict(CalificacionTributaria.objects.values_list("id", "estado"))
+
+    def de_anio(self, anio):
+        return set(CalificacionTributaria.objects.filter(anio_tributario=anio).values_list("id", flat=True))
+
+    def test_un_update_por_lote_y_solo_desde_los_estados_de_origen(self):
+        borradores = CalificacionTributaria.objects.filter(estado__in=("BORRADOR", "PENDIENTE")).count()
+        with CaptureQueriesContext(connection) as consultas:
+            resultado = cambiar_estado(CalificacionTributaria.objects.all(), "validar", self.usuarios["Analista"], lote=10)
+        lotes = -(-borradores // 10)
+        self.assertEqual((resultado.cambiadas, resultado.lotes, resultado.omitidas), (borradores, lotes, 0))
+        # + la última vuelta: savepoint, SELECT sin filas, release
+        self.assertEqual(len(consultas), lotes * self.POR_LOTE + 3)
+        self.assertEqual(set(self.estados().values()), {"VALIDADA"})
+        self.assertEqual(Bitacora.objects.filter(accion="Validar calificación (masivo)").count(), borradores)
+        self.assertEqual(CambioCalificacion.objects.filter(operacion="ACTUALIZAR").count(), borradores)
+
+        # Publicar no toca las rechazadas
+        rechazada = min(self.validadas)
+        CalificacionTributaria.objects.filter(id=rechazada).update(estado="RECHAZADA")
+        resultado = cambiar_estado(CalificacionTributaria.objects.all(), "publicar", lote=1000)
+        self.assertEqual(resultado.cambiadas, 59)
+        self.assertEqual(self.estados()[rechazada], "RECHAZADA")
+
+    def test_desde_el_listado_filtrado_y_por_comando(self):
+        cliente = Client()
+        cliente.force_login(self.usuarios["Analista"])
+        response = cliente.post(reverse("cambiar_estado_calificaciones"), {"accion": "publicar", "anio_tributario": 2016})
+        self.assertRedirects(response, f"{reverse('listar_calificaciones')}?anio_tributario=2016", fetch_redirect_response=False)
+        publicadas = {i for i, estado in self.estados().items() if estado == "PUBLICADA"}
+        self.assertTrue(publicadas)
+        self.assertEqual(publicadas, self.validadas & self.de_anio(2016))
+
+        antes = self.estados()
+        call_command("cambiar_estado_calificaciones", "rechazar", "--usuario", "bench_analista", "--dry-run", stdout=StringIO())
+        self.assertEqual(self.estados(), antes)
+        call_command("cambiar_estado_calificaciones", "rechazar", "--usuario", "bench_analista", "--anio", "2016", stdout=StringIO())
+        self.assertEqual(
+            {i for i, estado in self.estados().items() if estado == "RECHAZADA"},
+            self.de_anio(2016) - publicadas,
+        )
+
+    def test_comando_filtra_por_estado(self):
+        pendientes = {i for i, estado in self.estados().items() if estado == "PENDIENTE"}
+        antes = self.estados()
+        salida = StringIO()
+        call_command(
+            "cambiar_estado_calificaciones", "validar", "--usuario", "bench_analista", "--estado", "PENDIENTE",
+            stdout=salida,
+        )
+        despues = self.estados()
+        self.assertEqual({i for i in despues if despues[i] != antes[i]}, pendientes)
+        self.assertEqual({despues[i] for i in pendientes}, {"VALIDADA"})
+        self.assertIn("'estado': ['PENDIENTE']", Bitacora.objects.filter(accion="Validar calificaciones (masivo)").get().detalle)
+
+        # Repetible; un estado que no es de origen de la acción no cambia nada
+        call_command(
+            "cambiar_estado_calificaciones", "rechazar", "--usuario", "bench_analista",
+            "--estado", "BORRADOR", "--estado", "PUBLICADA", "--dry-run", stdout=salida,
+        )
+        self.assertIn(f"[dry-run] {list(despues.values()).count('BORRADOR')} calificaciones", salida.getvalue())
+        with self.assertRaises(CommandError):
+            call_command("cambiar_estado_calificaciones", "validar", "--usuario", "bench_analista", "--estado", "OTRO")
+
+
+@override_settings(INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None)
+class RecalculoFactoresTests(MedicionConsultasMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        sembrar(200)
+        self.emisores = list(Emisor.objects.order_by("id")[:3])
+
+    def escribir_tabla(self, lineas, separador=","):
+        ruta = f"{self.media}/factores.csv"
+        with open(ruta, "w", encoding="utf-8") as f:
+            f.write("\n".join([separador.join(("RUT Emisor", "anio_tributario", "factor")), *lineas]) + "\n")
+        return ruta
+
+    def test_monto_calificado_en_decimal_exacto(self):
+        # Con float: round(1234.57 * 0.5, 2) == 617.28
+        self.assertEqual(calcular_monto_calificado(Decimal("1234.57"), Decimal("0.50000")), Decimal("617.29"))
+
+    def test_tabla_con_errores_no_se_aplica(self):
+        lineas = ["76000001-0;2024;0,5", "no-es-rut;2024;0,5", "76000001-0;2024;0,6", "76000002-8;2024;0,123456"]
+        with self.assertRaises(TablaFactoresInvalida) as error:
+            leer_tabla(self.escribir_tabla(lineas, ";"))
+        self.assertEqual(
+            [e.split(":")[0] for e in error.exception.errores], ["Línea 3", "Línea 4", "Línea 5"]
+        )
+
+    def test_recalculo_por_lotes_solo_de_los_pares_de_la_tabla(self):
+        anio = 2020
+        pares = {(e.id, anio): Decimal(f"0.{i + 1}2345") for i, e in enumerate(self.emisores)}
+        ruta = self.escribir_tabla(
+            [f"{e.rut},{anio},{pares[(e.id, anio)]}" for e in self.emisores] + ["99999999-9,2020,0.1"]
+        )
+        afectadas = CalificacionTributaria.objects.filter(emisor__in=self.emisores, anio_tributario=anio)
+        antes = dict(CalificacionTributaria.objects.exclude(id__in=afectadas).values_list("id", "monto_calificado"))
+        self.assertTrue(afectadas.exists())
+
+        self.assertEqual(cargar_tabla(leer_tabla(ruta)), (3, [99999999]))
+        resultado = recalcular([anio], self.usuarios["Analista"], lote=2)
+        self.assertEqual(resultado.filas, afectadas.count())
+        self.assertEqual(resultado.lotes, -(-resultado.filas // 2))
+        for c in afectadas:
+            self.assertEqual(c.factor, pares[(c.emisor_id, anio)])
+            self.assertEqual(c.monto_calificado, calcular_monto_calificado(c.monto, c.factor))
+        self.assertEqual(dict(CalificacionTributaria.objects.exclude(id__in=afectadas).values_list("id", "monto_calificado")), antes)
+        self.assertEqual(CambioCalificacion.objects.filter(operacion="ACTUALIZAR").count(), resultado.filas)
+
+        # Misma tabla otra vez: no hay nada que cambiar (savepoint, SELECT sin filas, release)
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(recalcular([anio], lote=2).filas, 0)
+        self.assertEqual(len(consultas), 3)
+
+        # Simulación con otro factor: informa, pero no guarda ni el factor ni las calificaciones
+        emisor = afectadas.first().emisor
+        salida = StringIO()
+        call_command(
+            "recalcular_montos_calificados", self.escribir_tabla([f"{emisor.rut},{anio},0.9"]),
+            "--usuario", "bench_analista", "--dry-run", stdout=salida,
+        )
+        self.assertIn(f"[dry-run] {afectadas.filter(emisor=emisor).count()} calificaciones", salida.getvalue())
+        self.assertEqual(FactorEmisor.objects.get(emisor=emisor).factor, pares[(emisor.id, anio)])
+        self.assertFalse(CalificacionTributaria.objects.filter(factor=Decimal("0.9")).exists())
+
+
+@override_settings(INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None)
+class ResumenTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        sembrar(60)
+
+    def test_consultas_equivalentes_comparten_clave(self):
+        a = normalizar_consulta({"dimensiones": "emisor,anio", "medidas": "suma_monto,cantidad", "estado": "VALIDADA"})
+        b = normalizar_consulta({"dimensiones": " anio,emisor,anio", "medidas": "cantidad,suma_monto", "estado": "VALIDADA "})
+        self.assertEqual(a, b)
+        self.assertEqual(clave_cache(a), clave_cache(b))
+        with self.assertRaises(ConsultaInvalida):
+            normalizar_consulta({"dimensiones": "color"})
+        with self.assertRaises(ConsultaInvalida):
+            ejecutar_resumen(normalizar_consulta({"anio": "abc"}))
+
+    def test_una_consulta_y_cacheado_hasta_que_cambian_las_calificaciones(self):
+        consulta = normalizar_consulta({"dimensiones": "anio,estado", "medidas": "cantidad,suma_monto"})
+        with self.assertNumQueries(1):
+            filas = ejecutar_resumen(consulta)
+        esperado = {}
+        for anio, estado, monto in CalificacionTributaria.objects.values_list("anio_tributario", "estado", "monto"):
+            cantidad, suma = esperado.get((anio, estado), (0, 0))
+            esperado[(anio, estado)] = (cantidad + 1, suma + monto)
+        self.assertEqual(
+            {(f["anio_tributario"], f["estado"]): (f["cantidad"], f["suma_monto"]) for f in filas}, esperado
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(ejecutar_resumen(consulta), filas)
+
+        calificacion = CalificacionTributaria.objects.order_by("id").first()
+        calificacion.monto += 1
+        with self.captureOnCommitCallbacks(execute=True):
+            calificacion.save()
+        with self.assertNumQueries(1):
+            nuevas = ejecutar_resumen(consulta)
+        clave = (calificacion.anio_tributario, calificacion.estado)
+        fila = next(f for f in nuevas if (f["anio_tributario"], f["estado"]) == clave)
+        self.assertEqual(fila["suma_monto"], esperado[clave][1] + 1)
+
+
+@override_settings(INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None)
+class VersionesTests(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+
+    def test_version_sembrada_tras_expulsion_no_repite_una_anterior(self):
+        primera = obtener_version("prueba")
+        self.assertEqual(obtener_version("prueba"), primera)
+        invalidar("prueba")
+        segunda = obtener_version("prueba")
+        # La caché expulsa la clave: la versión nueva no puede ser una ya usada
+        cache.delete("tributaria:version:prueba")
+        tercera = obtener_version("prueba")
+        self.assertEqual(len({primera, segunda, tercera}), 3)
+        self.assertLess(segunda, tercera)
+
+    def test_arranque_exige_cache_compartida(self):
+        locmem = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        archivos = {"default": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": "/tmp/x"}}
+        with override_settings(CACHES=locmem, CACHE_LOCAL_PERMITIDA=False):
+            self.assertEqual([e.id for e in cache_compartida(None)], ["tributaria.E001"])
+        with override_settings(CACHES=locmem, CACHE_LOCAL_PERMITIDA=True):
+            self.assertEqual(cache_compartida(None), [])
+        with override_settings(CACHES=archivos, CACHE_LOCAL_PERMITIDA=False):
+            self.assertEqual(cache_compartida(None), [])
+
+
+@override_settings(INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None)
+class InvalidacionAlConfirmarTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+
+    def test_version_cambia_recien_al_hacer_commit(self):
+        antes = obtener_version("calificaciones")
+        with self.captureOnCommitCallbacks() as callbacks:
+            invalidar("calificaciones")
+            # Otro worker que lea ahora sigue viendo la versión de los datos confirmados
+            self.assertEqual(obtener_version("calificaciones"), antes)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(obtener_version("calificaciones"), antes)
+
+    def test_rollback_no_cambia_la_version(self):
+        antes = obtener_version("calificaciones")
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError), transaction.atomic():
+                invalidar("calificaciones")
+                raise ValueError
+        self.assertEqual(obtener_version("calificaciones"), antes)
+
+
+@override_settings(INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None)
+class ApiTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        sembrar(45)
+        self.cliente = Client()
+        self.cliente.force_login(crear_usuarios()["Analista"])
+
+    def test_cursor_recorre_todo_sin_repetir(self):
+        url, params, vistos = reverse("api_calificaciones"), {"limite": 10, "campos": "id,estado"}, []
+        while True:
+            datos = self.cliente.get(url, params).json()
+            self.assertTrue(all(set(f) == {"id", "estado"} for f in datos["resultados"]))
+            vistos += [f["id"] for f in datos["resultados"]]
+            if datos["siguiente"] is None:
+                break
+            params["cursor"] = datos["siguiente"]
+        self.assertEqual(vistos, list(CalificacionTributaria.objects.order_by("id").values_list("id", flat=True)))
+        self.assertEqual(self.cliente.get(url, {"cursor": "basura"}).status_code, 400)
+        self.assertEqual(self.cliente.get(url, {"campos": "clave"}).status_code, 400)
+
+    def test_etag_responde_304_hasta_que_cambian_los_datos(self):
+        url = reverse("api_calificaciones")
+        primera = self.cliente.get(url, {"limite": 5})
+        etag = primera["ETag"]
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.cliente.get(url, {"limite": 5}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.content), (304, b""))
+        self.assertFalse([c for c in consultas if "tributaria_calificacion" in c["sql"]])
+        # Otros parámetros, otro ETag
+        self.assertNotEqual(self.cliente.get(url, {"limite": 6})["ETag"], etag)
+
+        calificacion = CalificacionTributaria.objects.order_by("id").first()
+        with self.captureOnCommitCallbacks(execute=True):
+            calificacion.save()
+        response = self.cliente.get(url, {"limite": 5}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_filtro_de_emisor_igual_que_el_listado(self):
+        emisor = Emisor.objects.create(rut="76123456-0", nombre="Compañía Eléctrica SA")
+        calificacion = CalificacionTributaria.objects.create(
+            emisor=emisor, corredor="x", anio_tributario=2024, monto=1, factor=1, monto_calificado=1,
+        )
+        for texto in ("76.123.456-0", "compania elec"):
+            with self.subTest(texto=texto):
+                datos = self.cliente.get(reverse("api_calificaciones"), {"emisor": texto, "campos": "id"}).json()
+                self.assertEqual(datos["resultados"], [{"id": calificacion.id}])
+        datos = self.cliente.get(reverse("api_emisores"), {"nombre": "COMPAÑIA", "campos": "id"}).json()
+        self.assertEqual(datos["resultados"], [{"id": emisor.id}])
+
+
+@override_settings(INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None)
+class FeedCambiosTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.usuarios = crear_usuarios()
+        self.cliente = Client()
+        self.cliente.force_login(self.usuarios["Analista"])
+        self.emisor = Emisor.objects.create(rut="76123456-0", nombre="Emisor")
+
+    def crear(self, **campos):
+        return CalificacionTributaria.objects.create(
+            emisor=self.emisor, corredor="x", anio_tributario=2024, monto=10, factor=1, monto_calificado=10,
+            estado="PENDIENTE", **campos,
+        )
+
+    def leer_feed(self, desde=0, limite=2):
+        """Recorre el feed por la API; devuelve los cambios y cuántas páginas se pidieron."""
+        cambios, paginas = [], 0
+        while True:
+            datos = self.cliente.get(reverse("api_cambios_calificaciones"), {"desde": desde, "limite": limite}).json()
+            paginas += 1
+            cambios += datos["cambios"]
+            self.assertEqual(datos["siguiente"], datos["cambios"][-1]["secuencia"] if datos["cambios"] else desde)
+            desde = datos["siguiente"]
+            if not datos["hay_mas"]:
+                return cambios, paginas
+
+    def test_guardar_editar_y_borrar_quedan_en_orden(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            calificacion = self.crear()
+            calificacion.monto = 20
+            calificacion.save()
+            id_borrada = calificacion.id
+            calificacion.delete()
+
+        cambios, paginas = self.leer_feed()
+        self.assertEqual([c["operacion"] for c in cambios], ["CREAR", "ACTUALIZAR", "ELIMINAR"])
+        self.assertEqual({c["calificacion_id"] for c in cambios}, {id_borrada})
+        self.assertEqual(Decimal(cambios[1]["datos"]["monto"]), 20)
+        self.assertIsNone(cambios[2]["datos"])
+        self.assertEqual(paginas, 2)
+
+    def test_caminos_masivos_registran_el_estado_final(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            creadas = [self.crear() for _ in range(5)]
+        ultima = CambioCalificacion.objects.aggregate(m=Max("secuencia"))["m"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cambiar_estado(CalificacionTributaria.objects.all(), "validar", lote=2)
+        cambios, _ = self.leer_feed(desde=ultima)
+        secuencias = [c["secuencia"] for c in cambios]
+        self.assertEqual(secuencias, sorted(set(secuencias)))
+        self.assertTrue(all(s > ultima for s in secuencias))
+        self.assertEqual([c["calificacion_id"] for c in cambios], [c.id for c in creadas])
+        self.assertEqual({(c["operacion"], c["datos"]["estado"]) for c in cambios}, {("ACTUALIZAR", "VALIDADA")})
+
+        # Nada nuevo: siguiente queda en la misma secuencia
+        self.assertEqual(self.leer_feed(desde=secuencias[-1]), ([], 1))
+        self.assertEqual(self.cliente.get(reverse("api_cambios_calificaciones"), {"desde": "x"}).status_code, 400)
+
+    def test_cambio_confirmado_tarde_no_se_pierde(self):
+        # Dos transacciones: la que tomó el id menor confirma después. Se
+        # simula reservando el id (fila borrada) y reinsertándolo más tarde.
+        id_tardio = CambioCalificacion.objects.create(calificacion_id=1, operacion="CREAR").id
+        CambioCalificacion.objects.filter(id=id_tardio).delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            temprana = self.crear()
+        cambios, _ = self.leer_feed()
+        self.assertEqual([c["calificacion_id"] for c in cambios], [temprana.id])
+        cursor = cambios[-1]["secuencia"]
+
+        CambioCalificacion.objects.create(id=id_tardio, calificacion_id=1, operacion="CREAR")
+        self.assertEqual(asignar_secuencias(), 1)
+        cambios, _ = self.leer_feed(desde=cursor)
+        self.assertEqual([c["calificacion_id"] for c in cambios], [1])
+        self.assertGreater(cambios[0]["secuencia"], cursor)
+        self.assertEqual(asignar_secuencias(), 0)
+
+
+@override_settings(INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None)
+class ExportacionesTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.media = tempfile.mkdtemp()
+        ajuste = override_settings(MEDIA_ROOT=self.media)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        self.usuarios = crear_usuarios()
+
+    def descargar(self, usuario, exportacion):
+        cliente = Client()
+        cliente.force_login(usuario)
+        response = cliente.get(reverse("descargar_exportacion", args=[exportacion.pk]))
+        if response.streaming:
+            b"".join(response)
+        return response.status_code
+
+    def test_solo_el_dueno_o_el_administrador_descargan(self):
+        exportacion = ExportacionCalificaciones.objects.create(
+            usuario=self.usuarios["Corredor"], huella="x" * 64, estado="LISTA"
+        )
+        exportacion.archivo.save("calificaciones.xlsx", ContentFile(b"xlsx"))
+
+        self.assertEqual(self.descargar(self.usuarios["Corredor"], exportacion), 200)
+        self.assertEqual(self.descargar(self.usuarios["Administrador"], exportacion), 200)
+        self.assertEqual(self.descargar(self.usuarios["Analista"], exportacion), 404)
+
+    def test_renombrar_un_emisor_cambia_la_huella(self):
+        emisor = Emisor.objects.create(rut="76123456-0", nombre="Antes SA")
+        filtros = {"anio_tributario": 2024}
+        huella = calcular_huella(filtros)
+        self.assertEqual(calcular_huella(filtros), huella)
+
+        emisor.nombre = "Después SA"
+        with self.captureOnCommitCallbacks(execute=True):
+            emisor.save()
+        self.assertNotEqual(calcular_huella(filtros), huella)
+
+    def test_huella_se_calcula_al_generar(self):
+        sembrar(5)
+        filtros = {"anio_tributario": 2024}
+        exportacion = solicitar_exportacion(self.usuarios["Corredor"], filtros)
+        self.assertEqual(exportacion.huella, "")
+        # Cambio entre la solicitud y el worker: el archivo ya lo incluye
+        with self.captureOnCommitCallbacks(execute=True):
+            CalificacionTributaria.objects.order_by("id").first().save()
+
+        self.assertEqual(procesar_pendientes(), 1)
+        exportacion.refresh_from_db()
+        self.assertEqual(exportacion.estado, "LISTA")
+        self.assertEqual(exportacion.huella, calcular_huella(filtros))
+
+    @override_settings(EXPORTACION_TIMEOUT_MINUTOS=30, EXPORTACION_MAX_INTENTOS=2)
+    def test_exportacion_abandonada_se_vuelve_a_tomar(self):
+        exportacion = solicitar_exportacion(self.usuarios["Corredor"], {})
+        self.assertEqual(tomar_pendiente(), exportacion)
+        # El worker "se cae": queda en PROCESANDO y nadie más la toma
+        self.assertIsNone(tomar_pendiente())
+
+        hace_una_hora = timezone.now() - timedelta(hours=1)
+        ExportacionCalificaciones.objects.filter(pk=exportacion.pk).update(fecha_toma=hace_una_hora)
+        retomada = tomar_pendiente()
+        self.assertEqual((retomada, retomada.intentos), (exportacion, 2))
+        self.assertIsNone(tomar_pendiente())
+
+        # Al pasar EXPORTACION_MAX_INTENTOS se da por fallida y se avisa
+        ExportacionCalificaciones.objects.filter(pk=exportacion.pk).update(fecha_toma=hace_una_hora)
+        self.assertIsNone(tomar_pendiente())
+        exportacion.refresh_from_db()
+        self.assertEqual(exportacion.estado, "ERROR")
+        self.assertTrue(Notificacion.objects.filter(usuario=self.usuarios["Corredor"], nivel="ERROR").exists())
+
+
+@override_settings(INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None)
+class RespuestaCondicionalTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        sembrar(30)
+        self.cliente = Client()
+        self.cliente.force_login(crear_usuarios()["Administrador"])
+
+    def test_firma_sin_recorrer_tablas(self):
+        with self.assertNumQueries(0):
+            firma_datos("calificaciones", "archivos", "pdfs", "errores")
+        # Bitácora: solo el último id por el índice de la PK
+        with CaptureQueriesContext(connection) as consultas:
+            firma_datos("bitacora")
+        self.assertEqual(len(consultas), 1)
+        self.assertNotIn("COUNT", consultas[0]["sql"].upper())
+
+    def test_304_hasta_que_cambian_los_datos(self):
+        url = reverse("dashboard")
+        etag = self.cliente.get(url)["ETag"]
+        response = self.cliente.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        calificacion = CalificacionTributaria.objects.order_by("id").first()
+        with self.captureOnCommitCallbacks(execute=True):
+            calificacion.save()
+        response = self.cliente.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        registrar_bitacora(None, "Prueba", "Nada")
+        response = self.cliente.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Prueba")
+
+    def test_badge_de_no_leidas_no_queda_viejo(self):
+        url = reverse("dashboard")
+        etag = self.cliente.get(url)["ETag"]
+        usuario = crear_usuarios()["Administrador"]
+        # Una notificación revertida no suma al contador en caché
+        with self.assertRaises(RuntimeError), self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            Notificacion.objects.create(usuario=usuario, mensaje="Revertida")
+            raise RuntimeError
+        self.assertEqual(self.cliente.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Notificacion.objects.create(usuario=usuario, mensaje="Nueva")
+        response = self.cliente.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<span class="badge rounded-pill bg-danger">1</span>', html=True)
+
+    def test_archivar_bitacora_cambia_la_firma(self):
+        firma, _ = firma_datos("bitacora")
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        primera = Bitacora.objects.order_by("id").first()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(archivar_bitacora(primera.fecha + timedelta(microseconds=1), directorio=directorio), 1)
+        self.assertNotEqual(firma_datos("bitacora")[0], firma)
+
+
+@override_settings(INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None)
+class ArchivoBitacoraTests(TestCase):
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+        self.addCleanup(cache.clear)
+        # 2024-03-01 02:00 UTC es el 29 de febrero a las 23:00 en Santiago (UTC-3)
+        fechas = {
+            "febrero": datetime(2024, 2, 15, 12, tzinfo=dt_timezone.utc),
+            "medianoche": datetime(2024, 3, 1, 2, tzinfo=dt_timezone.utc),
+            "marzo": datetime(2024, 3, 10, 12, tzinfo=dt_timezone.utc),
+        }
+        self.ids = {}
+        for accion, fecha in fechas.items():
+            entrada = Bitacora.objects.create(accion=accion, entidad="Prueba")
+            Bitacora.objects.filter(pk=entrada.pk).update(fecha=fecha)
+            self.ids[accion] = entrada.pk
+        self.antes_de = datetime(2024, 4, 1, tzinfo=dt_timezone.utc)
+
+    def archivar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return archivar_bitacora(self.antes_de, lote=2, directorio=self.directorio)
+
+    def leer(self, **filtros):
+        return [f["accion"] for f in leer_bitacora_archivada(directorio=self.directorio, **filtros)]
+
+    def test_archivar_borra_y_se_lee_de_vuelta(self):
+        self.assertEqual(self.archivar(), 3)
+        self.assertFalse(Bitacora.objects.filter(pk__in=self.ids.values()).exists())
+        self.assertEqual(sorted(self.leer()), ["febrero", "marzo", "medianoche"])
+        self.assertEqual(self.leer(accion="MARZ"), ["marzo"])
+
+    def test_filtro_por_dia_local(self):
+        self.archivar()
+        # Está en el archivo de marzo (UTC) pero es del 29 de febrero local
+        self.assertEqual(self.leer(desde=date(2024, 2, 29), hasta=date(2024, 2, 29)), ["medianoche"])
+        self.assertEqual(self.leer(desde=date(2024, 3, 1)), ["marzo"])
+        self.assertEqual(sorted(self.leer(hasta=date(2024, 2, 29))), ["febrero", "medianoche"])
+
+    def test_lote_re_archivado_no_se_duplica(self):
+        filas = list(Bitacora.objects.filter(pk__in=self.ids.values()).order_by("id"))
+        fechas = {fila.pk: fila.fecha for fila in filas}
+        self.archivar()
+        # Como si la corrida anterior se hubiera caído antes del DELETE
+        Bitacora.objects.bulk_create(filas)
+        for pk, fecha in fechas.items():  # auto_now_add pisa la fecha
+            Bitacora.objects.filter(pk=pk).update(fecha=fecha)
+        self.assertEqual(self.archivar(), 3)
+        self.assertEqual(sorted(self.leer()), ["febrero", "marzo", "medianoche"])
+
+
+@override_settings(INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None)
+class FiltroBitacoraTests(TestCase):
+    def test_accion_por_prefijo_sin_distinguir_mayusculas(self):
+        for accion in ("Crear calificación", "Recrear índice", "crear emisor"):
+            Bitacora.objects.create(accion=accion, entidad="Prueba")
+        qs = filtrar_bitacora(Bitacora.objects.all(), {"accion": "CREAR"})
+        self.assertEqual(sorted(qs.values_list("accion", flat=True)), ["Crear calificación", "crear emisor"])
+
+    def test_indice_de_accion_solo_en_postgresql(self):
+        migracion = import_module("tributaria.migrations.0016_bitacora_indice_accion")
+        ejecutadas = []
+        for vendor in ("sqlite", "postgresql"):
+            editor = SimpleNamespace(connection=SimpleNamespace(vendor=vendor), execute=ejecutadas.append)
+            migracion.crear_indice_accion(None, editor)
+        self.assertEqual(len(ejecutadas), 1)
+        # La misma expresión que Django usa para istartswith en PostgreSQL
+        self.assertIn("(UPPER(accion::text) text_pattern_ops)", ejecutadas[0])
+
+    def test_indices_del_explorador(self):
+        nombres = {indice.name for indice in Bitacora._meta.indexes}
+        self.assertEqual(nombres, {
+            "bitacora_fecha_id_idx", "bitacora_usr_fecha_idx", "bitacora_ent_fecha_idx", "bitacora_idreg_fecha_idx",
+        })
+
+
+class CursorGrabado:
+    """Cursor falso: guarda el SQL y responde fetchone() con `respuestas` en orden."""
+
+    def __init__(self, respuestas):
+        self.respuestas = list(respuestas)
+        self.sql = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.sql.append(" ".join(sql.split()))
+
+    def fetchone(self):
+        return self.respuestas.pop(0)
+
+
+@override_settings(INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None)
+class ParticionesBitacoraTests(TestCase):
+    def crear(self, respuestas):
+        cursor = CursorGrabado(respuestas)
+        conexion = SimpleNamespace(alias=connection.alias, vendor="postgresql", cursor=lambda: cursor)
+        return crear_particion_mensual(date(2026, 10, 15), conexion), cursor.sql
+
+    def test_particion_nueva_sin_filas_en_default(self):
+        creada, sql = self.crear([(None,), (False,)])
+        self.assertTrue(creada)
+        self.assertTrue(sql[-1].startswith('CREATE TABLE "tributaria_bitacora_2026_10" PARTITION OF'))
+        self.assertFalse(any("DETACH" in s for s in sql))
+
+    def test_filas_del_mes_en_default_pasan_a_la_particion(self):
+        creada, sql = self.crear([(None,), (True,)])
+        self.assertTrue(creada)
+        pasos = [s.split(" (")[0] for s in sql[1:]]
+        self.assertEqual(pasos, [
+            "LOCK TABLE tributaria_bitacora IN ACCESS EXCLUSIVE MODE",
+            "SELECT EXISTS",
+            "ALTER TABLE tributaria_bitacora DETACH PARTITION tributaria_bitacora_default",
+            'CREATE TABLE "tributaria_bitacora_2026_10" PARTITION OF tributaria_bitacora FOR VALUES FROM',
+            "INSERT INTO tributaria_bitacora",
+            "DELETE FROM tributaria_bitacora_default WHERE fecha >= %s AND fecha < %s",
+            "ALTER TABLE tributaria_bitacora ATTACH PARTITION tributaria_bitacora_default DEFAULT",
+        ])
+
+    def test_particion_existente_no_se_toca(self):
+        self.assertEqual(self.crear([("tributaria_bitacora_2026_10",)]), (False, ["SELECT to_regclass(%s)"]))
+
+    def test_migracion_0008_reversible_y_solo_en_postgresql(self):
+        migracion = import_module("tributaria.migrations.0008_bitacora_fecha_usuario_entidad")
+        ejecutadas = []
+        for vendor in ("sqlite", "postgresql"):
+            editor = SimpleNamespace(connection=SimpleNamespace(vendor=vendor), execute=ejecutadas.append)
+            migracion.particionar_bitacora(None, editor)
+            migracion.desparticionar_bitacora(None, editor)
+        # Particionar, 3 meses, copiar filas (ya caen en su partición), deshacer
+        self.assertEqual(len(ejecutadas), 6)
+        self.assertIn("PARTITION BY RANGE (fecha)", ejecutadas[0])
+        self.assertTrue(all("PARTITION OF" in sql for sql in ejecutadas[1:4]))
+        self.assertIn("INSERT INTO tributaria_bitacora", ejecutadas[4])
+        self.assertIn("DROP TABLE tributaria_bitacora_particionada", ejecutadas[5])
+
+
+@override_settings(INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None)
+class EventosTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.usuario = crear_usuarios()["Administrador"]
+        self.archivo = ArchivoTributario.objects.create(
+            tipo_archivo="CSV", archivo="archivos_tributarios/x.csv", nombre_original="x.csv", usuario=self.usuario,
+        )
+        self.addCleanup(obtener_bus().olvidar, canal_archivo(self.archivo.pk))
+        self.url = reverse("eventos_archivo", args=[self.archivo.pk])
+
+    async def test_progreso_y_fin_por_asgi(self):
+        cliente = AsyncClient()
+        await cliente.aforce_login(self.usuario)
+        response = await cliente.get(self.url)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+
+        flujo = aiter(response.streaming_content)
+        # Carga PENDIENTE: el estado inicial es un progreso y el stream sigue abierto
+        self.assertTrue((await anext(flujo)).startswith(b"event: progreso\n"))
+        publicar_progreso(self.archivo.pk, 10, 10, 9, 1, fin=True)
+        fin = await anext(flujo)
+        self.assertTrue(fin.startswith(b"event: fin\n"))
+        self.assertIn(b'"errores": 1', fin)
+        with self.assertRaises(StopAsyncIteration):
+            await anext(flujo)
+
+    def test_wsgi_responde_204(self):
+        self.client.force_login(self.usuario)
+        for url in (self.url, reverse("eventos_notificaciones")):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 204)
+                self.assertFalse(response.streaming)
+
+    def test_eventsource_solo_con_eventos_asgi(self):
+        self.client.force_login(self.usuario)
+        url = reverse("errores_validacion_por_archivo", args=[self.archivo.pk])
+        for activo in (False, True):
+            with self.subTest(activo=activo), override_settings(EVENTOS_ASGI=activo):
+                cache.clear()
+                response = self.client.get(url)
+                self.assertEqual("new EventSource(" in response.content.decode(), activo)
+
+    def test_ultimo_evento_acotado_a_los_canales_recientes(self):
+        bus = BusEnMemoria(maximo_ultimos=2)
+        for canal in ("a", "b", "a", "c"):
+            bus.publicar(canal, "progreso", {"canal": canal})
+        self.assertIsNone(bus.ultimo("b"))
+        self.assertEqual([bus.ultimo(c)["datos"] for c in ("a", "c")], [{"canal": "a"}, {"canal": "c"}])
+
+
+@override_settings(
+    INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None, RETENCION_ERRORES_DIAS=180, RETENCION_EXPORTACIONES_DIAS=30,
+)
+class RetencionTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        ajuste = override_settings(MEDIA_ROOT=self.media)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        self.addCleanup(cache.clear)
+        self.usuario = crear_usuarios()["Administrador"]
+        self.antiguo = timezone.now() - timedelta(days=400)
+
+    def errores(self, antiguos):
+        """Crea errores intercalando uno reciente después de cada antiguo."""
+        archivo = ArchivoTributario.objects.create(
+            tipo_archivo="CSV", archivo="archivos_tributarios/x.csv", nombre_original="x.csv", usuario=self.usuario,
+        )
+        recientes = []
+        for i in range(antiguos):
+            viejo = ErrorValidacion.objects.create(archivo=archivo, nro_linea=i, mensaje="viejo")
+            ErrorValidacion.objects.filter(pk=viejo.pk).update(fecha=self.antiguo)
+            recientes.append(ErrorValidacion.objects.create(archivo=archivo, nro_linea=i, mensaje="nuevo").pk)
+        return recientes
+
+    def exportacion(self, nombre, antigua=True):
+        exportacion = ExportacionCalificaciones.objects.create(
+            usuario=self.usuario, huella="x" * 64, estado="LISTA", archivo=f"exportaciones/{nombre}",
+        )
+        if antigua:
+            ExportacionCalificaciones.objects.filter(pk=exportacion.pk).update(fecha_fin=self.antiguo)
+        else:
+            ExportacionCalificaciones.objects.filter(pk=exportacion.pk).update(fecha_fin=timezone.now())
+        ruta = os.path.join(self.media, "exportaciones", nombre)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with open(ruta, "wb") as f:
+            f.write(b"xlsx")
+        return ruta
+
+    def test_dry_run_no_borra(self):
+        self.errores(4)
+        ruta = self.exportacion("vieja.xlsx")
+        errores = purgar_errores_validacion(lote=3, simular=True)
+        exportaciones = purgar_exportaciones(simular=True)
+        self.assertEqual((errores.filas, exportaciones.filas, exportaciones.archivos), (4, 1, 1))
+        self.assertEqual(ErrorValidacion.objects.count(), 8)
+        self.assertEqual(ExportacionCalificaciones.objects.count(), 1)
+        self.assertTrue(os.path.exists(ruta))
+
+    def test_lotes_solo_borran_lo_antiguo(self):
+        for antiguos, lote in ((6, 3), (7, 3), (2, 5)):
+            with self.subTest(antiguos=antiguos, lote=lote):
+                ErrorValidacion.objects.all().delete()
+                recientes = self.errores(antiguos)
+                with CaptureQueriesContext(connection) as consultas:
+                    resultado = purgar_errores_validacion(lote=lote)
+                deletes = [c for c in consultas if c["sql"].startswith("DELETE")]
+                self.assertEqual(resultado.filas, antiguos)
+                self.assertEqual(len(deletes), -(-antiguos // lote))
+                # Los recientes caen dentro de los rangos de id de cada lote y no se tocan
+                self.assertEqual(sorted(ErrorValidacion.objects.values_list("pk", flat=True)), recientes)
+
+    def test_archivo_referenciado_por_otra_exportacion_se_conserva(self):
+        compartido = self.exportacion("compartido.xlsx")
+        self.exportacion("compartido.xlsx", antigua=False)
+        propio = self.exportacion("propio.xlsx")
+
+        simulado = purgar_exportaciones(simular=True)
+        self.assertEqual((simulado.filas, simulado.archivos), (2, 1))
+
+        resultado = purgar_exportaciones()
+        self.assertEqual((resultado.filas, resultado.archivos), (2, 1))
+        self.assertTrue(os.path.exists(compartido))
+        self.assertFalse(os.path.exists(propio))
+        self.assertEqual(ExportacionCalificaciones.objects.count(), 1)
+
+
+class VolcadoInstrumentacionTests(SimpleTestCase):
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+
+    def test_volcados_simultaneos_dejan_un_json_valido(self):
+        acumulado = Acumulado()
+        for i in range(50):
+            acumulado.agregar(f"vista_{i}", 10.0, 2.0, 3, 0, False)
+        with override_settings(INSTRUMENTACION_DIR=self.directorio):
+            hilos = [threading.Thread(target=acumulado.volcar) for _ in range(8)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+        self.assertEqual([n for n in os.listdir(self.directorio) if n.endswith(".tmp")], [])
+        totales = leer_acumulados(self.directorio)
+        self.assertEqual(len(totales), 50)
+        self.assertEqual(totales["vista_0"]["peticiones"], 1)
+
+    def test_error_al_volcar_se_registra(self):
+        ocupado = os.path.join(self.directorio, "archivo")
+        open(ocupado, "w").close()
+        acumulado = Acumulado()
+        acumulado.agregar("vista", 1.0, 0.0, 1, 0, False)
+        # La carpeta es un archivo: no se puede volcar, pero la petición no falla
+        with override_settings(INSTRUMENTACION_DIR=ocupado), self.assertLogs("config.metricas", "ERROR"):
+            acumulado.volcar()
+
+    def test_reiniciar_alcanza_a_los_workers_en_marcha(self):
+        worker = Acumulado()
+        worker.agregar("vista", 10.0, 1.0, 2, 0, False)
+        with override_settings(INSTRUMENTACION_DIR=self.directorio):
+            worker.volcar()
+            epoca_vieja = leer_epoca(self.directorio)
+            call_command("metricas_peticiones", "--reiniciar", stdout=StringIO())
+            self.assertEqual(leer_acumulados(self.directorio), {})
+
+            # Volcado que empezó antes del reinicio y termina después: no se suma
+            with open(os.path.join(self.directorio, "peticiones-1-1.json"), "w") as f:
+                json.dump({"pid": 1, "epoca": epoca_vieja, "urls": {"vista": {"peticiones": 5}}}, f)
+            # El worker ve la época nueva y descarta lo que traía
+            worker.volcar()
+            self.assertEqual(leer_acumulados(self.directorio), {})
+            worker.agregar("vista", 20.0, 1.0, 2, 0, False)
+            worker.volcar()
+        totales = leer_acumulados(self.directorio)
+        self.assertEqual((totales["vista"]["peticiones"], totales["vista"]["total_ms"]), (1, 20.0))
+
+
+class MedicionMemoriaTests(SimpleTestCase):
+    def setUp(self):
+        self.assertFalse(tracemalloc.is_tracing())
+        self.addCleanup(tracemalloc.stop)
+
+    def medir(self, medicion):
+        with medicion.activa(), medicion.etapa("lectura"):
+            datos = [bytes(1024) for _ in range(100)]
+        del datos
+        return medicion.resultado()
+
+    def test_apagada_por_defecto(self):
+        resultado = self.medir(MedicionEtapas())
+        self.assertNotIn("memoria_pico_kb", resultado)
+        self.assertEqual(resultado["etapas"][0]["memoria_pico_kb"], 0)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_mide_y_apaga_tracemalloc(self):
+        resultado = self.medir(MedicionEtapas(medir_memoria=True))
+        self.assertGreaterEqual(resultado["memoria_pico_kb"], 100)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_mediciones_simultaneas_comparten_tracemalloc(self):
+        primera, segunda = MedicionEtapas(medir_memoria=True), MedicionEtapas(medir_memoria=True)
+        with primera.activa():
+            with segunda.activa():
+                pass
+            # Terminó la segunda: la primera sigue midiendo
+            self.assertTrue(tracemalloc.is_tracing())
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_no_apaga_tracemalloc_ajeno(self):
+        tracemalloc.start()
+        self.medir(MedicionEtapas(medir_memoria=True))
+        self.assertTrue(tracemalloc.is_tracing())
+
+
+def parsear_prometheus(texto):
+    """Parser mínimo del formato de texto 0.0.4: {familia: {"tipo", "ayuda", "muestras"}}."""
+    muestra = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$")
+    etiqueta = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"(?:,|$)')
+    familias, familia = {}, None
+    for linea in texto.splitlines():
+        if linea.startswith("# HELP "):
+            familia, ayuda = linea[len("# HELP "):].split(" ", 1)
+            familias[familia] = {"ayuda": ayuda, "muestras": []}
+        elif linea.startswith("# TYPE "):
+            nombre, tipo = linea[len("# TYPE "):].split(" ")
+            familias[nombre]["tipo"] = tipo
+        else:
+            coincidencia = muestra.match(linea)
+            if coincidencia is None:
+                raise AssertionError(f"Línea inválida: {linea!r}")
+            nombre, crudas, valor = coincidencia.groups()
+            if familia is None or not nombre.startswith(familia):
+                raise AssertionError(f"Muestra {nombre} fuera de su familia")
+            pares = {
+                k: v.replace('\\"', '"').replace("\\n", "\n").replace("\\\\", "\\")
+                for k, v in etiqueta.findall(crudas or "")
+            }
+            familias[familia]["muestras"].append((nombre, pares, float(valor)))
+    return familias
+
+
+class MetricasPrometheusTests(SimpleTestCase):
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+
+    def test_texto_de_todos_los_procesos_se_parsea(self):
+        registro = Registro()
+        registro.incrementar("nuam_http_peticiones_total", vista='con "comillas"\ny salto', metodo="GET", estado=200)
+        registro.incrementar("nuam_http_peticiones_total", vista="dashboard", metodo="GET", estado=200)
+        for valor in (0.003, 0.2, 0.2, 99):
+            registro.observar("nuam_http_duracion_segundos", valor, vista="dashboard")
+        with override_settings(METRICAS_DIR=self.directorio, METRICAS_VOLCADO_SEGUNDOS=3600):
+            hilos = [threading.Thread(target=registro.volcar) for _ in range(8)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+        # Otro proceso ya volcó lo suyo
+        with open(os.path.join(self.directorio, "metricas-1-1.json"), "w", encoding="utf-8") as f:
+            json.dump(registro.estado(), f)
+        self.assertEqual([n for n in os.listdir(self.directorio) if n.endswith(".tmp")], [])
+
+        familias = parsear_prometheus(texto_prometheus(*leer_todos(self.directorio), [("nuam_cola", "Cola.", 3)]))
+
+        peticiones = familias["nuam_http_peticiones_total"]
+        self.assertEqual(peticiones["tipo"], "counter")
+        por_vista = {pares["vista"]: valor for _, pares, valor in peticiones["muestras"]}
+        self.assertEqual(por_vista, {'con "comillas"\ny salto': 2.0, "dashboard": 2.0})
+
+        duracion = familias["nuam_http_duracion_segundos"]
+        self.assertEqual(duracion["tipo"], "histogram")
+        buckets = [(pares["le"], valor) for nombre, pares, valor in duracion["muestras"] if nombre.endswith("_bucket")]
+        valores = [valor for _, valor in buckets]
+        self.assertEqual(valores, sorted(valores))
+        self.assertEqual(buckets[-1], ("+Inf", 8.0))
+        self.assertEqual(dict(buckets)["0.25"], 6.0)
+        resumen = {nombre: valor for nombre, _, valor in duracion["muestras"] if not nombre.endswith("_bucket")}
+        self.assertEqual(resumen["nuam_http_duracion_segundos_count"], 8.0)
+        self.assertAlmostEqual(resumen["nuam_http_duracion_segundos_sum"], 2 * 99.403)
+
+        self.assertEqual(familias["nuam_cola"]["tipo"], "gauge")
+        self.assertEqual(familias["nuam_cola"]["muestras"], [("nuam_cola", {}, 3.0)])
+
+    def archivo_de_proceso(self, pid, datos):
+        nombre = f"metricas-{metricas._HOST}-{pid}-1.json"
+        with open(os.path.join(self.directorio, nombre), "w", encoding="utf-8") as f:
+            json.dump(datos, f)
+        return nombre
+
+    @skipIf(metricas.fcntl is None, "sin fcntl no se compacta")
+    def test_procesos_terminados_pasan_al_acumulado(self):
+        muerto = subprocess.Popen([sys.executable, "-c", "pass"])
+        muerto.wait()
+        otro = Registro()
+        otro.incrementar("nuam_exportaciones_total", 2)
+        contador = otro.estado()
+        del_muerto = self.archivo_de_proceso(muerto.pid, contador)
+        del_vivo = self.archivo_de_proceso(os.getpid(), contador)
+        total = leer_todos(self.directorio)
+
+        self.assertEqual(compactar(self.directorio), 1)
+        self.assertEqual(leer_todos(self.directorio), total)
+        self.assertFalse(os.path.exists(os.path.join(self.directorio, del_muerto)))
+        self.assertTrue(os.path.exists(os.path.join(self.directorio, del_vivo)))
+        self.assertEqual(compactar(self.directorio), 0)
+
+        # Un comando que termina: deja sus totales en el acumulado, no un archivo
+        comando = Registro()
+        comando.incrementar("nuam_exportaciones_total", 3)
+        with override_settings(METRICAS_DIR=self.directorio, METRICAS_VOLCADO_SEGUNDOS=3600):
+            comando.volcar()
+            comando.cerrar()
+            comando.incrementar("nuam_exportaciones_total")  # otro atexit, después de cerrar
+            comando.volcar()
+        contadores, _ = leer_todos(self.directorio)
+        self.assertEqual(list(contadores.values()), [2 + 2 + 3 + 1])
+        self.assertEqual(sorted(os.listdir(self.directorio))[:2], [".lock", metricas.ARCHIVO_ACUMULADO])
+
+    @skipIf(metricas.fcntl is None, "sin fcntl no se compacta")
+    def test_caida_a_mitad_de_compactar_no_cuenta_doble(self):
+        nombre = self.archivo_de_proceso(os.getpid(), {"contadores": {"x": 5}, "histogramas": {}})
+        # El acumulado ya lo incorporó pero el archivo no alcanzó a borrarse
+        escribir_json(os.path.join(self.directorio, metricas.ARCHIVO_ACUMULADO),
+                      {"contadores": {"x": 5}, "histogramas": {}, "incorporados": [nombre]})
+        self.assertEqual(leer_todos(self.directorio)[0], {"x": 5})
+        compactar(self.directorio)
+        self.assertFalse(os.path.exists(os.path.join(self.directorio, nombre)))
+        self.assertEqual(leer_todos(self.directorio)[0], {"x": 5})
+
+
+@override_settings(INSTRUMENTACION_ACTIVA=False, METRICAS_DIR=None)
+class BufferBitacoraTests(TransactionTestCase):
+    """Con commits reales: TestCase envuelve todo en una transacción que nunca confirma."""
+
+    def peticion(self, vista):
+        return BitacoraMiddleware(vista)(RequestFactory().get("/"))
+
+    def acciones(self):
+        return set(Bitacora.objects.values_list("accion", flat=True))
+
+    def inserts(self, consultas):
+        return [c for c in consultas if c["sql"].startswith('INSERT INTO "tributaria_bitacora"')]
+
+    def test_un_insert_al_terminar_la_peticion(self):
+        def vista(request):
+            for accion in ("A", "B", "C"):
+                registrar_bitacora(None, accion, "Prueba")
+            self.assertEqual(self.acciones(), set())
+            return HttpResponse()
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.peticion(vista)
+        self.assertEqual(self.acciones(), {"A", "B", "C"})
+        self.assertEqual(len(self.inserts(consultas)), 1)
+
+    def test_commit_escribe_y_rollback_descarta(self):
+        def vista(request):
+            with transaction.atomic():
+                registrar_bitacora(None, "confirmada 1", "Prueba")
+                registrar_bitacora(None, "confirmada 2", "Prueba")
+            # Escritas al hacer commit, sin esperar el fin de la petición
+            self.assertEqual(self.acciones(), {"confirmada 1", "confirmada 2"})
+
+            with self.assertRaises(ValueError), transaction.atomic():
+                registrar_bitacora(None, "revertida", "Prueba")
+                raise ValueError
+            with transaction.atomic():
+                with self.assertRaises(ValueError), transaction.atomic():
+                    registrar_bitacora(None, "savepoint revertido", "Prueba")
+                    raise ValueError
+                registrar_bitacora(None, "confirmada 3", "Prueba")
+            return HttpResponse()
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.peticion(vista)
+        self.assertEqual(self.acciones(), {"confirmada 1", "confirmada 2", "confirmada 3"})
+        self.assertEqual(len(self.inserts(consultas)), 2)
+
+    def test_excepcion_en_la_vista_no_pierde_entradas(self):
+        def vista(request):
+            registrar_bitacora(None, "antes del error", "Prueba")
+            raise RuntimeError
+
+        with self.assertRaises(RuntimeError):
+            self.peticion(vista)
+        self.assertEqual(self.acciones(), {"antes del error"})
+
+    @override_settings(BITACORA_ESCRITURA_ASINCRONA=True)
+    def test_escritura_en_hilo_aparte(self):
+        def vista(request):
+            registrar_bitacora(None, "en hilo", "Prueba")
+            return HttpResponse()
+
+        self.peticion(vista)
+        # Un solo hilo: cuando termina esta tarea, terminó la escritura anterior
+        _obtener_executor().submit(int).result()
+        self.assertEqual(self.acciones(), {"en hilo"})
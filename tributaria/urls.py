@@ -1,6 +1,6 @@
 from django.urls import path, include
 from django.contrib.auth import views as auth_views
-from . import views
+from . import views, api
 
 urlpatterns = [
     path("dashboard/", views.dashboard, name="dashboard"),
@@ -11,6 +11,14 @@ urlpatterns = [
     path("calificaciones/", views.listar_calificaciones, name="listar_calificaciones"),
     path("calificaciones/<int:pk>/editar/", views.editar_calificacion, name="editar_calificacion"),
     path("calificaciones/<int:pk>/eliminar/", views.eliminar_calificacion, name="eliminar_calificacion"),
+    path("calificaciones/cambiar-estado/", views.cambiar_estado_calificaciones, name="cambiar_estado_calificaciones"),
+    path("exportaciones/<int:pk>/descargar/", views.descargar_exportacion, name="descargar_exportacion"),
+
+    # Reglas de validación de la carga masiva
+    path("reglas-validacion/", views.listar_reglas, name="listar_reglas"),
+    path("reglas-validacion/nueva/", views.crear_regla, name="crear_regla"),
+    path("reglas-validacion/<int:pk>/editar/", views.editar_regla, name="editar_regla"),
+    path("reglas-validacion/<int:pk>/eliminar/", views.eliminar_regla, name="eliminar_regla"),
 
     # Errores de validación
     path("errores-validacion/", views.errores_validacion, name="errores_validacion"),
@@ -21,10 +29,12 @@ urlpatterns = [
 
     # Notificaciones
     path("notificaciones/", views.ver_notificaciones, name="ver_notificaciones"),
+    path("notificaciones/marcar-leidas/", views.marcar_notificaciones_leidas, name="marcar_notificaciones_leidas"),
 
     # Reportes
     path("reportes/", views.reporte_calificaciones, name="reporte_calificaciones"),
     path("reportes/consolidado/", views.reporte_consolidado, name="reporte_consolidado"),
+    path("reportes/resumen/", views.reporte_resumen, name="reporte_resumen"),
     path(
         "reportes/informe-gestion/",
         views.informe_gestion_pdf,
@@ -37,4 +47,14 @@ urlpatterns = [
     # PDF
     path("subir-pdf/", views.subir_pdf, name="subir_pdf"),
     path("pdfs/", views.listar_pdfs, name="listar_pdfs"),
+
+    # Eventos en vivo (SSE)
+    path("eventos/archivos/<int:id_archivo>/", views.eventos_archivo, name="eventos_archivo"),
+    path("eventos/notificaciones/", views.eventos_notificaciones, name="eventos_notificaciones"),
+
+    # API JSON (solo lectura)
+    path("api/calificaciones/", api.api_calificaciones, name="api_calificaciones"),
+    path("api/calificaciones/cambios/", api.api_cambios_calificaciones, name="api_cambios_calificaciones"),
+    path("api/emisores/", api.api_emisores, name="api_emisores"),
+    path("api/archivos/", api.api_archivos, name="api_archivos"),
 ]
@@ -0,0 +1,62 @@
+"""
+Versión de datos por entidad.
+
+Cada entidad ("calificaciones", "emisores", ...) tiene una versión en la
+caché que cambia cuando sus registros cambian (ver signals.py). Los
+resultados cacheados incluyen ese número en su clave, así que al cambiar
+los datos quedan obsoletos sin tener que borrarlos uno por uno.
+
+La versión es un número nuevo (time_ns) en cada invalidación, no un
+contador: si la caché expulsa la clave, la versión que se siembra no
+repite una anterior cuyos resultados aún puedan estar guardados.
+
+La caché tiene que ser compartida por todos los workers (checks.py): con
+una caché por proceso, una invalidación no llega a los demás.
+
+La versión cambia al confirmarse la transacción que modificó los datos, no
+antes: si cambiara dentro de ella, otro worker podría leer la versión nueva,
+calcular con los datos aún sin confirmar (los viejos) y guardar ese
+resultado bajo la versión nueva. Si la transacción hace rollback, no cambia.
+"""
+import threading
+import time
+from functools import partial
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+_lock = threading.Lock()
+_ultima = 0
+
+
+def _clave(entidad):
+    return f"tributaria:version:{entidad}"
+
+
+def nueva_version():
+    """Número que no se repite: hora en ns, creciente dentro del proceso."""
+    global _ultima
+    with _lock:
+        _ultima = max(time.time_ns(), _ultima + 1)
+        return _ultima
+
+
+def obtener_version(entidad):
+    """Versión actual de la entidad."""
+    return cache.get_or_set(_clave(entidad), nueva_version, None)
+
+
+def _cambiar_versiones(entidades):
+    for entidad in entidades:
+        cache.set(_clave(entidad), nueva_version(), None)
+
+
+def invalidar(*entidades):
+    """
+    Cambia la versión de las entidades indicadas al hacer commit de la
+    transacción en curso (de inmediato si no hay una).
+    """
+    # robust: si la caché falla, los datos ya están confirmados; se registra
+    # y siguen los demás on_commit
+    transaction.on_commit(partial(_cambiar_versiones, entidades), robust=True)
@@ -1,21 +1,24 @@
 import os
-import io
-import re
-import pandas as pd
+import csv
+from datetime import date, timedelta
 from decimal import Decimal
-from PyPDF2 import PdfReader
+from urllib.parse import urlencode
 
 from django import forms
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db import transaction
-from django.http import HttpResponse
-from django.template.loader import get_template
-from django.db.models import Sum, Avg, Count, Q
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.contrib.auth.views import redirect_to_login
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from django.db.models import Sum, Avg, Count
 from django.utils import timezone
 
-from cuentas.models import Usuario, Rol
+from config.routers import leer_de_replica, usar_primaria
+from cuentas.roles import rol_nombre
 
 # ---------------------------------------------------
 # Import seguro de decorators (para evitar que runserver muera si faltan)
@@ -48,23 +51,31 @@ except Exception:
         return decorator
 
 
-# ---------------------------------------------------
-# Import seguro de xhtml2pdf (Render fallaba por ModuleNotFoundError)
-# ---------------------------------------------------
-try:
-    from xhtml2pdf import pisa
-except Exception:
-    pisa = None
-
-from .forms import DocumentoPDFForm, CalificacionForm, FiltroCalificacionForm
+from .forms import DocumentoPDFForm, CalificacionForm, FiltroCalificacionForm, FiltroBitacoraForm, ReglaValidacionForm
+from .resumen import ConsultaInvalida, normalizar_consulta, ejecutar_resumen, columnas
+from .exportaciones import aplicar_filtros, exportar_calificaciones_excel, solicitar_exportacion
+# pandas, PyPDF2 y xhtml2pdf se importan dentro de estos módulos, al usarse
+from .ingesta import EXT_PERMITIDAS, procesar_archivo_tributario
+from .emisores import obtener_o_crear as obtener_o_crear_emisor
+from .estados import TRANSICIONES, cambiar_estado
+from .factores import EXPONENTE_FACTOR, EXPONENTE_MONTO, calcular_monto_calificado, cuantizar
+from .reglas import mensaje_por_defecto
+from .extraccion_pdf import extraer_datos_desde_pdf
+from .informes import contexto_informe_gestion, renderizar_pdf, xhtml2pdf_disponible
+from .condicional import respuesta_condicional
+from .auditoria import registrar_bitacora, filtrar_bitacora, pagina_bitacora, iterar_bitacora
+from .notificaciones import marcar_todas_leidas
+from .paginacion import inicio_dia, pagina_keyset
+from .eventos import canal_archivo, canal_usuario, flujo_sse, obtener_bus
 from .models import (
     ArchivoTributario,
     CalificacionTributaria,
     Bitacora,
-    Emisor,
     ErrorValidacion,
     Notificacion,
     DocumentoPDF,
+    ExportacionCalificaciones,
+    ReglaValidacion,
 )
 
 
@@ -95,18 +106,8 @@ def a_decimal(valor):
         return None
 
 
-def registrar_bitacora(usuario, accion, entidad, id_registro=None, detalle=""):
-    Bitacora.objects.create(
-        usuario=usuario,
-        accion=accion,
-        entidad=entidad,
-        id_registro=id_registro,
-        detalle=detalle,
-    )
-
-
-def notificar(usuario, mensaje, nivel="INFO"):
-    Notificacion.objects.create(usuario=usuario, mensaje=mensaje, nivel=nivel)
+def notificar(usuario, mensaje, nivel="INFO", enlace=""):
+    Notificacion.objects.create(usuario=usuario, mensaje=mensaje, nivel=nivel, enlace=enlace)
 
 
 # ===================================================
@@ -124,32 +125,16 @@ class ArchivoTributarioForm(forms.ModelForm):
 # ===================================================
 
 @login_required
+@leer_de_replica
 @solo_admin
 def informe_gestion_pdf(request):
-    if pisa is None:
+    if not xhtml2pdf_disponible():
         messages.error(request, "Falta instalar xhtml2pdf para generar PDFs en el servidor.")
         return redirect("subir_archivo")
 
-    template = get_template("reportes/informe_gestion.html")
-
-    # Conteos/estadísticas (ajusta estados si tus choices son distintos)
-    qs = CalificacionTributaria.objects.all()
-    context = {
-        "usuarios_total": Usuario.objects.count(),
-        "usuarios_por_rol": Rol.objects.all(),
-        "calificaciones_total": qs.count(),
-        "monto_total": qs.aggregate(total=Sum("monto")).get("total") or 0,
-        "pendientes": qs.filter(estado="PENDIENTE").count(),
-        "validadas": qs.filter(estado="VALIDADA").count(),
-        "archivos": ArchivoTributario.objects.count(),
-        "pdfs": DocumentoPDF.objects.count(),
-        "usuario": request.user,
-        "fecha": timezone.now(),
-    }
-
     response = HttpResponse(content_type="application/pdf")
     response["Content-Disposition"] = 'attachment; filename="informe_gestion_nuam.pdf"'
-    pisa.CreatePDF(template.render(context), dest=response)
+    renderizar_pdf("reportes/informe_gestion.html", contexto_informe_gestion(request.user), response)
     return response
 
 
@@ -158,6 +143,8 @@ def informe_gestion_pdf(request):
 # ===================================================
 
 @login_required
+@leer_de_replica
+@respuesta_condicional("calificaciones")
 def reporte_calificaciones(request):
     desde = request.GET.get("desde")
     hasta = request.GET.get("hasta")
@@ -203,7 +190,7 @@ def reporte_calificaciones(request):
 
 @login_required
 def ver_notificaciones(request):
-    notificaciones = Notificacion.objects.all().order_by("-fecha")
+    notificaciones = Notificacion.objects.all()
 
     nivel = request.GET.get("nivel")
     if nivel:
@@ -211,190 +198,48 @@ def ver_notificaciones(request):
 
     desde = request.GET.get("desde")
     hasta = request.GET.get("hasta")
-    if desde:
-        notificaciones = notificaciones.filter(fecha__date__gte=desde)
-    if hasta:
-        notificaciones = notificaciones.filter(fecha__date__lte=hasta)
+    try:
+        if desde:
+            notificaciones = notificaciones.filter(fecha__gte=inicio_dia(date.fromisoformat(desde)))
+        if hasta:
+            notificaciones = notificaciones.filter(fecha__lt=inicio_dia(date.fromisoformat(hasta) + timedelta(days=1)))
+    except ValueError:
+        messages.error(request, "Fecha inválida (formato AAAA-MM-DD).")
 
     # Si no es admin, solo ve las suyas
     if not getattr(request.user, "is_superuser", False):
-        notificaciones = notificaciones.filter(Q(usuario=request.user) | Q(usuario__isnull=True))
+        notificaciones = notificaciones.filter(usuario=request.user)
 
-    return render(
-        request,
-        "tributaria/notificaciones.html",
-        {"notificaciones": notificaciones, "filtros": {"nivel": nivel or "", "desde": desde or "", "hasta": hasta or ""}},
+    pagina, siguiente = pagina_keyset(
+        notificaciones,
+        ["id", "fecha", "nivel", "mensaje", "enlace", "leida"],
+        request.GET.get("cursor"),
+        tamano=50,
     )
 
+    params = request.GET.copy()
+    params.pop("cursor", None)
 
-# ===================================================
-# Exportar Excel
-# ===================================================
-
-def exportar_calificaciones_excel(qs):
-    filas = []
-    for c in qs.select_related("emisor"):
-        filas.append(
-            {
-                "ID": c.id,
-                "Emisor": str(c.emisor) if c.emisor else "",
-                "Corredor": str(c.corredor),
-                "Año tributario": c.anio_tributario,
-                "Monto": float(c.monto),
-                "Factor": float(c.factor),
-                "Monto calificado": float(c.monto_calificado),
-                "Estado": c.estado,
-                "Fuente": getattr(c, "fuente", ""),
-            }
-        )
-
-    df = pd.DataFrame(filas)
-    buffer = io.BytesIO()
-    with pd.ExcelWriter(buffer) as writer:
-        df.to_excel(writer, sheet_name="Calificaciones", index=False)
-
-    buffer.seek(0)
-    response = HttpResponse(
-        buffer,
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    return render(
+        request,
+        "tributaria/notificaciones.html",
+        {
+            "notificaciones": pagina,
+            "siguiente": siguiente,
+            "es_primera_pagina": not request.GET.get("cursor"),
+            "eventos_en_vivo": settings.EVENTOS_ASGI,
+            "params": params.urlencode(),
+            "filtros": {"nivel": nivel or "", "desde": desde or "", "hasta": hasta or ""},
+        },
     )
-    response["Content-Disposition"] = 'attachment; filename="calificaciones.xlsx"'
-    return response
-
 
-# ===================================================
-# Procesar Excel/CSV (lo importante: NO crear calificaciones si el archivo no corresponde)
-# ===================================================
-
-EXT_PERMITIDAS = {".csv", ".xlsx", ".xls"}
-
-# Columnas obligatorias del formato NUAM esperado
-COLUMNAS_REQUERIDAS = {
-    "rut_contribuyente",
-    "nombre_contribuyente",
-    "rut_emisor",
-    "nombre_emisor",
-    "monto_bruto",
-    "factor",
-    "anio_tributario",
-}
-
-def _normalizar_columnas(df: pd.DataFrame) -> pd.DataFrame:
-    mapping = {}
-    for col in df.columns:
-        clave = str(col).strip().lower().replace(" ", "_")
-        mapping[col] = clave
-    return df.rename(columns=mapping)
-
-
-@transaction.atomic
-def procesar_archivo_tributario(archivo_obj, usuario):
-    """
-    Retorna: (ok:int, fail:int, archivo_valido:bool)
-    - archivo_valido=False significa: el archivo NO corresponde al formato esperado (por columnas)
-    - en ese caso NO se crean calificaciones.
-    """
-    ruta = archivo_obj.archivo.path
-    extension = os.path.splitext(ruta)[1].lower()
-
-    # 1) Leer archivo
-    try:
-        if extension == ".csv":
-            df = pd.read_csv(ruta)
-        elif extension == ".xlsx":
-            df = pd.read_excel(ruta, engine="openpyxl")
-        elif extension == ".xls":
-            df = pd.read_excel(ruta)  # xlrd solo si está instalado
-        else:
-            # no debería llegar por validación previa
-            raise Exception(f"Formato no soportado: {extension}")
-    except Exception as e:
-        raise Exception(f"No se pudo leer el archivo. Error: {e}")
-
-    df = _normalizar_columnas(df)
-
-    # 2) Validar columnas (SI FALLA -> archivo inválido, registrar ErrorValidacion y salir sin crear calificaciones)
-    faltantes = sorted(list(COLUMNAS_REQUERIDAS - set(df.columns)))
-    if faltantes:
-        ErrorValidacion.objects.filter(archivo=archivo_obj).delete()
-        ErrorValidacion.objects.create(
-            archivo=archivo_obj,
-            nro_linea=1,
-            mensaje=f"Archivo inválido: faltan columnas obligatorias: {', '.join(faltantes)}",
-        )
-        return 0, 0, False
-
-    # 3) Procesar filas (aquí sí se crean calificaciones SOLO para filas válidas)
-    ok = 0
-    fail = 0
-
-    ErrorValidacion.objects.filter(archivo=archivo_obj).delete()
-
-    for index, row in df.iterrows():
-        nro_linea = index + 2
-        errores = []
-
-        # obligatorios texto
-        for campo in ["rut_contribuyente", "nombre_contribuyente", "rut_emisor", "nombre_emisor"]:
-            if pd.isna(row.get(campo)) or str(row.get(campo)).strip() == "":
-                errores.append(f"{campo} es obligatorio")
-
-        # monto
-        monto = None
-        try:
-            monto = float(row.get("monto_bruto"))
-            if monto <= 0:
-                errores.append("monto_bruto debe ser mayor a 0")
-        except Exception:
-            errores.append("monto_bruto no es numérico")
-
-        # factor
-        factor = None
-        try:
-            factor = float(row.get("factor"))
-            if factor <= 0:
-                errores.append("factor debe ser mayor a 0")
-        except Exception:
-            errores.append("factor no es numérico")
-
-        # año
-        anio = None
-        try:
-            anio = int(row.get("anio_tributario"))
-            if anio < 2000 or anio > 2100:
-                errores.append("anio_tributario fuera de rango (2000-2100)")
-        except Exception:
-            errores.append("anio_tributario inválido")
-
-        if errores:
-            fail += 1
-            for e in errores:
-                ErrorValidacion.objects.create(archivo=archivo_obj, nro_linea=nro_linea, mensaje=e)
-            continue
-
-        # Emisor
-        emisor, _ = Emisor.objects.get_or_create(
-            rut=str(row.get("rut_emisor")).strip(),
-            defaults={"nombre": str(row.get("nombre_emisor")).strip()},
-        )
-
-        # IMPORTANTE: tu modelo tiene corredor como CharField, así que guardamos username
-        corredor_txt = getattr(usuario, "username", str(usuario))
-
-        CalificacionTributaria.objects.create(
-            emisor=emisor,
-            anio_tributario=anio,
-            monto=monto,
-            factor=factor,
-            monto_calificado=round(monto * factor, 2),
-            corredor=corredor_txt,
-            estado="PENDIENTE",
-            fuente="EXCEL/CSV",
-        )
-
-        ok += 1
 
-    return ok, fail, True
+@login_required
+def marcar_notificaciones_leidas(request):
+    if request.method == "POST":
+        marcadas = marcar_todas_leidas(request.user)
+        messages.success(request, f"{marcadas} notificación(es) marcadas como leídas.")
+    return redirect("ver_notificaciones")
 
 
 # ===================================================
@@ -402,14 +247,16 @@ def procesar_archivo_tributario(archivo_obj, usuario):
 # ===================================================
 
 @login_required
+@leer_de_replica
 @rol_requerido("Gerente", "Administrador")
+@respuesta_condicional("calificaciones", "archivos", "pdfs", "errores", "bitacora")
 def dashboard(request):
     context = {
         "total_calificaciones": CalificacionTributaria.objects.count(),
         "total_archivos": ArchivoTributario.objects.count(),
         "total_pdfs": DocumentoPDF.objects.count(),
         "total_errores": ErrorValidacion.objects.count(),
-        "ultimas_acciones": Bitacora.objects.order_by("-fecha")[:8],
+        "ultimas_acciones": Bitacora.objects.select_related("usuario__rol").order_by("-fecha")[:8],
     }
     return render(request, "tributaria/dashboard.html", context)
 
@@ -443,6 +290,8 @@ def subir_archivo(request):
 
             try:
                 ok, fail, valido = procesar_archivo_tributario(archivo_obj, request.user)
+                # El estado final ya queda en BD; el bus no necesita recordarlo
+                obtener_bus().olvidar(canal_archivo(archivo_obj.id))
 
                 if not valido:
                     # Archivo no corresponde al formato: NO se crean calificaciones
@@ -456,7 +305,7 @@ def subir_archivo(request):
                         nivel="ERROR",
                     )
                     messages.error(request, "El archivo NO corresponde al formato NUAM esperado. No se registró nada.")
-                    return redirect("errores_validacion", id_archivo=archivo_obj.id)
+                    return redirect("errores_validacion_por_archivo", id_archivo=archivo_obj.id)
 
                 # Válido pero con filas erróneas
                 if fail > 0:
@@ -465,7 +314,7 @@ def subir_archivo(request):
                     archivo_obj.save(update_fields=["estado", "mensaje_estado"])
                     notificar(request.user, f"Archivo #{archivo_obj.id} procesado con errores. OK={ok}, errores={fail}.", nivel="WARNING")
                     messages.warning(request, f"Archivo procesado con errores. OK={ok} | Errores={fail}")
-                    return redirect("errores_validacion", id_archivo=archivo_obj.id)
+                    return redirect("errores_validacion_por_archivo", id_archivo=archivo_obj.id)
 
                 # Todo OK
                 archivo_obj.estado = "PROCESADO"
@@ -493,27 +342,80 @@ def subir_archivo(request):
 # ===================================================
 
 @login_required
+@leer_de_replica
 @rol_requerido("Corredor", "Analista", "Administrador", "Auditor", "Gerente")
 def listar_calificaciones(request):
     form = FiltroCalificacionForm(request.GET or None)
-    calificaciones = CalificacionTributaria.objects.all()
-
-    if form.is_valid():
-        if form.cleaned_data.get("anio_tributario"):
-            calificaciones = calificaciones.filter(anio_tributario=form.cleaned_data["anio_tributario"])
-        if form.cleaned_data.get("corredor"):
-            calificaciones = calificaciones.filter(corredor__icontains=form.cleaned_data["corredor"])
-        if form.cleaned_data.get("emisor"):
-            calificaciones = calificaciones.filter(emisor__nombre__icontains=form.cleaned_data["emisor"])
-        if form.cleaned_data.get("estado"):
-            calificaciones = calificaciones.filter(estado=form.cleaned_data["estado"])
-
-    if request.GET.get("export") == "excel":
+    calificaciones = CalificacionTributaria.objects.select_related("emisor")
+    filtros = form.cleaned_data if form.is_valid() else {}
+    calificaciones = aplicar_filtros(calificaciones, filtros)
+
+    export = request.GET.get("export")
+    if export == "excel" and calificaciones.count() > settings.EXPORTACION_MAX_SINCRONA:
+        # Demasiadas filas para generarlas dentro de la petición
+        export = "segundo_plano"
+
+    if export == "segundo_plano":
+        exportacion = solicitar_exportacion(request.user, filtros)
+        messages.info(
+            request,
+            f"Exportación #{exportacion.id} en cola. Te avisaremos en Notificaciones cuando esté lista.",
+        )
+        params = request.GET.copy()
+        params.pop("export", None)
+        return redirect(f"{reverse('listar_calificaciones')}?{params.urlencode()}")
+
+    if export == "excel":
         return exportar_calificaciones_excel(calificaciones)
 
     return render(request, "tributaria/listar_calificaciones.html", {"form": form, "calificaciones": calificaciones})
 
 
+@login_required
+@rol_requerido("Corredor", "Analista", "Administrador", "Auditor", "Gerente")
+def descargar_exportacion(request, pk):
+    exportaciones = ExportacionCalificaciones.objects.filter(estado="LISTA")
+    # Cada uno descarga las suyas; el Administrador, cualquiera
+    if not (request.user.is_superuser or rol_nombre(request) == "Administrador"):
+        exportaciones = exportaciones.filter(usuario=request.user)
+    exportacion = get_object_or_404(exportaciones, pk=pk)
+    if not exportacion.archivo:
+        raise Http404("La exportación no tiene archivo.")
+    return FileResponse(
+        exportacion.archivo.open("rb"),
+        as_attachment=True,
+        filename=f"calificaciones_{exportacion.id}.xlsx",
+    )
+
+
+@login_required
+@rol_requerido("Administrador", "Analista")
+def cambiar_estado_calificaciones(request):
+    """Valida, publica o rechaza todas las calificaciones del filtro actual del listado."""
+    form = FiltroCalificacionForm(request.POST or None)
+    accion = request.POST.get("accion")
+    params = {k: v for k, v in request.POST.items() if k in form.fields and v}
+    volver = f"{reverse('listar_calificaciones')}?{urlencode(params)}"
+    if request.method != "POST" or accion not in TRANSICIONES or not form.is_valid():
+        messages.error(request, "Acción o filtros no válidos.")
+        return redirect(volver)
+
+    qs = aplicar_filtros(CalificacionTributaria.objects.all(), form.cleaned_data)
+    resultado = cambiar_estado(qs, accion, request.user, lote=settings.CAMBIO_ESTADO_LOTE)
+    transicion = TRANSICIONES[accion]
+    registrar_bitacora(
+        request.user,
+        f"{transicion.verbo} calificaciones (masivo)",
+        "CalificacionTributaria",
+        detalle=f"{resultado.cambiadas} -> {transicion.destino}; filtros: {params or 'ninguno'}",
+    )
+    texto = f"{resultado.cambiadas} calificaciones pasaron a {transicion.destino}."
+    if resultado.omitidas:
+        texto += f" {resultado.omitidas} ya habían cambiado de estado y no se tocaron."
+    messages.success(request, texto)
+    return redirect(volver)
+
+
 # ===================================================
 # CRUD calificaciones
 # ===================================================
@@ -561,15 +463,109 @@ def eliminar_calificacion(request, pk):
     return render(request, "tributaria/confirmar_eliminar.html", {"calificacion": calif})
 
 
+# ===================================================
+# Reglas de validación (carga masiva)
+# ===================================================
+
+@login_required
+@rol_requerido("Administrador", "Analista")
+def listar_reglas(request):
+    reglas = [
+        {"regla": regla, "mensaje": regla.mensaje or mensaje_por_defecto(regla)}
+        for regla in ReglaValidacion.objects.all()
+    ]
+    return render(request, "tributaria/reglas_validacion.html", {"reglas": reglas})
+
+
+def _guardar_regla(request, form, accion):
+    regla = form.save(commit=False)
+    regla.usuario_modificacion = request.user
+    regla.save()
+    registrar_bitacora(request.user, accion, "ReglaValidacion", regla.id, detalle=mensaje_por_defecto(regla))
+    messages.success(request, f"Regla \"{regla.nombre}\" guardada. Se aplica desde la próxima carga.")
+    return redirect("listar_reglas")
+
+
+@login_required
+@rol_requerido("Administrador", "Analista")
+def crear_regla(request):
+    form = ReglaValidacionForm(request.POST or None)
+    if request.method == "POST" and form.is_valid():
+        return _guardar_regla(request, form, "Crear regla de validación")
+    return render(request, "tributaria/editar_regla.html", {"form": form, "titulo": "Nueva regla de validación"})
+
+
+@login_required
+@rol_requerido("Administrador", "Analista")
+def editar_regla(request, pk):
+    regla = get_object_or_404(ReglaValidacion, pk=pk)
+    form = ReglaValidacionForm(request.POST or None, instance=regla)
+    if request.method == "POST" and form.is_valid():
+        return _guardar_regla(request, form, "Editar regla de validación")
+    return render(request, "tributaria/editar_regla.html", {"form": form, "titulo": "Editar regla de validación"})
+
+
+@login_required
+@rol_requerido("Administrador", "Analista")
+def eliminar_regla(request, pk):
+    regla = get_object_or_404(ReglaValidacion, pk=pk)
+    if request.method == "POST":
+        registrar_bitacora(request.user, "Eliminar regla de validación", "ReglaValidacion", regla.id, detalle=regla.nombre)
+        regla.delete()
+        return redirect("listar_reglas")
+
+    return render(request, "tributaria/confirmar_eliminar_regla.html", {"regla": regla})
+
+
 # ===================================================
 # Bitácora
 # ===================================================
 
 @login_required
+@leer_de_replica
 @rol_requerido("Administrador", "Auditor")
+@respuesta_condicional("bitacora")
 def ver_bitacora(request):
-    registros = Bitacora.objects.order_by("-fecha")[:200]
-    return render(request, "tributaria/ver_bitacora.html", {"registros": registros})
+    form = FiltroBitacoraForm(request.GET or None)
+    filtros = form.cleaned_data if form.is_valid() else {}
+    qs = filtrar_bitacora(Bitacora.objects.all(), filtros)
+
+    if request.GET.get("export") == "csv":
+        writer = csv.writer(_Eco())
+
+        def generar():
+            yield writer.writerow(["Fecha", "Usuario", "Acción", "Entidad", "ID registro", "Detalle"])
+            for r in iterar_bitacora(qs):
+                yield writer.writerow([
+                    timezone.localtime(r["fecha"]).strftime("%Y-%m-%d %H:%M:%S"),
+                    r["usuario__username"] or "",
+                    r["accion"],
+                    r["entidad"],
+                    r["id_registro"] if r["id_registro"] is not None else "",
+                    r["detalle"],
+                ])
+
+        response = StreamingHttpResponse(generar(), content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = 'attachment; filename="bitacora.csv"'
+        return response
+
+    registros, siguiente = pagina_bitacora(qs, request.GET.get("cursor"))
+
+    params = request.GET.copy()
+    params.pop("cursor", None)
+    params.pop("export", None)
+
+    return render(
+        request,
+        "tributaria/ver_bitacora.html",
+        {
+            "form": form,
+            "registros": registros,
+            "siguiente": siguiente,
+            "es_primera_pagina": not request.GET.get("cursor"),
+            "params": params.urlencode(),
+        },
+    )
 
 
 # ===================================================
@@ -577,13 +573,18 @@ def ver_bitacora(request):
 # ===================================================
 
 @login_required
+@usar_primaria  # se llega recién terminada la carga: sus errores se acaban de escribir
 @rol_requerido("Analista", "Administrador", "Auditor")
 def errores_validacion(request, id_archivo=None):
     qs = ErrorValidacion.objects.select_related("archivo").order_by("archivo_id", "nro_linea")
     if id_archivo is not None:
         qs = qs.filter(archivo_id=id_archivo)
 
-    return render(request, "tributaria/errores_validacion.html", {"errores": qs})
+    return render(
+        request,
+        "tributaria/errores_validacion.html",
+        {"errores": qs, "id_archivo": id_archivo, "eventos_en_vivo": settings.EVENTOS_ASGI},
+    )
 
 
 # ===================================================
@@ -591,7 +592,9 @@ def errores_validacion(request, id_archivo=None):
 # ===================================================
 
 @login_required
+@leer_de_replica
 @rol_requerido("Gerente", "Administrador", "Auditor")
+@respuesta_condicional("calificaciones")
 def reporte_consolidado(request):
     resumen_por_anio = (
         CalificacionTributaria.objects.values("anio_tributario")
@@ -606,26 +609,48 @@ def reporte_consolidado(request):
 
 
 # ===================================================
-# PDF: extracción y subida (IMPORTANTE: no crear calificación si faltan datos)
+# Resumen multidimensional (JSON / CSV)
 # ===================================================
 
-def extraer_datos_desde_pdf(ruta_pdf):
-    reader = PdfReader(ruta_pdf)
-    texto = "\n".join((page.extract_text() or "") for page in reader.pages)
+class _Eco:
+    """Buffer mínimo para que csv.writer devuelva la línea escrita."""
+    def write(self, valor):
+        return valor
 
-    def buscar(patron):
-        m = re.search(patron, texto, re.IGNORECASE | re.DOTALL)
-        return m.group(1).strip() if m else None
 
-    datos = {
-        "rut_emisor": buscar(r"RUT\s+Emisor\s+([\d\.\-Kk]+)"),
-        "nombre_emisor": buscar(r"Nombre\s+Emisor\s+([^\n]+)"),
-        "anio_tributario": buscar(r"Año\s+Tributario\s+([0-9]{4})"),
-        "monto_bruto": buscar(r"Monto\s+Bruto\s+\$?([\d\.\,]+)"),
-        "factor": buscar(r"Factor\s+([\d\.\,]+)"),
-    }
-    return datos
+@login_required
+@leer_de_replica
+@rol_requerido("Gerente", "Administrador", "Auditor")
+def reporte_resumen(request):
+    """
+    Ej: /reportes/resumen/?dimensiones=emisor,anio&medidas=suma_monto,cantidad&estado=VALIDADA&formato=csv
+    """
+    try:
+        consulta = normalizar_consulta(request.GET)
+        filas = ejecutar_resumen(consulta)
+    except ConsultaInvalida as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    cols = columnas(consulta)
+
+    if request.GET.get("formato") == "csv":
+        writer = csv.writer(_Eco())
+
+        def generar():
+            yield writer.writerow(cols)
+            for fila in filas:
+                yield writer.writerow([fila.get(c) for c in cols])
 
+        response = StreamingHttpResponse(generar(), content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = 'attachment; filename="resumen_calificaciones.csv"'
+        return response
+
+    return JsonResponse({"consulta": consulta, "columnas": cols, "filas": filas})
+
+
+# ===================================================
+# PDF: subida (IMPORTANTE: no crear calificación si faltan datos)
+# ===================================================
 
 @login_required
 @rol_requerido("Corredor", "Analista", "Administrador")
@@ -677,14 +702,11 @@ def subir_pdf(request):
                 return redirect("subir_pdf")
 
             # Crear emisor + calificación
-            emisor, _ = Emisor.objects.get_or_create(
-                rut=doc.rut_emisor,
-                defaults={"nombre": doc.nombre_emisor},
-            )
+            emisor, _ = obtener_o_crear_emisor(doc.rut_emisor, doc.nombre_emisor)
 
             corredor_txt = getattr(request.user, "username", str(request.user))
-            monto = float(doc.monto_bruto)
-            factor = float(doc.factor)
+            monto = cuantizar(doc.monto_bruto, EXPONENTE_MONTO)
+            factor = cuantizar(doc.factor, EXPONENTE_FACTOR)
 
             calif = CalificacionTributaria.objects.create(
                 emisor=emisor,
@@ -692,7 +714,7 @@ def subir_pdf(request):
                 anio_tributario=doc.anio_tributario,
                 monto=monto,
                 factor=factor,
-                monto_calificado=round(monto * factor, 2),
+                monto_calificado=calcular_monto_calificado(monto, factor),
                 estado="PENDIENTE",
                 fuente="PDF",
             )
@@ -718,3 +740,58 @@ def subir_pdf(request):
 def listar_pdfs(request):
     docs = DocumentoPDF.objects.filter(usuario=request.user).order_by("-fecha_subida")
     return render(request, "tributaria/listar_pdfs.html", {"docs": docs})
+
+
+# ===================================================
+# Eventos en vivo (SSE, requiere servidor ASGI)
+# ===================================================
+# Bajo WSGI un stream infinito ocuparía un worker por pestaña abierta: se
+# responde 204, con lo que el EventSource del navegador deja de reconectar.
+
+def _respuesta_sse(flujo):
+    response = StreamingHttpResponse(flujo, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx: no acumular el stream
+    return response
+
+
+async def eventos_archivo(request, id_archivo):
+    """Progreso de carga: filas procesadas y errores hasta el momento."""
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    archivo = await ArchivoTributario.objects.filter(pk=id_archivo).afirst()
+    if archivo is None:
+        raise Http404("Archivo no encontrado.")
+
+    rol = await sync_to_async(rol_nombre)(request)
+    if archivo.usuario_id != user.pk and rol not in ("Analista", "Administrador", "Auditor"):
+        return HttpResponse("No tienes permisos para ver este archivo.", status=403)
+
+    canal = canal_archivo(archivo.id)
+
+    async def estado_inicial():
+        ultimo = obtener_bus().ultimo(canal)
+        if ultimo is not None:
+            return ultimo["tipo"], ultimo["datos"]
+
+        actual = await ArchivoTributario.objects.filter(pk=archivo.id).values("estado", "mensaje_estado").afirst()
+        errores = await ErrorValidacion.objects.filter(archivo_id=archivo.id).values("nro_linea").distinct().acount()
+        datos = {"archivo": archivo.id, "estado": actual["estado"], "mensaje": actual["mensaje_estado"], "errores": errores}
+        return ("progreso" if actual["estado"] == "PENDIENTE" else "fin"), datos
+
+    return _respuesta_sse(flujo_sse(canal, estado_inicial))
+
+
+async def eventos_notificaciones(request):
+    """Notificaciones nuevas del usuario logeado."""
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    return _respuesta_sse(flujo_sse(canal_usuario(user.pk), terminar_con=()))